@@ -1,6 +1,19 @@
+import argparse
+import hashlib
 import json
 import requests
 import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from provider.catalog.snapshot import atomic_write, snapshot_path_for, write_snapshot
+
+LITELLM_MODELS_URL = "https://raw.githubusercontent.com/BerriAI/litellm/main/model_prices_and_context_window.json"
+BASE_FILE_PATH = os.path.join("src", "provider", "generate", "data")
 
 
 def read_json_file(filepath: str) -> dict:
@@ -8,19 +21,68 @@ def read_json_file(filepath: str) -> dict:
         return json.load(f)
 
 
-def write_json_file(filepath: str, data: dict) -> None:
-    with open(filepath, "w") as f:
-        json.dump(data, f, indent=4)
+def write_json_file(filepath: str, data: dict) -> bytes:
+    content = json.dumps(data, indent=4).encode()
+    atomic_write(filepath, content)
+    return content
+
+
+def fetch_litellm_models(source: str) -> dict:
+    """Load the LiteLLM price/context list from a URL or a local file"""
+    if os.path.exists(source):
+        return read_json_file(source)
+    response = requests.get(source, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+
+def diff_catalogs(current: dict, updated: dict) -> dict:
+    """Per model key: added, removed and changed fields (old/new values)"""
+    changed = {}
+    for name in current.keys() & updated.keys():
+        old, new = current[name], updated[name]
+        fields = {
+            field: {"old": old.get(field), "new": new.get(field)}
+            for field in sorted(old.keys() | new.keys())
+            if old.get(field) != new.get(field)
+        }
+        if fields:
+            changed[name] = fields
+    return {
+        "added": sorted(updated.keys() - current.keys()),
+        "removed": sorted(current.keys() - updated.keys()),
+        "changed": dict(sorted(changed.items())),
+    }
+
+
+def read_catalog_version(filepath: str) -> int:
+    if not os.path.exists(filepath):
+        return 0
+    return read_json_file(filepath).get("version", 0)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Update the bundled model catalog from LiteLLM's model list."
+    )
+    parser.add_argument(
+        "--source",
+        default=LITELLM_MODELS_URL,
+        help="URL or local path of model_prices_and_context_window.json",
+    )
+    parser.add_argument(
+        "--data-dir", default=BASE_FILE_PATH, help="Catalog data directory"
+    )
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="Only print the change report, do not write any file",
+    )
+    args = parser.parse_args()
+
     try:
-        BASE_FILE_PATH = os.path.join("src", "provider", "generate", "data")
         # Fetching the model data
-        url = "https://raw.githubusercontent.com/BerriAI/litellm/main/model_prices_and_context_window.json"
-        response = requests.get(url)
-        response.raise_for_status()
-        litellm_models_list = response.json()
+        litellm_models_list = fetch_litellm_models(args.source)
 
         # Filtering models except 'sample_spec'
         litellm_models_dict = dict()
@@ -32,7 +94,7 @@ if __name__ == "__main__":
                 }
 
         # Check if `models_list.json` exists
-        other_models_path = os.path.join(BASE_FILE_PATH, "other_models_list.json")
+        other_models_path = os.path.join(args.data_dir, "other_models_list.json")
         other_models_dict = {}
         if os.path.exists(other_models_path):
             with open(other_models_path, "r") as f:
@@ -41,16 +103,64 @@ if __name__ == "__main__":
         # Update the `litellm_models` and retain `other_models`
         updated_data = litellm_models_dict | other_models_dict
 
-        # Writing the updated data back to the JSON file
+        # Compare against the current catalog
+        models_list_path = os.path.join(args.data_dir, "models_list.json")
+        current_data = {}
+        if os.path.exists(models_list_path):
+            current_data = read_json_file(models_list_path)
+        changes = diff_catalogs(current_data, updated_data)
+        summary = (
+            f"{len(changes['added'])} added, {len(changes['removed'])} removed, "
+            f"{len(changes['changed'])} changed"
+        )
+
+        if args.diff:
+            print(json.dumps(changes, indent=4))
+            print(summary)
+            sys.exit(0)
+
+        if current_data == updated_data:
+            print("models_list.json is up to date.")
+            sys.exit(0)
+
+        # Every file is replaced atomically; a reader that catches the JSON
+        # and snapshot out of step falls back to JSON via the header hash
+        content = json.dumps(updated_data, indent=4).encode()
+        content_hash = hashlib.sha256(content).hexdigest()
+        write_snapshot(updated_data, content_hash, snapshot_path_for(models_list_path))
         write_json_file(
-            os.path.join(BASE_FILE_PATH, "litellm_models_list.json"),
+            os.path.join(args.data_dir, "litellm_models_list.json"),
             litellm_models_dict,
         )
-        write_json_file(os.path.join(BASE_FILE_PATH, "models_list.json"), updated_data)
+        atomic_write(models_list_path, content)
+
+        # Bump the catalog version and record what changed
+        version_path = os.path.join(args.data_dir, "catalog_version.json")
+        version = read_catalog_version(version_path) + 1
+        updated_at = datetime.now(timezone.utc).isoformat()
+        write_json_file(
+            version_path,
+            {"version": version, "sha256": content_hash, "updated_at": updated_at},
+        )
+        changelog_path = os.path.join(args.data_dir, "catalog_changelog.jsonl")
+        with open(changelog_path, "a") as f:
+            f.write(
+                json.dumps(
+                    {
+                        "version": version,
+                        "sha256": content_hash,
+                        "updated_at": updated_at,
+                        **changes,
+                    }
+                )
+                + "\n"
+            )
 
-        print("models_list.json updated successfully.")
+        print(f"Catalog updated to version {version}: {summary}.")
 
     except requests.RequestException as e:
         print(f"Error fetching models list: {e}")
+        sys.exit(1)
     except Exception as e:
         print(f"Unexpected error: {e}")
+        sys.exit(1)
@@ -0,0 +1,122 @@
+"""
+Compare catalog load time and per-worker memory for models_list.json vs
+models_list.snapshot.
+
+Forks N workers per format (like gunicorn does); each worker loads the
+catalog and its columns and touches every entry, then reports the load
+time plus the growth of its RSS, PSS and private memory from
+/proc/self/smaps_rollup. The name index is built the same way for both
+formats and is reported separately.
+
+Shared (page cache) memory shows up in RSS but is split across workers in
+PSS and is not counted as private.
+
+Usage: python scripts/catalog_snapshot_benchmark.py [--workers 4]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from provider.catalog.snapshot import snapshot_path_for
+from provider.catalog.store import ModelCatalogStore
+
+DATA_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "src",
+    "provider",
+    "generate",
+    "data",
+    "models_list.json",
+)
+
+
+def read_memory() -> dict:
+    """RSS / PSS / private memory of this process in KiB"""
+    memory = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                memory[key] = int(value.split()[0])
+    return {
+        "rss": memory["Rss"],
+        "pss": memory["Pss"],
+        "private": memory["Private_Clean"] + memory["Private_Dirty"],
+    }
+
+
+def load_in_worker(path: str, snapshot_path: str, write_fd: int) -> None:
+    before = read_memory()
+    started = time.perf_counter()
+    catalog = ModelCatalogStore(path, snapshot_path=snapshot_path).get()
+    catalog.columns
+    elapsed = time.perf_counter() - started
+    # Touch every entry once, as a busy worker eventually would
+    for name in catalog.models:
+        catalog.models[name]
+    after = read_memory()
+
+    index_started = time.perf_counter()
+    catalog.index
+    index_elapsed = time.perf_counter() - index_started
+    after_index = read_memory()
+
+    result = {key: after[key] - before[key] for key in after}
+    result["load_ms"] = elapsed * 1000
+    result["index_ms"] = index_elapsed * 1000
+    result["index_private"] = after_index["private"] - after["private"]
+    result["snapshot"] = catalog.snapshot is not None
+    os.write(write_fd, json.dumps(result).encode() + b"\n")
+
+
+def run(label: str, path: str, snapshot_path: str, workers: int) -> None:
+    read_fd, write_fd = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                load_in_worker(path, snapshot_path, write_fd)
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    os.close(write_fd)
+
+    # Keep every worker alive until all have reported so PSS is shared
+    with os.fdopen(read_fd) as f:
+        results = [json.loads(line) for line in f]
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+    if snapshot_path and not all(result["snapshot"] for result in results):
+        print(f"{label}: snapshot missing or stale, workers fell back to JSON")
+    average = {
+        key: sum(result[key] for result in results) / len(results)
+        for key in ("load_ms", "rss", "pss", "private", "index_ms", "index_private")
+    }
+    print(
+        f"{label:<10} load {average['load_ms']:8.2f} ms   "
+        f"RSS +{average['rss']:7.0f} KiB   PSS +{average['pss']:7.0f} KiB   "
+        f"private +{average['private']:7.0f} KiB   "
+        f"(index {average['index_ms']:.2f} ms, +{average['index_private']:.0f} KiB)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--path", default=os.path.abspath(DATA_PATH))
+    args = parser.parse_args()
+
+    print(f"{args.workers} workers per format, catalog {args.path}")
+    run("json", args.path, None, args.workers)
+    run("snapshot", args.path, snapshot_path_for(args.path), args.workers)
@@ -0,0 +1,138 @@
+"""
+Load-test the asynchronous completion job pool with a local fake provider.
+
+Jobs arrive at `--rate` per second for `--seconds`. Each one runs a fake
+provider's blocking `completion`, which sleeps for `--latency-ms` (plus or
+minus `--jitter` of that) like a long upstream call. This is repeated for
+each pool size in `--workers`, with the queue bounded at `--max-queued`.
+
+Reported per pool size: jobs accepted and rejected, throughput, the peak
+queue depth, and wait time (queued until started) and run time at p50/p99.
+Jobs are polled with `JobPool.get`, as the status endpoint does.
+
+Usage: python scripts/job_pool_load_test.py [--rate 50] [--seconds 5]
+       [--latency-ms 400] [--jitter 0.5] [--workers 8 16 32]
+       [--max-queued 100]
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "main.settings")
+
+import django
+
+django.setup()
+
+from provider.generate.base import BaseLLM
+from provider.jobs import FAILED, SUCCEEDED, JobPool, QueueFull
+
+
+class FakeProvider(BaseLLM):
+    def __init__(self, latency: float, jitter: float) -> None:
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+
+    def completion(self, model_name: str, messages: list) -> dict:
+        time.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        return {"model": model_name, "choices": [{"message": {"content": "ok"}}]}
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(
+    workers: int, max_queued: int, rate: float, seconds: float, llm: FakeProvider
+) -> dict:
+    pool = JobPool(workers=workers, max_queued=max_queued, result_ttl=600)
+    owner = "load-test"
+    accepted, rejected, peak_depth = [], 0, 0
+    stop = threading.Event()
+
+    def sample_depth():
+        nonlocal peak_depth
+        while not stop.is_set():
+            peak_depth = max(peak_depth, pool.queued)
+            time.sleep(0.01)
+
+    sampler = threading.Thread(target=sample_depth)
+    sampler.start()
+    started = time.perf_counter()
+    for position in range(int(rate * seconds)):
+        # Open-loop arrivals: a slow pool does not slow the clients down
+        time.sleep(max(0.0, started + position / rate - time.perf_counter()))
+        try:
+            job = pool.submit(
+                owner,
+                lambda: {
+                    "response": llm.completion("fake-model", []),
+                    "served_by": "fake",
+                },
+            )
+            accepted.append(job["job_id"])
+        except QueueFull:
+            rejected += 1
+
+    waits, runs, finished = [], [], 0
+    pending = set(accepted)
+    while pending:
+        for job_id in list(pending):
+            job = pool.get(job_id, owner)
+            if job["status"] in (SUCCEEDED, FAILED):
+                pending.discard(job_id)
+                finished += 1
+                waits.append(job["started_at"] - job["created_at"])
+                runs.append(job["finished_at"] - job["started_at"])
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    sampler.join()
+    return {
+        "accepted": len(accepted),
+        "rejected": rejected,
+        "jobs_per_second": finished / elapsed,
+        "peak_depth": peak_depth,
+        "wait_p50": percentile(waits, 0.5) if waits else 0.0,
+        "wait_p99": percentile(waits, 0.99) if waits else 0.0,
+        "run_p50": percentile(runs, 0.5) if runs else 0.0,
+        "run_p99": percentile(runs, 0.99) if runs else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rate", type=float, default=50)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--latency-ms", type=float, default=400)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--max-queued", type=int, default=100)
+    args = parser.parse_args()
+
+    llm = FakeProvider(args.latency_ms / 1000, args.jitter)
+    print(
+        f"{args.rate:g} jobs/s for {args.seconds:g}s, "
+        f"{args.latency_ms:g} ms +/- {args.jitter:.0%} per completion"
+    )
+    for workers in args.workers:
+        result = run(workers, args.max_queued, args.rate, args.seconds, llm)
+        print(
+            f"workers {workers:3d}   accepted {result['accepted']:5d}   "
+            f"rejected {result['rejected']:5d}   "
+            f"{result['jobs_per_second']:6.1f} jobs/s   "
+            f"peak queue {result['peak_depth']:4d}   "
+            f"wait p50 {result['wait_p50'] * 1000:7.0f} ms "
+            f"p99 {result['wait_p99'] * 1000:7.0f} ms   "
+            f"run p50 {result['run_p50'] * 1000:5.0f} ms "
+            f"p99 {result['run_p99'] * 1000:5.0f} ms"
+        )
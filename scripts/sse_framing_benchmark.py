@@ -0,0 +1,153 @@
+"""
+Measure the cost of framing streamed completion chunks as SSE events.
+
+Framing: `--tokens` LiteLLM streaming chunks (one token each) are framed
+with the previous implementation (`f"data: {chunk}"`, the chunk's repr),
+with the standard library `json` and with `provider.sse` (orjson). Reported
+per implementation: frames/s and CPU time per streamed token.
+
+Coalescing: the orjson frames of `--streams` concurrent streams, each
+producing a token every `--token-ms`, go through `provider.sse.coalesce`
+with several flush settings. Reported per setting: writes (what becomes a
+send syscall and a proxy read), bytes per write, CPU per token, and the
+worst delay a frame spent buffered.
+
+Usage: python scripts/sse_framing_benchmark.py [--tokens 20000]
+       [--streams 50] [--stream-tokens 200] [--token-ms 2]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+from litellm import ModelResponse
+from litellm.types.utils import Delta, StreamingChoices
+
+from provider.sse import coalesce, encode_chunk, sse_event
+
+FLUSH_SETTINGS = ((0, 0), (10, 0), (25, 0), (0, 4096), (25, 8192))
+
+
+def make_chunk(position: int) -> ModelResponse:
+    return ModelResponse(
+        stream=True,
+        model="gpt-4o-mini",
+        choices=[StreamingChoices(delta=Delta(content=f"token{position} "))],
+    )
+
+
+def frame_legacy(chunk, event_id: int) -> bytes:
+    return f"data: {chunk}\n\n".encode()
+
+
+def frame_json(chunk, event_id: int) -> bytes:
+    return f"id: {event_id}\ndata: {json.dumps(chunk.model_dump())}\n\n".encode()
+
+
+def frame_orjson(chunk, event_id: int) -> bytes:
+    return sse_event(encode_chunk(chunk), event_id=event_id)
+
+
+def measure_framing(frame, chunks: list) -> dict:
+    wall, cpu = time.perf_counter(), time.process_time()
+    size = 0
+    for event_id, chunk in enumerate(chunks, 1):
+        size += len(frame(chunk, event_id))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return {
+        "frames_per_second": len(chunks) / wall,
+        "cpu_us_per_token": cpu / len(chunks) * 1e6,
+        "bytes_per_frame": size / len(chunks),
+    }
+
+
+async def measure_coalescing(
+    streams: int, tokens: int, token_delay: float, interval_ms: int, max_bytes: int
+) -> dict:
+    frame = frame_orjson(make_chunk(0), 1)
+    writes = size = 0
+    worst_delay = 0.0
+
+    async def produce():
+        for _ in range(tokens):
+            await asyncio.sleep(token_delay)
+            yield frame, time.perf_counter()
+
+    async def consume():
+        nonlocal writes, size, worst_delay
+        produced = []
+
+        async def frames():
+            async for data, at in produce():
+                produced.append(at)
+                yield data
+
+        async for data in coalesce(frames(), interval_ms / 1000, max_bytes):
+            now = time.perf_counter()
+            writes += 1
+            size += len(data)
+            worst_delay = max(worst_delay, now - produced[0])
+            produced.clear()
+
+    cpu = time.process_time()
+    await asyncio.gather(*(consume() for _ in range(streams)))
+    cpu = time.process_time() - cpu
+    return {
+        "writes": writes,
+        "bytes_per_write": size / writes,
+        "cpu_us_per_token": cpu / (streams * tokens) * 1e6,
+        "worst_buffered_ms": worst_delay * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--stream-tokens", type=int, default=200)
+    parser.add_argument("--token-ms", type=float, default=2)
+    args = parser.parse_args()
+
+    chunks = [make_chunk(position) for position in range(args.tokens)]
+    print(f"Framing {args.tokens} chunks")
+    for label, frame in (
+        ("repr", frame_legacy),
+        ("json", frame_json),
+        ("orjson", frame_orjson),
+    ):
+        result = measure_framing(frame, chunks)
+        print(
+            f"{label:<7} {result['frames_per_second']:10.0f} frames/s   "
+            f"{result['cpu_us_per_token']:7.2f} us CPU/token   "
+            f"{result['bytes_per_frame']:6.0f} B/frame"
+        )
+
+    print(
+        f"\nCoalescing {args.streams} concurrent streams of {args.stream_tokens} "
+        f"tokens, one every {args.token_ms:g} ms"
+    )
+    for interval_ms, max_bytes in FLUSH_SETTINGS:
+        result = asyncio.run(
+            measure_coalescing(
+                args.streams,
+                args.stream_tokens,
+                args.token_ms / 1000,
+                interval_ms,
+                max_bytes,
+            )
+        )
+        print(
+            f"interval {interval_ms:3d} ms  bytes {max_bytes:5d}   "
+            f"{result['writes']:6d} writes   "
+            f"{result['bytes_per_write']:7.0f} B/write   "
+            f"{result['cpu_us_per_token']:6.1f} us CPU/token   "
+            f"worst buffered {result['worst_buffered_ms']:6.1f} ms"
+        )
@@ -0,0 +1,199 @@
+"""
+Measure how many concurrent completion streams one ASGI worker can hold.
+
+A fake OpenAI-compatible upstream runs in a separate process and streams
+`--tokens` chunks per request, `--delay-ms` apart. In this process a single
+event loop (what one uvicorn worker runs) opens `--streams` concurrent
+streams through the provider's `async_completion`, once with the previous
+implementation (blocking `litellm.completion` iterated inside the async
+generator) and once with the current `litellm.acompletion` one.
+
+Reported per implementation: wall time, streams/s, time to first chunk
+(from the moment every stream was requested),
+the peak number of streams open at the same time, and the worst event loop
+stall (how late a 10 ms timer fired), which is what every other request on
+the worker waits for.
+
+Usage: python scripts/stream_load_test.py [--streams 200] [--tokens 10]
+       [--delay-ms 20] [--only legacy|async]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+from aiohttp import web
+from litellm import completion
+
+from provider.generate.litellm import Litellm
+
+MODEL_NAME = "openai/fake-model"
+
+
+class LegacyLitellm(Litellm):
+    """The streaming implementation before the move to `acompletion`"""
+
+    async def async_completion(self, model_name: str, messages: list):
+        response = completion(
+            model=model_name, messages=messages, api_key=self._api_key, stream=True
+        )
+        for chunk in response:
+            yield chunk
+
+
+def chunk(content, finish_reason=None) -> bytes:
+    body = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "fake-model",
+        "choices": [
+            {
+                "index": 0,
+                "delta": {"content": content} if content else {},
+                "finish_reason": finish_reason,
+            }
+        ],
+    }
+    return f"data: {json.dumps(body)}\n\n".encode()
+
+
+def run_upstream(port: int, tokens: int, delay: float) -> None:
+    async def chat_completions(request):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for position in range(tokens):
+            await asyncio.sleep(delay)
+            await response.write(chunk(f"token{position} "))
+        await response.write(chunk(None, "stop"))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, backlog=4096)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def measure(llm_class, streams: int) -> dict:
+    open_streams = peak = 0
+    first_chunk = []
+    loop_lag = 0.0
+    started = time.perf_counter()
+    done = asyncio.Event()
+
+    async def probe():
+        nonlocal loop_lag
+        while not done.is_set():
+            tick = time.perf_counter()
+            await asyncio.sleep(0.01)
+            loop_lag = max(loop_lag, time.perf_counter() - tick - 0.01)
+
+    async def consume():
+        nonlocal open_streams, peak
+        llm = llm_class()
+        llm.api_key = "sk-fake"
+        first = True
+        open_streams += 1
+        peak = max(peak, open_streams)
+        try:
+            async for _ in llm.async_completion(
+                MODEL_NAME, [{"role": "user", "content": "Hello"}]
+            ):
+                if first:
+                    first_chunk.append(time.perf_counter() - started)
+                    first = False
+        finally:
+            open_streams -= 1
+
+    probe_task = asyncio.create_task(probe())
+    results = await asyncio.gather(
+        *(consume() for _ in range(streams)), return_exceptions=True
+    )
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+
+    errors = [result for result in results if isinstance(result, Exception)]
+    first_chunk.sort()
+    return {
+        "completed": streams - len(errors),
+        "errors": len(errors),
+        "first_error": str(errors[0]) if errors else None,
+        "elapsed": elapsed,
+        "ttfc_p50": statistics.median(first_chunk) if first_chunk else float("nan"),
+        "ttfc_p99": (
+            first_chunk[int(len(first_chunk) * 0.99) - 1]
+            if first_chunk
+            else float("nan")
+        ),
+        "peak": peak,
+        "loop_lag": loop_lag,
+    }
+
+
+def report(label: str, result: dict) -> None:
+    print(
+        f"{label:<7} {result['completed']:5d} ok {result['errors']:4d} err   "
+        f"wall {result['elapsed']:7.2f} s   "
+        f"{result['completed'] / result['elapsed']:8.1f} streams/s   "
+        f"first chunk p50 {result['ttfc_p50'] * 1000:8.1f} ms "
+        f"p99 {result['ttfc_p99'] * 1000:8.1f} ms   "
+        f"peak open {result['peak']:5d}   "
+        f"max loop stall {result['loop_lag'] * 1000:8.1f} ms"
+    )
+    if result["first_error"]:
+        print(f"        first error: {result['first_error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=10)
+    parser.add_argument("--delay-ms", type=float, default=20)
+    parser.add_argument("--only", choices=("legacy", "async"))
+    args = parser.parse_args()
+
+    port = free_port()
+    upstream = multiprocessing.Process(
+        target=run_upstream,
+        args=(port, args.tokens, args.delay_ms / 1000),
+        daemon=True,
+    )
+    upstream.start()
+    os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{port}/v1"
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+
+    print(
+        f"{args.streams} concurrent streams on one event loop, "
+        f"{args.tokens} chunks each, {args.delay_ms:g} ms apart "
+        f"(ideal wall time {args.tokens * args.delay_ms / 1000:.2f} s)"
+    )
+    try:
+        if args.only != "async":
+            report("legacy", asyncio.run(measure(LegacyLitellm, args.streams)))
+        if args.only != "legacy":
+            report("async", asyncio.run(measure(Litellm, args.streams)))
+    finally:
+        upstream.terminate()
@@ -19,6 +19,7 @@ class APIKeyPermission(BasePermission):
             api_key_obj = APIKey.objects.get(key=api_key)
             # Optionally, you could add more checks, like expiration or rate limits
             request.user = api_key_obj.user  # Set the user in the request
+            request.api_key_id = api_key_obj.id  # For the usage ledger
             return True
         except APIKey.DoesNotExist:
             return False  # Invalid API key
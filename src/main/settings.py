@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import json
 import os
 from datetime import timedelta
 from pathlib import Path
@@ -177,6 +178,189 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # API Key Encryption
 ENCRYPTION_KEY = os.environ.get("ENCRYPTION_KEY")
 
+# Model Catalog
+MODEL_CATALOG_PATH = os.environ.get(
+    "MODEL_CATALOG_PATH",
+    os.path.join(BASE_DIR, "provider", "generate", "data", "models_list.json"),
+)
+MODEL_CATALOG_SNAPSHOT_PATH = os.environ.get(
+    "MODEL_CATALOG_SNAPSHOT_PATH",
+    os.path.splitext(MODEL_CATALOG_PATH)[0] + ".snapshot",
+)
+MODEL_CATALOG_CHECK_INTERVAL = int(os.environ.get("MODEL_CATALOG_CHECK_INTERVAL", 5))
+MODEL_CATALOG_REMOTE_URL = os.environ.get("MODEL_CATALOG_REMOTE_URL")
+MODEL_CATALOG_REMOTE_REFRESH_INTERVAL = int(
+    os.environ.get("MODEL_CATALOG_REMOTE_REFRESH_INTERVAL", 3600)
+)
+
+# Browser/proxy reuse window for the model list (revalidated with ETags)
+MODEL_LIST_CACHE_MAX_AGE = int(os.environ.get("MODEL_LIST_CACHE_MAX_AGE", 60))
+
+# Provider clients are pooled per (provider, API key) and reuse connections
+PROVIDER_CLIENT_POOL_SIZE = int(os.environ.get("PROVIDER_CLIENT_POOL_SIZE", 256))
+PROVIDER_CLIENT_IDLE_TIMEOUT = int(os.environ.get("PROVIDER_CLIENT_IDLE_TIMEOUT", 300))
+
+# Exact-match cache for non-streaming completions. Requests opt in with
+# `cache: read|write`; COMPLETION_CACHE_DEFAULT_MODE applies otherwise.
+COMPLETION_CACHE_DEFAULT_MODE = os.environ.get(
+    "COMPLETION_CACHE_DEFAULT_MODE", "bypass"
+)
+COMPLETION_CACHE_TTL = int(os.environ.get("COMPLETION_CACHE_TTL", 3600))
+COMPLETION_CACHE_MAX_TTL = int(os.environ.get("COMPLETION_CACHE_MAX_TTL", 86400))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # LocMemCache evicts least recently used entries beyond MAX_ENTRIES
+    "completions": {
+        "BACKEND": os.environ.get(
+            "COMPLETION_CACHE_BACKEND",
+            "django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.environ.get("COMPLETION_CACHE_LOCATION", "completions"),
+        "TIMEOUT": COMPLETION_CACHE_TTL,
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.environ.get("COMPLETION_CACHE_MAX_ENTRIES", 10000)),
+        },
+    },
+}
+
+# Near-duplicate layer of the completion cache (MinHash/LSH, per worker).
+# SIMILARITY_CACHE_THRESHOLDS overrides the threshold per model, as JSON.
+SIMILARITY_CACHE_ENABLED = int(os.environ.get("SIMILARITY_CACHE_ENABLED", 0))
+SIMILARITY_CACHE_THRESHOLD = float(os.environ.get("SIMILARITY_CACHE_THRESHOLD", 0.9))
+SIMILARITY_CACHE_THRESHOLDS = json.loads(
+    os.environ.get("SIMILARITY_CACHE_THRESHOLDS", "{}")
+)
+SIMILARITY_CACHE_MAX_ENTRIES = int(os.environ.get("SIMILARITY_CACHE_MAX_ENTRIES", 5000))
+
+# Coalesce identical in-flight completion requests of the same credential:
+# those with temperature 0, and others sent with "coalesce": true.
+# Across workers this needs a shared backend for the "completions" cache.
+SINGLE_FLIGHT_ENABLED = int(os.environ.get("SINGLE_FLIGHT_ENABLED", 1))
+SINGLE_FLIGHT_TIMEOUT = int(os.environ.get("SINGLE_FLIGHT_TIMEOUT", 120))
+
+# Batch completions: items per request and in-flight calls per provider
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 1000))
+BATCH_PROVIDER_CONCURRENCY = int(os.environ.get("BATCH_PROVIDER_CONCURRENCY", 8))
+
+# Rotation across several keys of one provider: "least_in_flight" or
+# "headroom" (most RPM/TPM budget left); a key answered with 429 is skipped
+# for PROVIDER_KEY_COOLDOWN seconds
+PROVIDER_KEY_SELECTION = os.environ.get("PROVIDER_KEY_SELECTION", "least_in_flight")
+PROVIDER_KEY_COOLDOWN = int(os.environ.get("PROVIDER_KEY_COOLDOWN", 60))
+
+# Fallback routing: at most ROUTING_MAX_FALLBACKS fallback models per request.
+# "fastest" routing ranks models by latency and error rate averaged with a
+# half-life of ROUTING_EWMA_HALF_LIFE seconds; models failing more often than
+# ROUTING_MAX_ERROR_RATE are only tried last
+ROUTING_MAX_FALLBACKS = int(os.environ.get("ROUTING_MAX_FALLBACKS", 4))
+ROUTING_EWMA_HALF_LIFE = int(os.environ.get("ROUTING_EWMA_HALF_LIFE", 60))
+ROUTING_MAX_ERROR_RATE = float(os.environ.get("ROUTING_MAX_ERROR_RATE", 0.5))
+
+# Circuit breaker per (provider, model): opens for BREAKER_OPEN_SECONDS when,
+# over the last BREAKER_WINDOW seconds (and at least BREAKER_MIN_REQUESTS
+# calls), the error rate reaches BREAKER_ERROR_RATE or the
+# BREAKER_LATENCY_PERCENTILE latency reaches BREAKER_LATENCY_THRESHOLD
+# seconds. Openings are shared through the "completions" cache and read
+# every BREAKER_SYNC_INTERVAL seconds.
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", 30))
+BREAKER_MIN_REQUESTS = int(os.environ.get("BREAKER_MIN_REQUESTS", 10))
+BREAKER_ERROR_RATE = float(os.environ.get("BREAKER_ERROR_RATE", 0.5))
+BREAKER_LATENCY_PERCENTILE = float(os.environ.get("BREAKER_LATENCY_PERCENTILE", 0.9))
+BREAKER_LATENCY_THRESHOLD = float(os.environ.get("BREAKER_LATENCY_THRESHOLD", 20))
+BREAKER_OPEN_SECONDS = int(os.environ.get("BREAKER_OPEN_SECONDS", 30))
+BREAKER_SYNC_INTERVAL = float(os.environ.get("BREAKER_SYNC_INTERVAL", 1))
+
+# Hedged completions ("hedge": true): a second attempt is sent when the first
+# is slower than the HEDGE_PERCENTILE latency of its provider and model
+# (HEDGE_DEFAULT_DELAY seconds until HEDGE_MIN_SAMPLES calls are known, never
+# under HEDGE_MIN_DELAY). HEDGE_BUDGET caps hedges at that fraction of
+# requests; 0 disables hedging.
+HEDGE_BUDGET = float(os.environ.get("HEDGE_BUDGET", 0.05))
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", 0.95))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", 20))
+HEDGE_DEFAULT_DELAY = float(os.environ.get("HEDGE_DEFAULT_DELAY", 2))
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", 0.2))
+
+# Retries of 429/408/5xx/timeout provider errors: up to RETRY_MAX_ATTEMPTS
+# attempts per model, with full-jitter exponential backoff from
+# RETRY_BASE_DELAY up to RETRY_MAX_DELAY seconds, or the provider's
+# Retry-After when it is at most RETRY_MAX_RETRY_AFTER seconds. Each call
+# earns RETRY_BUDGET_RATIO retries from the worker's retry budget.
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", 3))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", 0.25))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", 8))
+RETRY_MAX_RETRY_AFTER = float(os.environ.get("RETRY_MAX_RETRY_AFTER", 30))
+RETRY_BUDGET_RATIO = float(os.environ.get("RETRY_BUDGET_RATIO", 0.1))
+
+# Coalescing of streamed SSE events into fewer writes: flush once a batch
+# holds SSE_FLUSH_BYTES or is SSE_FLUSH_INTERVAL_MS old (0 and 0: no batching).
+# Set an interval along with SSE_FLUSH_BYTES so slow streams are not held back.
+SSE_FLUSH_INTERVAL_MS = int(os.environ.get("SSE_FLUSH_INTERVAL_MS", 0))
+SSE_FLUSH_BYTES = int(os.environ.get("SSE_FLUSH_BYTES", 0))
+
+# Streamed generations can be cancelled by id; a cancel request received by
+# another worker is picked up within this many seconds.
+GENERATION_CANCEL_POLL_INTERVAL = float(
+    os.environ.get("GENERATION_CANCEL_POLL_INTERVAL", 0.5)
+)
+
+# Resumable streams: the last STREAM_REPLAY_MAX_BYTES of each stream's events
+# are kept (in memory and in the completions cache, for STREAM_REPLAY_TTL
+# seconds after it ends) for clients reconnecting with Last-Event-ID. The cap
+# is hard: a client falling further behind gets an error event instead of the
+# buffer growing. Only playground requests sent with "resumable": true are
+# buffered so; other streams keep only the events not sent yet, and are
+# cancelled as soon as the client disconnects. A resumable stream nobody reads
+# is cancelled after STREAM_RESUME_GRACE seconds, its upstream call running
+# (and consuming provider tokens) until then.
+STREAM_REPLAY_MAX_BYTES = int(os.environ.get("STREAM_REPLAY_MAX_BYTES", 262144))
+STREAM_REPLAY_TTL = int(os.environ.get("STREAM_REPLAY_TTL", 300))
+STREAM_REPLAY_PUBLISH_INTERVAL = float(
+    os.environ.get("STREAM_REPLAY_PUBLISH_INTERVAL", 0.5)
+)
+STREAM_RESUME_GRACE = float(os.environ.get("STREAM_RESUME_GRACE", 15))
+
+# Asynchronous completion jobs: JOB_WORKERS threads per worker process run
+# them, at most JOB_MAX_QUEUED wait, results are kept for JOB_RESULT_TTL
+# seconds. Callbacks are signed (X-Signature) when JOB_CALLBACK_SECRET is set.
+# Callback URLs must resolve to public addresses; JOB_CALLBACK_ALLOWED_HOSTS
+# (comma-separated) lists hosts exempt from that check.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 8))
+JOB_MAX_QUEUED = int(os.environ.get("JOB_MAX_QUEUED", 100))
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", 3600))
+JOB_CALLBACK_TIMEOUT = float(os.environ.get("JOB_CALLBACK_TIMEOUT", 10))
+JOB_CALLBACK_ATTEMPTS = int(os.environ.get("JOB_CALLBACK_ATTEMPTS", 3))
+JOB_CALLBACK_SECRET = os.environ.get("JOB_CALLBACK_SECRET", "")
+JOB_CALLBACK_ALLOWED_HOSTS = [
+    host for host in os.environ.get("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if host
+]
+
+# Request deadlines: X-Request-Timeout (seconds), else the model's default
+# from DEADLINE_MODEL_DEFAULTS (JSON) or DEADLINE_DEFAULT, capped at
+# DEADLINE_MAX. A request is refused up front with a 504 when the
+# DEADLINE_REJECT_PERCENTILE latency of its models (over at least
+# DEADLINE_MIN_SAMPLES calls) exceeds it. Playground streams default to
+# STREAM_MAX_DURATION and fail after STREAM_IDLE_TIMEOUT seconds of silence.
+# Batch items still pending after BATCH_MAX_DURATION fail with a 504.
+DEADLINE_DEFAULT = float(os.environ.get("DEADLINE_DEFAULT", 60))
+DEADLINE_MAX = float(os.environ.get("DEADLINE_MAX", 300))
+DEADLINE_MODEL_DEFAULTS = json.loads(os.environ.get("DEADLINE_MODEL_DEFAULTS", "{}"))
+DEADLINE_REJECT_PERCENTILE = float(os.environ.get("DEADLINE_REJECT_PERCENTILE", 0.1))
+DEADLINE_MIN_SAMPLES = int(os.environ.get("DEADLINE_MIN_SAMPLES", 20))
+STREAM_IDLE_TIMEOUT = float(os.environ.get("STREAM_IDLE_TIMEOUT", 30))
+STREAM_MAX_DURATION = float(os.environ.get("STREAM_MAX_DURATION", 300))
+BATCH_MAX_DURATION = float(os.environ.get("BATCH_MAX_DURATION", 300))
+
+# Usage ledger: records of upstream calls are buffered and written in
+# batches of USAGE_FLUSH_SIZE, at least every USAGE_FLUSH_INTERVAL seconds.
+# At most USAGE_MAX_BUFFERED wait while the database is unavailable.
+USAGE_FLUSH_SIZE = int(os.environ.get("USAGE_FLUSH_SIZE", 500))
+USAGE_FLUSH_INTERVAL = float(os.environ.get("USAGE_FLUSH_INTERVAL", 5))
+USAGE_MAX_BUFFERED = int(os.environ.get("USAGE_MAX_BUFFERED", 50000))
+
 # Google OAuth2 settings
 GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET")
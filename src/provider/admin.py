@@ -1,5 +1,6 @@
 from django.contrib import admin
-from provider.models import ProviderAPIKey
+from provider.models import ProviderAPIKey, UsageRecord
 
 # Register your models here.
-admin.site.register(ProviderAPIKey)
\ No newline at end of file
+admin.site.register(ProviderAPIKey)
+admin.site.register(UsageRecord)
\ No newline at end of file
@@ -0,0 +1,368 @@
+"""
+Circuit breakers per (provider, model).
+
+Each worker keeps a sliding window of call outcomes per breaker. The
+breaker opens when, over the window, the error rate or a latency
+percentile crosses its threshold; it then rejects calls without touching
+the provider until `open_seconds` have passed. After that a single probe
+call (across all workers) is let through while half-open: success closes
+the breaker, failure opens it again.
+
+Opening is published to the shared cache so other workers stop calling the
+provider too. Workers read the shared state at most every `sync_interval`
+seconds, keeping `allow()` in memory on the request path. `aallow()` and
+`arecord()` do the same through the async cache API, for the event loop.
+"""
+
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import caches
+
+from provider.metrics import metrics
+from provider.retries import RETRYABLE, classify_error
+
+CACHE_ALIAS = "completions"
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, provider: str, model_name: str, retry_after: float) -> None:
+        super().__init__(
+            f"{provider} is unavailable for {model_name} (circuit open); "
+            f"retry in {retry_after:.0f}s."
+        )
+        self.retry_after = retry_after
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """
+    Whether `error` says something about provider health: a 5xx, 408 or
+    429, or an error classified as transient or a timeout. Anything else
+    (a 4xx, a bug, an unclassified error) is not held against the provider.
+    """
+    return classify_error(error) in RETRYABLE
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        provider: str,
+        model_name: str,
+        window: float = 30,
+        min_requests: int = 10,
+        error_rate: float = 0.5,
+        latency_percentile: float = 0.9,
+        latency_threshold: float = 20,
+        open_seconds: float = 30,
+        sync_interval: float = 1,
+    ) -> None:
+        self.provider = provider
+        self.model_name = model_name
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.latency_percentile = latency_percentile
+        self.latency_threshold = latency_threshold
+        self.open_seconds = open_seconds
+        self.sync_interval = sync_interval
+        self.state = CLOSED
+        # Wall-clock time, comparable across workers
+        self.open_until = 0.0
+        self.reason = None
+        self._outcomes = deque()
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def cache_key(self) -> str:
+        return f"breaker_{self.provider}_{self.model_name}"
+
+    @property
+    def probe_key(self) -> str:
+        return f"{self.cache_key}_probe"
+
+    def allow(self) -> bool:
+        """Whether a call may go to the provider now"""
+        now = time.time()
+        if now - self._synced_at >= self.sync_interval:
+            self._sync(now)
+        allowed = self._admit(now)
+        if allowed is not None:
+            return allowed
+        return self._probed(
+            caches[CACHE_ALIAS].add(self.probe_key, 1, timeout=self._probe_timeout)
+        )
+
+    async def aallow(self) -> bool:
+        """`allow()` for the event loop, using the async cache API"""
+        now = time.time()
+        if now - self._synced_at >= self.sync_interval:
+            await self._async(now)
+        allowed = self._admit(now)
+        if allowed is not None:
+            return allowed
+        return self._probed(
+            await caches[CACHE_ALIAS].aadd(
+                self.probe_key, 1, timeout=self._probe_timeout
+            )
+        )
+
+    @property
+    def _probe_timeout(self) -> int:
+        return int(self.open_seconds) or 1
+
+    def _admit(self, now: float):
+        """Whether a call may go now, or None when it takes the probe"""
+        if self.state == CLOSED:
+            return True
+        if now < self.open_until:
+            metrics.incr("breaker.rejected")
+            return False
+        return None
+
+    def _probed(self, probe: bool) -> bool:
+        # Half-open: one probe at a time across workers
+        with self._lock:
+            self.state = HALF_OPEN
+        if not probe:
+            metrics.incr("breaker.rejected")
+        else:
+            metrics.incr("breaker.probes")
+        return probe
+
+    def retry_after(self) -> float:
+        return max(1.0, self.open_until - time.time())
+
+    def latency_quantile(self, fraction: float, min_samples: int = 1):
+        """Latency at `fraction` over the window, or None with too few samples"""
+        now = time.time()
+        with self._lock:
+            latencies = sorted(
+                latency
+                for at, _, latency in self._outcomes
+                if latency is not None and at >= now - self.window
+            )
+        if len(latencies) < max(1, min_samples):
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+    def record(self, latency: float = None, error: BaseException = None) -> None:
+        update = self._apply(latency, error)
+        if update is None:
+            return
+        cache = caches[CACHE_ALIAS]
+        released, shared = update
+        if shared is None:
+            cache.delete_many(released)
+        else:
+            cache.set(self.cache_key, shared, timeout=self._shared_timeout)
+
+    async def arecord(self, latency: float = None, error: BaseException = None) -> None:
+        """`record()` for the event loop, using the async cache API"""
+        update = self._apply(latency, error)
+        if update is None:
+            return
+        cache = caches[CACHE_ALIAS]
+        released, shared = update
+        if shared is None:
+            await cache.adelete_many(released)
+        else:
+            await cache.aset(self.cache_key, shared, timeout=self._shared_timeout)
+
+    @property
+    def _shared_timeout(self) -> int:
+        return int(self.open_seconds + self.window)
+
+    def _apply(self, latency: float, error: BaseException):
+        """
+        Apply an outcome in memory. Returns the shared cache update it
+        calls for, as `(keys to delete, state to publish)`, or None.
+        """
+        failed = error is not None and is_upstream_failure(error)
+        if error is not None and not failed:
+            # Says nothing about the provider: not an outcome, and a probe
+            # that ended so is let through again
+            if self.state == HALF_OPEN:
+                return [self.probe_key], None
+            return None
+        now = time.time()
+        with self._lock:
+            state = self.state
+            if state == HALF_OPEN:
+                if failed:
+                    self._open(now, "probe failed")
+                else:
+                    self._close()
+            elif state == OPEN:
+                return None
+            else:
+                self._outcomes.append((now, failed, latency))
+                reason = self._evaluate(now)
+                if not reason:
+                    return None
+                self._open(now, reason)
+            if self.state == CLOSED:
+                return [self.cache_key, self.probe_key], None
+            return None, {"open_until": self.open_until, "reason": self.reason}
+
+    def _evaluate(self, now: float):
+        """Reason to open over the current window, if any (lock held)"""
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+        if len(self._outcomes) < self.min_requests:
+            return None
+        failures = sum(1 for _, failed, _ in self._outcomes if failed)
+        if failures / len(self._outcomes) >= self.error_rate:
+            return f"error rate {failures / len(self._outcomes):.2f}"
+        latencies = sorted(
+            latency for _, _, latency in self._outcomes if latency is not None
+        )
+        if latencies and self.latency_threshold:
+            position = min(
+                len(latencies) - 1, int(len(latencies) * self.latency_percentile)
+            )
+            if latencies[position] >= self.latency_threshold:
+                return (
+                    f"p{self.latency_percentile * 100:.0f} latency "
+                    f"{latencies[position]:.1f}s"
+                )
+        return None
+
+    def _open(self, now: float, reason: str) -> None:
+        self.state = OPEN
+        self.open_until = now + self.open_seconds
+        self.reason = reason
+        self._outcomes.clear()
+        metrics.incr("breaker.opened")
+
+    def _close(self) -> None:
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.reason = None
+        self._outcomes.clear()
+        metrics.incr("breaker.closed")
+
+    def _sync(self, now: float) -> None:
+        """Adopt the opening or closing published by another worker"""
+        self._synced_at = now
+        self._adopt(caches[CACHE_ALIAS].get(self.cache_key))
+
+    async def _async(self, now: float) -> None:
+        """`_sync()` through the async cache API"""
+        self._synced_at = now
+        self._adopt(await caches[CACHE_ALIAS].aget(self.cache_key))
+
+    def _adopt(self, shared) -> None:
+        with self._lock:
+            if shared is None:
+                if self.state != CLOSED:
+                    # A successful probe (in some worker) closed it
+                    self.state = CLOSED
+                    self.open_until = 0.0
+                    self.reason = None
+                return
+            if shared["open_until"] > self.open_until:
+                self.state = OPEN
+                self.open_until = shared["open_until"]
+                self.reason = shared["reason"]
+                self._outcomes.clear()
+
+    def status(self) -> dict:
+        now = time.time()
+        with self._lock:
+            outcomes = [
+                entry for entry in self._outcomes if entry[0] >= now - self.window
+            ]
+            latencies = sorted(
+                latency for _, _, latency in outcomes if latency is not None
+            )
+            state = self.state
+            if state == OPEN and now >= self.open_until:
+                state = HALF_OPEN
+            return {
+                "provider": self.provider,
+                "model_name": self.model_name,
+                "state": state,
+                "reason": self.reason,
+                "retry_after": (
+                    round(self.open_until - now, 2) if now < self.open_until else None
+                ),
+                "requests": len(outcomes),
+                "error_rate": (
+                    round(
+                        sum(1 for _, failed, _ in outcomes if failed) / len(outcomes), 4
+                    )
+                    if outcomes
+                    else None
+                ),
+                "p50": latencies[len(latencies) // 2] if latencies else None,
+                "p99": (
+                    latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                    if latencies
+                    else None
+                ),
+            }
+
+
+class BreakerRegistry:
+    def __init__(self, **options) -> None:
+        self.options = options
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str, model_name: str) -> CircuitBreaker:
+        key = (provider, model_name)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(key)
+                if breaker is None:
+                    breaker = self._breakers[key] = CircuitBreaker(
+                        provider, model_name, **self.options
+                    )
+        return breaker
+
+    def statuses(self) -> list:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        for breaker in breakers:
+            breaker._sync(time.time())
+        return [breaker.status() for breaker in breakers]
+
+    def open_count(self) -> int:
+        now = time.time()
+        return sum(
+            1
+            for breaker in list(self._breakers.values())
+            if breaker.state != CLOSED and now < breaker.open_until
+        )
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_breakers() -> BreakerRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = BreakerRegistry(
+                    window=getattr(settings, "BREAKER_WINDOW", 30),
+                    min_requests=getattr(settings, "BREAKER_MIN_REQUESTS", 10),
+                    error_rate=getattr(settings, "BREAKER_ERROR_RATE", 0.5),
+                    latency_percentile=getattr(
+                        settings, "BREAKER_LATENCY_PERCENTILE", 0.9
+                    ),
+                    latency_threshold=getattr(
+                        settings, "BREAKER_LATENCY_THRESHOLD", 20
+                    ),
+                    open_seconds=getattr(settings, "BREAKER_OPEN_SECONDS", 30),
+                    sync_interval=getattr(settings, "BREAKER_SYNC_INTERVAL", 1),
+                )
+                metrics.gauge("breaker.open", registry.open_count)
+                _registry = registry
+    return _registry
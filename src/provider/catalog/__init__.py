@@ -0,0 +1,5 @@
+from .columns import CatalogColumns
+from .index import CatalogIndex
+from .snapshot import CatalogSnapshot, SnapshotError, snapshot_path_for, write_snapshot
+from .store import Catalog, ModelCatalogStore, get_catalog, get_catalog_store
+from .router import AUTO_MODEL, parse_auto_constraints, select_cheapest_model
@@ -0,0 +1,185 @@
+import numpy as np
+
+
+class CatalogColumns:
+    """
+    Columnar copy of the numeric and capability fields of a catalog version.
+
+    Numeric fields become float64 arrays with NaN for missing values (plus a
+    derived `total_cost_per_token` = input + output price), and the
+    `supports_*` flags are packed into a (rows, words) uint64 bitset so that
+    filters and sorts run as vectorized masks/argsorts instead of Python
+    loops over dicts. Row ids match `CatalogIndex`.
+    """
+
+    NUMERIC_FIELDS = (
+        "input_cost_per_token",
+        "output_cost_per_token",
+        "max_input_tokens",
+        "max_output_tokens",
+        "max_tokens",
+    )
+    CAPABILITY_PREFIX = "supports_"
+    CAPABILITY_ALIASES = {"tools": "function_calling"}
+
+    def __init__(
+        self,
+        providers: tuple,
+        provider: np.ndarray,
+        numeric: dict,
+        modes: tuple,
+        mode: np.ndarray,
+        capabilities: tuple,
+        flags: np.ndarray,
+    ) -> None:
+        self.size = len(provider)
+        self.providers = providers
+        self.provider = provider
+        self.numeric = dict(numeric)
+        self.modes = modes
+        self.mode = mode
+        self.capabilities = capabilities
+        self.flags = flags
+
+        total_cost = (
+            self.numeric["input_cost_per_token"] + self.numeric["output_cost_per_token"]
+        )
+        total_cost.flags.writeable = False
+        self.numeric["total_cost_per_token"] = total_cost
+        self.capability_bits = {
+            capability: bit for bit, capability in enumerate(self.capabilities)
+        }
+
+    @classmethod
+    def from_models(cls, models) -> "CatalogColumns":
+        """Extract the columns from a name -> model dict mapping"""
+        rows = list(models.values())
+        size = len(rows)
+
+        providers = tuple(
+            sorted({model.get("provider") for model in rows if model.get("provider")})
+        )
+        provider_codes = {provider: code for code, provider in enumerate(providers)}
+        provider = np.fromiter(
+            (provider_codes.get(model.get("provider"), -1) for model in rows),
+            dtype=np.int32,
+            count=size,
+        )
+        provider.flags.writeable = False
+
+        numeric = {}
+        for field in cls.NUMERIC_FIELDS:
+            column = np.full(size, np.nan, dtype=np.float64)
+            for row_id, model in enumerate(rows):
+                value = model.get(field)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    column[row_id] = value
+            column.flags.writeable = False
+            numeric[field] = column
+
+        modes = tuple(sorted({model.get("mode") or "" for model in rows}))
+        mode_codes = {mode: code for code, mode in enumerate(modes)}
+        mode = np.fromiter(
+            (mode_codes[model.get("mode") or ""] for model in rows),
+            dtype=np.int16,
+            count=size,
+        )
+        mode.flags.writeable = False
+
+        capabilities = tuple(
+            sorted(
+                {
+                    field[len(cls.CAPABILITY_PREFIX) :]
+                    for model in rows
+                    for field in model
+                    if field.startswith(cls.CAPABILITY_PREFIX)
+                }
+            )
+        )
+        words = max(1, (len(capabilities) + 63) // 64)
+        flags = np.zeros((size, words), dtype=np.uint64)
+        for row_id, model in enumerate(rows):
+            for bit, capability in enumerate(capabilities):
+                if model.get(cls.CAPABILITY_PREFIX + capability) is True:
+                    flags[row_id, bit // 64] |= np.uint64(1 << (bit % 64))
+        flags.flags.writeable = False
+
+        return cls(providers, provider, numeric, modes, mode, capabilities, flags)
+
+    def capability_mask(self, capabilities) -> np.ndarray:
+        """uint64 words with a bit set for each required capability"""
+        required = np.zeros(self.flags.shape[1], dtype=np.uint64)
+        for capability in capabilities:
+            capability = capability.strip().lower()
+            if capability.startswith(self.CAPABILITY_PREFIX):
+                capability = capability[len(self.CAPABILITY_PREFIX) :]
+            capability = self.CAPABILITY_ALIASES.get(capability, capability)
+            if capability not in self.capability_bits:
+                raise ValueError(f"Unknown capability '{capability}'")
+            bit = self.capability_bits[capability]
+            required[bit // 64] |= np.uint64(1 << (bit % 64))
+        return required
+
+    def provider_mask(self, providers) -> np.ndarray:
+        """Boolean row mask for rows served by any of `providers`"""
+        codes = [
+            code
+            for code, provider in enumerate(self.providers)
+            if provider in providers
+        ]
+        return np.isin(self.provider, codes)
+
+    def mask(
+        self,
+        min_input_tokens: int = None,
+        min_output_tokens: int = None,
+        max_input_cost_per_token: float = None,
+        max_output_cost_per_token: float = None,
+        capabilities=(),
+        mode: str = None,
+    ) -> np.ndarray:
+        """Boolean row mask for the given constraints (missing values never match)"""
+        mask = np.ones(self.size, dtype=bool)
+        if min_input_tokens is not None:
+            mask &= self.numeric["max_input_tokens"] >= min_input_tokens
+        if min_output_tokens is not None:
+            mask &= self.numeric["max_output_tokens"] >= min_output_tokens
+        if max_input_cost_per_token is not None:
+            mask &= self.numeric["input_cost_per_token"] <= max_input_cost_per_token
+        if max_output_cost_per_token is not None:
+            mask &= self.numeric["output_cost_per_token"] <= max_output_cost_per_token
+        if capabilities:
+            required = self.capability_mask(capabilities)
+            mask &= ((self.flags & required) == required).all(axis=1)
+        if mode:
+            if mode not in self.modes:
+                mask[:] = False
+            else:
+                mask &= self.mode == self.modes.index(mode)
+        return mask
+
+    def sort(self, row_ids: np.ndarray, field: str, descending: bool = False):
+        """Stable sort of `row_ids` by a numeric field, missing values last"""
+        if field not in self.numeric:
+            raise ValueError(f"Cannot sort by '{field}'")
+        values = self.numeric[field][row_ids]
+        if descending:
+            values = -values
+        return row_ids[np.argsort(values, kind="stable")]
+
+    def query(self, row_ids=None, sort: str = None, **constraints) -> np.ndarray:
+        """
+        Apply `mask()` constraints to `row_ids` (all rows when None) and
+        optionally sort by a numeric field; a leading '-' sorts descending.
+        """
+        mask = self.mask(**constraints)
+        if row_ids is None:
+            selected = np.flatnonzero(mask)
+        else:
+            row_ids = np.asarray(row_ids, dtype=np.intp)
+            selected = row_ids[mask[row_ids]]
+        if sort:
+            selected = self.sort(
+                selected, sort.lstrip("-"), descending=sort.startswith("-")
+            )
+        return selected
@@ -0,0 +1,96 @@
+from bisect import bisect_left
+
+
+class CatalogIndex:
+    """
+    Read-only query structures built once per catalog version.
+
+    Row ids are positions in catalog order, so every posting list is sorted
+    and results come back in the same order as the catalog file.
+
+    - `names` / `row_by_name`: catalog order and its inverse
+    - `provider_rows`: provider -> row ids
+    - `sorted_names` / `sorted_row_ids`: lower-cased names for prefix lookups
+    - `ngrams`: 1..3-gram -> row ids, used to narrow substring matches
+    """
+
+    NGRAM_SIZE = 3
+
+    def __init__(self, names, row_providers) -> None:
+        self.names = tuple(names)
+        self.lower_names = tuple(name.lower() for name in self.names)
+        self.row_by_name = {name: row_id for row_id, name in enumerate(self.names)}
+
+        provider_rows = {}
+        for row_id, provider in enumerate(row_providers):
+            provider_rows.setdefault(provider, []).append(row_id)
+        self.provider_rows = {
+            provider: tuple(row_ids) for provider, row_ids in provider_rows.items()
+        }
+        self.providers = tuple(
+            sorted(provider for provider in self.provider_rows if provider)
+        )
+
+        order = sorted(range(len(self.names)), key=self.lower_names.__getitem__)
+        self.sorted_names = tuple(self.lower_names[row_id] for row_id in order)
+        self.sorted_row_ids = tuple(order)
+
+        ngrams = {}
+        for row_id, name in enumerate(self.lower_names):
+            for gram in self._ngrams(name):
+                postings = ngrams.setdefault(gram, [])
+                if not postings or postings[-1] != row_id:
+                    postings.append(row_id)
+        self.ngrams = {gram: tuple(row_ids) for gram, row_ids in ngrams.items()}
+
+    @classmethod
+    def from_models(cls, models) -> "CatalogIndex":
+        return cls(models.keys(), [model.get("provider") for model in models.values()])
+
+    def _ngrams(self, value: str):
+        for size in range(1, self.NGRAM_SIZE + 1):
+            for start in range(len(value) - size + 1):
+                yield value[start : start + size]
+
+    def prefix(self, prefix: str) -> list:
+        """Row ids whose name starts with `prefix` (case-insensitive)"""
+        prefix = prefix.lower()
+        start = bisect_left(self.sorted_names, prefix)
+        row_ids = []
+        for position in range(start, len(self.sorted_names)):
+            if not self.sorted_names[position].startswith(prefix):
+                break
+            row_ids.append(self.sorted_row_ids[position])
+        return sorted(row_ids)
+
+    def search(self, name: str) -> list:
+        """Row ids whose name contains `name` (case-insensitive)"""
+        name = name.lower()
+        if len(name) <= self.NGRAM_SIZE:
+            return list(self.ngrams.get(name, ()))
+
+        grams = {
+            name[start : start + self.NGRAM_SIZE]
+            for start in range(len(name) - self.NGRAM_SIZE + 1)
+        }
+        postings = sorted((self.ngrams.get(gram, ()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for row_ids in postings[1:]:
+            candidates.intersection_update(row_ids)
+            if not candidates:
+                return []
+        return [
+            row_id for row_id in sorted(candidates) if name in self.lower_names[row_id]
+        ]
+
+    def filter(self, name: str = "", provider: str = "") -> list:
+        """Row ids matching the name substring and exact provider filters"""
+        if provider:
+            provider_ids = self.provider_rows.get(provider, ())
+            if not name:
+                return list(provider_ids)
+            provider_ids = set(provider_ids)
+            return [row_id for row_id in self.search(name) if row_id in provider_ids]
+        if name:
+            return self.search(name)
+        return list(range(len(self.names)))
@@ -0,0 +1,89 @@
+import numpy as np
+
+from .store import Catalog
+
+AUTO_MODEL = "auto"
+
+
+def parse_auto_constraints(constraints: dict) -> dict:
+    """
+    Validate the `constraints` object sent with `model_name: "auto"`.
+
+    Supported keys:
+    - min_context: Minimum `max_input_tokens`
+    - min_output_tokens: Minimum `max_output_tokens`
+    - capabilities: List of `supports_*` flags (e.g. ["function_calling"])
+    - max_price_per_1k_tokens: Ceiling for both input and output price per 1k tokens
+    - providers: Allowed providers (default: every provider the user holds a key for)
+    - mode: Catalog mode (default: chat)
+    """
+    if constraints is None:
+        constraints = {}
+    if not isinstance(constraints, dict):
+        raise ValueError("'constraints' must be an object")
+
+    parsed = {"mode": constraints.get("mode") or "chat"}
+    for key in ("min_context", "min_output_tokens"):
+        if constraints.get(key) is not None:
+            try:
+                parsed[key] = int(constraints[key])
+            except (TypeError, ValueError):
+                raise ValueError(f"'{key}' must be an integer")
+    if constraints.get("max_price_per_1k_tokens") is not None:
+        try:
+            parsed["max_price_per_1k_tokens"] = float(
+                constraints["max_price_per_1k_tokens"]
+            )
+        except (TypeError, ValueError):
+            raise ValueError("'max_price_per_1k_tokens' must be a number")
+    for key in ("capabilities", "providers"):
+        value = constraints.get(key)
+        if value is None:
+            continue
+        if isinstance(value, str):
+            value = value.split(",")
+        if not isinstance(value, (list, tuple)):
+            raise ValueError(f"'{key}' must be a list")
+        parsed[key] = tuple(item.strip().lower() for item in value if item)
+    return parsed
+
+
+def select_cheapest_model(
+    catalog: Catalog,
+    providers,
+    min_context: int = None,
+    min_output_tokens: int = None,
+    capabilities=(),
+    max_price_per_1k_tokens: float = None,
+    mode: str = "chat",
+):
+    """
+    Return the name of the cheapest model (input + output price per token)
+    served by one of `providers` that satisfies every constraint, or None.
+
+    Runs as a single vectorized pass over the catalog columns; models
+    without a known price are never selected.
+    """
+    if not providers:
+        return None
+
+    columns = catalog.columns
+    max_cost_per_token = None
+    if max_price_per_1k_tokens is not None:
+        max_cost_per_token = max_price_per_1k_tokens / 1000
+    mask = columns.mask(
+        min_input_tokens=min_context,
+        min_output_tokens=min_output_tokens,
+        max_input_cost_per_token=max_cost_per_token,
+        max_output_cost_per_token=max_cost_per_token,
+        capabilities=capabilities,
+        mode=mode,
+    )
+    mask &= columns.provider_mask(providers)
+
+    costs = columns.numeric["total_cost_per_token"]
+    costs = np.where(mask & np.isfinite(costs), costs, np.inf)
+    row_id = int(np.argmin(costs))
+    if not np.isfinite(costs[row_id]):
+        return None
+    return catalog.index.names[row_id]
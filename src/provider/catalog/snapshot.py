@@ -0,0 +1,247 @@
+"""
+Compact, memory-mappable binary snapshot of the model catalog.
+
+Layout (little endian, every section 8-byte aligned):
+
+    header   magic, format version, entry count, sha256 of the source JSON,
+             section count
+    sections (name, offset, length) table followed by the section payloads:
+             meta          JSON: providers, modes, capabilities, numeric fields
+             names         UTF-8 model names, `name_offsets` (uint32, n + 1)
+             entries       compact JSON per model, `entry_offsets` (uint64, n + 1)
+             provider      int32 provider codes
+             mode          int16 mode codes
+             flags         uint64 capability bitset (n x words)
+             num:<field>   float64 numeric columns
+
+Workers map the file read-only, so the column arrays and entry bytes live in
+the page cache and are shared across forked processes instead of every
+worker holding its own parsed copy. Entries are decoded on access.
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+from collections.abc import Mapping
+
+import numpy as np
+
+from .columns import CatalogColumns
+
+MAGIC = b"LLMGWCAT"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sHHI32sI")
+SECTION = struct.Struct("<32sQQ")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_path_for(json_path: str) -> str:
+    """Default snapshot location next to a catalog JSON file"""
+    return os.path.splitext(json_path)[0] + ".snapshot"
+
+
+def atomic_write(path: str, content: bytes) -> None:
+    """
+    Replace `path` with `content` via a temp file and rename in the same
+    directory, so concurrent readers see either the old or the new file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _blob(values) -> tuple:
+    encoded = [value.encode() for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return b"".join(encoded), offsets
+
+
+def write_snapshot(models: dict, source_hash: str, path: str) -> None:
+    """
+    Write `models` as a snapshot tagged with `source_hash`, the sha256 of
+    the JSON it was built from. The file is replaced atomically.
+    """
+    columns = CatalogColumns.from_models(models)
+    names, name_offsets = _blob(models.keys())
+    entries, entry_offsets = _blob(
+        json.dumps(model, separators=(",", ":")) for model in models.values()
+    )
+    meta = {
+        "providers": list(columns.providers),
+        "modes": list(columns.modes),
+        "capabilities": list(columns.capabilities),
+        "numeric_fields": list(CatalogColumns.NUMERIC_FIELDS),
+        "flag_words": columns.flags.shape[1],
+    }
+
+    sections = [
+        ("meta", json.dumps(meta).encode()),
+        ("names", names),
+        ("name_offsets", name_offsets.astype(np.uint32).tobytes()),
+        ("entries", entries),
+        ("entry_offsets", entry_offsets.tobytes()),
+        ("provider", columns.provider.astype("<i4").tobytes()),
+        ("mode", columns.mode.astype("<i2").tobytes()),
+        ("flags", columns.flags.astype("<u8").tobytes()),
+    ]
+    for field in CatalogColumns.NUMERIC_FIELDS:
+        sections.append(
+            (f"num:{field}", columns.numeric[field].astype("<f8").tobytes())
+        )
+
+    offset = _align(HEADER.size + SECTION.size * len(sections))
+    table, payload = [], bytearray(offset)
+    for name, data in sections:
+        table.append(SECTION.pack(name.encode(), offset, len(data)))
+        payload[offset:] = data
+        offset = _align(offset + len(data))
+        payload.extend(b"\0" * (offset - len(payload)))
+
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, 0, len(models), bytes.fromhex(source_hash), len(sections)
+    )
+    prefix = header + b"".join(table)
+    payload[: len(prefix)] = prefix
+
+    atomic_write(path, payload)
+
+
+def read_snapshot_hash(path: str) -> str:
+    """Source JSON hash recorded in a snapshot header, without mapping it"""
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise SnapshotError(f"{path} is truncated")
+    magic, version, _, _, source_hash, _ = HEADER.unpack(header)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise SnapshotError(
+            f"{path} is not a version {FORMAT_VERSION} catalog snapshot"
+        )
+    return source_hash.hex()
+
+
+class SnapshotModels(Mapping):
+    """
+    Read-only name -> model mapping decoding entries from the mapped file,
+    each once, on first access
+    """
+
+    def __init__(self, names: tuple, entries: memoryview, offsets: np.ndarray) -> None:
+        self._names = names
+        self._row_by_name = {name: row_id for row_id, name in enumerate(names)}
+        self._entries = entries
+        self._offsets = offsets
+        self._decoded = {}
+
+    def __getitem__(self, name: str) -> dict:
+        model = self._decoded.get(name)
+        if model is None:
+            row_id = self._row_by_name[name]
+            start, end = int(self._offsets[row_id]), int(self._offsets[row_id + 1])
+            model = self._decoded.setdefault(
+                name, json.loads(self._entries[start:end].tobytes())
+            )
+        return model
+
+    def __contains__(self, name) -> bool:
+        return name in self._row_by_name
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+class CatalogSnapshot:
+    """A mapped snapshot file: lazy `models`, zero-copy `columns`"""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+        if len(buffer) < HEADER.size:
+            raise SnapshotError(f"{path} is truncated")
+
+        magic, version, _, count, source_hash, section_count = HEADER.unpack_from(
+            buffer
+        )
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise SnapshotError(
+                f"{path} is not a version {FORMAT_VERSION} catalog snapshot"
+            )
+        self.version = source_hash.hex()
+        self.size = count
+
+        sections = {}
+        for position in range(section_count):
+            name, offset, length = SECTION.unpack_from(
+                buffer, HEADER.size + SECTION.size * position
+            )
+            if offset + length > len(buffer):
+                raise SnapshotError(f"{path} is truncated")
+            sections[name.rstrip(b"\0").decode()] = (offset, length)
+
+        def array(name, dtype, shape=None):
+            offset, length = sections[name]
+            values = np.frombuffer(
+                buffer,
+                dtype=dtype,
+                count=length // np.dtype(dtype).itemsize,
+                offset=offset,
+            )
+            return values.reshape(shape) if shape else values
+
+        def raw(name):
+            offset, length = sections[name]
+            return buffer[offset : offset + length]
+
+        meta = json.loads(raw("meta").tobytes())
+        missing = set(CatalogColumns.NUMERIC_FIELDS) - set(meta["numeric_fields"])
+        if missing:
+            raise SnapshotError(f"{path} lacks columns {sorted(missing)}")
+        name_offsets = array("name_offsets", "<u4")
+        names_blob = raw("names").tobytes()
+        self.names = tuple(
+            names_blob[name_offsets[i] : name_offsets[i + 1]].decode()
+            for i in range(count)
+        )
+        self.models = SnapshotModels(
+            self.names, raw("entries"), array("entry_offsets", "<u8")
+        )
+
+        providers = tuple(meta["providers"])
+        provider = array("provider", "<i4")
+        self.row_providers = [
+            providers[code] if code >= 0 else None for code in provider.tolist()
+        ]
+        self.columns = CatalogColumns(
+            providers=providers,
+            provider=provider,
+            numeric={
+                field: array(f"num:{field}", "<f8") for field in meta["numeric_fields"]
+            },
+            modes=tuple(meta["modes"]),
+            mode=array("mode", "<i2"),
+            capabilities=tuple(meta["capabilities"]),
+            flags=array("flags", "<u8", (count, meta["flag_words"])),
+        )
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from functools import cached_property
+from types import MappingProxyType
+
+import requests
+from django.conf import settings
+
+from .columns import CatalogColumns
+from .index import CatalogIndex
+from .snapshot import (
+    CatalogSnapshot,
+    SnapshotError,
+    read_snapshot_hash,
+    snapshot_path_for,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "generate",
+    "data",
+    "models_list.json",
+)
+
+
+class Catalog:
+    """
+    Immutable view of a single version of the model catalog.
+
+    `version` is the sha256 of the raw catalog JSON, so two processes that
+    loaded the same content (from JSON or from its snapshot) always agree on it.
+    """
+
+    def __init__(
+        self,
+        models: dict,
+        version: str,
+        source: str,
+        snapshot: CatalogSnapshot = None,
+    ) -> None:
+        self.models = MappingProxyType(models)
+        self.version = version
+        self.source = source
+        self.snapshot = snapshot
+        self.loaded_at = time.time()
+
+    def __contains__(self, model_name: str) -> bool:
+        return model_name in self.models
+
+    def __getitem__(self, model_name: str) -> dict:
+        return self.models[model_name]
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+    @cached_property
+    def index(self) -> CatalogIndex:
+        """Query index, built lazily once for this catalog version"""
+        if self.snapshot is not None:
+            return CatalogIndex(self.snapshot.names, self.snapshot.row_providers)
+        return CatalogIndex.from_models(self.models)
+
+    @cached_property
+    def columns(self) -> CatalogColumns:
+        """Numeric/capability columns, built lazily once for this catalog version"""
+        if self.snapshot is not None:
+            return self.snapshot.columns
+        return CatalogColumns.from_models(self.models)
+
+
+class ModelCatalogStore:
+    """
+    Process-local model catalog.
+
+    The catalog is read from disk once and swapped atomically whenever the
+    file's mtime/size and then its content hash change. When a binary
+    snapshot built from the same content exists it is memory-mapped instead
+    of parsing the JSON; a missing or stale snapshot falls back to JSON.
+    Lookups never do network I/O; an optional daemon thread can pull a
+    remote copy on an interval and swap it in the same way.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        check_interval: float = 5,
+        remote_url: str = None,
+        remote_refresh_interval: float = 3600,
+        snapshot_path: str = None,
+    ) -> None:
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.check_interval = check_interval
+        self.remote_url = remote_url
+        self.remote_refresh_interval = remote_refresh_interval
+
+        self._catalog = None
+        self._file_signature = None
+        self._file_hash = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._remote_thread = None
+
+    def get(self) -> Catalog:
+        """Return the current catalog, reloading it if the file changed"""
+        catalog = self._catalog
+        if catalog is None or time.monotonic() >= self._next_check:
+            self.reload()
+            catalog = self._catalog
+        return catalog
+
+    def reload(self, force: bool = False) -> Catalog:
+        """Reload the catalog file if its signature or content changed"""
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                stat = os.stat(self.path)
+            except OSError as e:
+                if self._catalog is None:
+                    raise
+                logger.warning(f"Model catalog {self.path} is unreadable: {e}")
+                return self._catalog
+
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if not force and signature == self._file_signature:
+                return self._catalog
+
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            content_hash = hashlib.sha256(raw).hexdigest()
+            self._file_signature = signature
+            if not force and content_hash == self._file_hash:
+                return self._catalog
+
+            snapshot = self._load_snapshot(content_hash)
+            if snapshot is not None:
+                self._file_hash = content_hash
+                self._catalog = Catalog(
+                    snapshot.models, content_hash, self.snapshot_path, snapshot
+                )
+                logger.info(
+                    f"Mapped model catalog {content_hash[:12]} ({snapshot.size} models) from {self.snapshot_path}"
+                )
+                return self._catalog
+
+            try:
+                models = self._parse(raw)
+            except ValueError as e:
+                if self._catalog is None:
+                    raise
+                logger.error(f"Ignoring invalid model catalog {self.path}: {e}")
+                return self._catalog
+
+            self._file_hash = content_hash
+            self._swap(models, content_hash, self.path)
+            return self._catalog
+
+    def _load_snapshot(self, content_hash: str):
+        """Map the snapshot if it was built from `content_hash`, else None"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            if read_snapshot_hash(self.snapshot_path) != content_hash:
+                logger.info(
+                    f"Ignoring stale model catalog snapshot {self.snapshot_path}"
+                )
+                return None
+            return CatalogSnapshot(self.snapshot_path)
+        except (OSError, SnapshotError, KeyError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable catalog snapshot: {e}")
+            return None
+
+    def refresh_from_remote(self) -> bool:
+        """Fetch the remote catalog and swap it in when its content differs"""
+        response = requests.get(self.remote_url, timeout=10)
+        response.raise_for_status()
+        raw = response.content
+        content_hash = hashlib.sha256(raw).hexdigest()
+
+        current = self._catalog
+        if current is not None and current.version == content_hash:
+            return False
+
+        models = self._parse(raw)
+        with self._lock:
+            self._swap(models, content_hash, self.remote_url)
+        return True
+
+    def start_remote_refresh(self) -> None:
+        """Start the background remote refresh thread (idempotent)"""
+        if not self.remote_url or self._remote_thread is not None:
+            return
+        self._remote_thread = threading.Thread(
+            target=self._remote_refresh_loop,
+            name="model-catalog-refresh",
+            daemon=True,
+        )
+        self._remote_thread.start()
+
+    def _remote_refresh_loop(self) -> None:
+        while True:
+            time.sleep(self.remote_refresh_interval)
+            try:
+                self.refresh_from_remote()
+            except Exception as e:
+                logger.warning(f"Remote model catalog refresh failed: {e}")
+
+    def _swap(self, models: dict, version: str, source: str) -> None:
+        self._catalog = Catalog(models, version, source)
+        logger.info(
+            f"Loaded model catalog {version[:12]} ({len(models)} models) from {source}"
+        )
+
+    @staticmethod
+    def _parse(raw: bytes) -> dict:
+        models = json.loads(raw)
+        if not isinstance(models, dict):
+            raise ValueError("Model catalog must be a JSON object")
+        models.pop("sample_spec", None)
+        return models
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_catalog_store() -> ModelCatalogStore:
+    """Return the process-wide catalog store, creating it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                path = getattr(settings, "MODEL_CATALOG_PATH", DEFAULT_CATALOG_PATH)
+                store = ModelCatalogStore(
+                    path=path,
+                    check_interval=getattr(settings, "MODEL_CATALOG_CHECK_INTERVAL", 5),
+                    remote_url=getattr(settings, "MODEL_CATALOG_REMOTE_URL", None),
+                    remote_refresh_interval=getattr(
+                        settings, "MODEL_CATALOG_REMOTE_REFRESH_INTERVAL", 3600
+                    ),
+                    snapshot_path=getattr(
+                        settings, "MODEL_CATALOG_SNAPSHOT_PATH", snapshot_path_for(path)
+                    ),
+                )
+                store.reload()
+                store.start_remote_refresh()
+                _store = store
+    return _store
+
+
+def get_catalog() -> Catalog:
+    return get_catalog_store().get()
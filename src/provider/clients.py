@@ -0,0 +1,187 @@
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from provider.generate import BaseLLM, LLM_Factory
+from provider.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def credential_hash(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+def open_connections(llm: BaseLLM) -> int:
+    """Connections held by the httpx pools of a provider client, if any"""
+    count = 0
+    for attribute in ("client", "async_client"):
+        http_client = getattr(getattr(llm, attribute, None), "_client", None)
+        pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+        count += len(getattr(pool, "connections", ()))
+    return count
+
+
+class ClientPool:
+    """
+    Registry of provider clients keyed by (provider, hash of the API key).
+
+    Clients and their HTTP connection pools are reused across requests. The
+    registry is bounded: the least recently used client is evicted beyond
+    `max_size`, and clients unused for `idle_timeout` seconds are closed.
+    Clients are leased (`lease`, or `acquire` and `release`): one evicted
+    while leased is closed when its last lease ends, and a leased client
+    is never idle. Pooled clients are shared, so callers must not change
+    their `api_key`.
+    """
+
+    def __init__(self, max_size: int = 256, idle_timeout: float = 300) -> None:
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._clients = OrderedDict()
+        self._last_used = {}
+        # Leases held, by client id, and leased clients no longer pooled
+        self._leases = {}
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lease(self, provider: str, api_key: str):
+        """The pooled client for (provider, api_key), held for the block"""
+        llm = self.acquire(provider, api_key)
+        try:
+            yield llm
+        finally:
+            self.release(llm)
+
+    def acquire(self, provider: str, api_key: str) -> BaseLLM:
+        """Lease the pooled client; it must be given back with `release`"""
+        key = (provider, credential_hash(api_key or ""))
+        now = time.monotonic()
+        with self._lock:
+            stale = self._expire(now)
+            llm = self._clients.get(key)
+            if llm is not None:
+                self._clients.move_to_end(key)
+                self._last_used[key] = now
+                self._leases[id(llm)] = self._leases.get(id(llm), 0) + 1
+        self._close(stale)
+        if llm is not None:
+            metrics.incr("client_pool.hits")
+            return llm
+
+        metrics.incr("client_pool.misses")
+        llm = LLM_Factory(provider)
+        llm.api_key = api_key
+
+        evicted = []
+        with self._lock:
+            existing = self._clients.get(key)
+            if existing is not None:
+                # Another request built the same client meanwhile
+                evicted.append(llm)
+                llm = existing
+            else:
+                self._clients[key] = llm
+                while len(self._clients) > self.max_size:
+                    old_key, old_llm = self._clients.popitem(last=False)
+                    self._last_used.pop(old_key, None)
+                    evicted.extend(self._retire(old_llm))
+                    metrics.incr("client_pool.evictions")
+            self._last_used[key] = now
+            self._leases[id(llm)] = self._leases.get(id(llm), 0) + 1
+        self._close(evicted)
+        return llm
+
+    def release(self, llm: BaseLLM) -> None:
+        """End a lease from `acquire`"""
+        closing = []
+        with self._lock:
+            leases = self._leases.pop(id(llm)) - 1
+            if leases:
+                self._leases[id(llm)] = leases
+            elif id(llm) in self._retired:
+                closing.append(self._retired.pop(id(llm)))
+            else:
+                # Idle from now on
+                now = time.monotonic()
+                for key, pooled in self._clients.items():
+                    if pooled is llm:
+                        self._clients.move_to_end(key)
+                        self._last_used[key] = now
+                        break
+        self._close(closing)
+
+    def _retire(self, llm: BaseLLM) -> list:
+        """
+        Clients to close for `llm` leaving the pool: none while it is
+        leased, its last `release` closes it then (lock held)
+        """
+        if id(llm) in self._leases:
+            self._retired[id(llm)] = llm
+            return []
+        return [llm]
+
+    def _expire(self, now: float) -> list:
+        """Pop clients idle for longer than `idle_timeout` (lock held)"""
+        stale = []
+        for key in list(self._clients):
+            if now - self._last_used[key] < self.idle_timeout:
+                break
+            if id(self._clients[key]) in self._leases:
+                # In use, so not idle
+                continue
+            stale.append(self._clients.pop(key))
+            del self._last_used[key]
+            metrics.incr("client_pool.expirations")
+        return stale
+
+    def _close(self, clients: list) -> None:
+        for llm in clients:
+            try:
+                llm.close()
+            except Exception as e:
+                logger.warning(f"Failed to close provider client: {e}")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            clients = list(self._clients.values()) + list(self._retired.values())
+            self._clients.clear()
+            self._last_used.clear()
+            self._retired.clear()
+        self._close(clients)
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def open_connections(self) -> int:
+        with self._lock:
+            clients = list(self._clients.values()) + list(self._retired.values())
+        return sum(open_connections(llm) for llm in clients)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_client_pool() -> ClientPool:
+    """Return the process-wide client pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ClientPool(
+                    max_size=getattr(settings, "PROVIDER_CLIENT_POOL_SIZE", 256),
+                    idle_timeout=getattr(settings, "PROVIDER_CLIENT_IDLE_TIMEOUT", 300),
+                )
+                metrics.gauge("client_pool.size", pool.__len__)
+                metrics.gauge("client_pool.open_connections", pool.open_connections)
+                atexit.register(pool.shutdown)
+                _pool = pool
+    return _pool
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from provider.metrics import metrics
+
+CACHE_ALIAS = "completions"
+CACHE_MODES = ("bypass", "read", "write")
+# Request fields that change the completion and so are part of the key
+GENERATION_PARAMS = (
+    "temperature",
+    "top_p",
+    "max_tokens",
+    "stop",
+    "n",
+    "seed",
+    "presence_penalty",
+    "frequency_penalty",
+    "response_format",
+    "tools",
+    "tool_choice",
+)
+
+
+def parse_cache_options(body: dict) -> tuple:
+    """
+    Read the `cache` mode and `cache_ttl` (seconds) of a request.
+
+    - bypass: neither read nor store
+    - read: serve a cached response, otherwise call upstream and store it
+    - write: always call upstream and store (refresh) the response
+    """
+    mode = body.get("cache") or getattr(
+        settings, "COMPLETION_CACHE_DEFAULT_MODE", "bypass"
+    )
+    if mode not in CACHE_MODES:
+        raise ValueError(f"'cache' must be one of: {', '.join(CACHE_MODES)}")
+
+    ttl = body.get("cache_ttl")
+    if ttl is None:
+        ttl = getattr(settings, "COMPLETION_CACHE_TTL", 3600)
+    try:
+        ttl = int(ttl)
+    except (TypeError, ValueError):
+        raise ValueError("'cache_ttl' must be an integer")
+    if ttl <= 0:
+        raise ValueError("'cache_ttl' must be positive")
+    return mode, min(ttl, getattr(settings, "COMPLETION_CACHE_MAX_TTL", 86400))
+
+
+def canonical_messages(messages) -> list:
+    """Messages with fields in a fixed order and unset fields dropped"""
+    if not isinstance(messages, list):
+        return messages
+    return [
+        (
+            {key: value for key, value in sorted(message.items()) if value is not None}
+            if isinstance(message, dict)
+            else message
+        )
+        for message in messages
+    ]
+
+
+def generation_params(body: dict) -> dict:
+    return {key: body[key] for key in GENERATION_PARAMS if body.get(key) is not None}
+
+
+def completion_cache_key(owner, model_name: str, messages, params: dict) -> str:
+    """Hash of the owner, model, normalized messages and generation params"""
+    payload = json.dumps(
+        {
+            "model": model_name,
+            "messages": canonical_messages(messages),
+            "params": params,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    digest = hashlib.sha256(f"{owner}:{payload}".encode()).hexdigest()
+    return f"completion_{digest}"
+
+
+def get_cached_completion(cache_key: str):
+    raw = caches[CACHE_ALIAS].get(cache_key)
+    if raw is None:
+        metrics.incr("completion_cache.misses")
+        return None
+    metrics.incr("completion_cache.hits")
+    return json.loads(zlib.decompress(raw))
+
+
+def set_cached_completion(cache_key: str, response: dict, ttl: int) -> None:
+    """Store a `model_dump()` response as compressed compact JSON"""
+    raw = zlib.compress(json.dumps(response, separators=(",", ":")).encode())
+    caches[CACHE_ALIAS].set(cache_key, raw, timeout=ttl)
+    metrics.incr("completion_cache.writes")
@@ -0,0 +1,97 @@
+"""
+Request deadlines.
+
+A request's timeout comes from its `X-Request-Timeout` header, in seconds.
+Without the header it is the default of its model (DEADLINE_MODEL_DEFAULTS,
+else DEADLINE_DEFAULT). Either way it is capped at DEADLINE_MAX.
+
+The resulting deadline is held in a context variable while the request is
+served. Credential lookups, provider calls, retries and fallbacks therefore
+use whatever time is left without the deadline being passed around:
+
+- provider calls get the time left as their timeout;
+- a retry whose backoff would outlast the deadline is not made;
+- no new attempt starts once the deadline has passed.
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+HEADER = "X-Request-Timeout"
+DEFAULT_CALL_TIMEOUT = 30
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    def __init__(self, message: str = "The request deadline was exceeded.") -> None:
+        super().__init__(message)
+
+
+def model_timeout(model_name: str) -> float:
+    """Default timeout of requests for `model_name`"""
+    return getattr(settings, "DEADLINE_MODEL_DEFAULTS", {}).get(
+        model_name, getattr(settings, "DEADLINE_DEFAULT", 60)
+    )
+
+
+def parse_timeout(headers, default: float) -> float:
+    """Timeout of a request in seconds: its header, else `default`"""
+    value = headers.get(HEADER)
+    if value is None:
+        timeout = default
+    else:
+        try:
+            timeout = float(value)
+        except ValueError:
+            timeout = 0
+        if not 0 < timeout < float("inf"):
+            raise ValueError(f"'{HEADER}' must be a positive number of seconds.")
+    return min(timeout, getattr(settings, "DEADLINE_MAX", 300))
+
+
+@contextmanager
+def deadline_scope(deadline: float = None):
+    """
+    Run the block under `deadline` (a `time.monotonic()` time), or under
+    the one `set_deadline` gives within it
+    """
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def set_deadline(deadline: float) -> None:
+    """Set the deadline of the enclosing `deadline_scope`"""
+    _deadline.set(deadline)
+
+
+def remaining():
+    """Seconds left before the current deadline, or None without one"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check() -> None:
+    if expired():
+        raise DeadlineExceeded()
+
+
+def call_timeout(default: float = DEFAULT_CALL_TIMEOUT) -> float:
+    """Timeout for one provider call: the time left, else `default`"""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left
@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 
 class BaseLLM(ABC):
@@ -17,4 +18,12 @@ class BaseLLM(ABC):
 
     @abstractmethod
     def completion(self, model_name: str, messages: list) -> dict:
-        pass
\ No newline at end of file
+        pass
+
+    async def acompletion(self, model_name: str, messages: list) -> dict:
+        """Non-streaming completion without blocking the event loop"""
+        return await asyncio.to_thread(self.completion, model_name, messages)
+
+    def close(self) -> None:
+        """Release network resources held by the client"""
+        pass
@@ -1,33 +1,75 @@
-from litellm import completion
+import inspect
+
+from litellm import acompletion, completion
+from provider.deadlines import call_timeout
 from .base import BaseLLM
 
+
+async def close_stream(response) -> None:
+    """Release the upstream connection of a stream left before its end"""
+    for stream in (response, getattr(response, "completion_stream", None)):
+        close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+        if close is None:
+            continue
+        try:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            pass
+        return
+
 class Litellm(BaseLLM):
     def __init__(self):
         super().__init__()
 
     def completion(self, model_name: str, messages: list) -> dict:
+        timeout = call_timeout()
         try:
             response = completion(
                 model=model_name,
                 messages=messages,
                 api_key=self._api_key,
-                timeout=30
+                timeout=timeout
             )
             return response.model_dump()
         except Exception as e:
-            raise Exception(f"LiteLLM completion error: {str(e)}")
+            raise Exception(f"LiteLLM completion error: {str(e)}") from e
         
     
+    async def acompletion(self, model_name: str, messages: list) -> dict:
+        timeout = call_timeout()
+        try:
+            response = await acompletion(
+                model=model_name,
+                messages=messages,
+                api_key=self._api_key,
+                timeout=timeout
+            )
+            return response.model_dump()
+        except Exception as e:
+            raise Exception(f"LiteLLM completion error: {str(e)}") from e
+
     async def async_completion(self, model_name: str, messages: list):
+        timeout = call_timeout()
+        response = None
         try:
-            response = completion(
+            response = await acompletion(
                 model=model_name,
                 messages=messages,
                 api_key=self._api_key,
-                stream=True
+                stream=True,
+                # Reported with the last chunk, for the usage ledger
+                stream_options={"include_usage": True},
+                drop_params=True,
+                timeout=timeout
             )
-            for chunk in response:
+            async for chunk in response:
                 yield chunk
         except Exception as e:
-            raise Exception(f"LiteLLM async completion error: {str(e)}")
+            raise Exception(f"LiteLLM async completion error: {str(e)}") from e
+        finally:
+            # Cancelled or closed early (client gone): stop the generation
+            if response is not None:
+                await close_stream(response)
         
@@ -1,11 +1,18 @@
+import asyncio
+import threading
+
+from provider.deadlines import call_timeout
 from .base import BaseLLM
-from krutrim_cloud import KrutrimCloud
+from krutrim_cloud import AsyncKrutrimCloud, KrutrimCloud
 
 
 class OlaKrutrim(BaseLLM):
     def __init__(self) -> None:
         super().__init__()
         self.client = None
+        # Event loop -> its async client and the task that closes it
+        self._async_clients = {}
+        self._lock = threading.Lock()
     
     @property
     def api_key(self) -> str:
@@ -15,28 +22,83 @@ class OlaKrutrim(BaseLLM):
     def api_key(self, api_key: str) -> None:
         self._api_key = api_key
         self.client = KrutrimCloud(api_key=api_key)
+        self._close_async_clients()
 
     def completion(self, model_name: str, messages: list) -> dict:
         if not self.client:
             raise Exception("Client is not initialized. Please set the API key.")
+        timeout = call_timeout()
         try:
             response = self.client.chat.completions.create(
-                model=model_name, messages=messages
+                model=model_name, messages=messages, timeout=timeout
             )
             return response.model_dump()
         except Exception as e:
-            raise Exception(f"Ola Krutrim completion error: {str(e)}")
+            raise Exception(f"Ola Krutrim completion error: {str(e)}") from e
+
+    def get_async_client(self) -> AsyncKrutrimCloud:
+        """
+        Async client bound to the running event loop, reused within it.
+
+        Each client is held by a task on its loop, which closes the client
+        when the task is cancelled: by `close()`, or by the loop shutting
+        down, as the short-lived loops of `async_to_sync` do after each call.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._async_clients.get(loop)
+            if entry is None:
+                client = AsyncKrutrimCloud(api_key=self._api_key)
+                entry = (client, loop.create_task(self._hold(loop, client)))
+                self._async_clients[loop] = entry
+        return entry[0]
+
+    async def _hold(self, loop, client: AsyncKrutrimCloud) -> None:
+        try:
+            await asyncio.Event().wait()
+        finally:
+            with self._lock:
+                if self._async_clients.get(loop, (None,))[0] is client:
+                    del self._async_clients[loop]
+            await client.close()
+
+    def _close_async_clients(self) -> None:
+        with self._lock:
+            entries = list(self._async_clients.items())
+            self._async_clients.clear()
+        for loop, (_, task) in entries:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(task.cancel)
 
-    def async_completion(self, model_name: str, messages: list):
+    def close(self) -> None:
+        if self.client:
+            self.client.close()
+        self._close_async_clients()
+
+    async def acompletion(self, model_name: str, messages: list) -> dict:
         if not self.client:
             raise Exception("Client is not initialized. Please set the API key.")
+        timeout = call_timeout()
         try:
-            response = self.client.chat.completions.create(
+            response = await self.get_async_client().chat.completions.create(
+                model=model_name, messages=messages, timeout=timeout
+            )
+            return response.model_dump()
+        except Exception as e:
+            raise Exception(f"Ola Krutrim completion error: {str(e)}") from e
+
+    async def async_completion(self, model_name: str, messages: list):
+        if not self.client:
+            raise Exception("Client is not initialized. Please set the API key.")
+        timeout = call_timeout()
+        try:
+            # The SDK returns the full completion even with stream=True, so
+            # it is sent as a single chunk
+            response = await self.get_async_client().chat.completions.create(
                 model=model_name,
                 messages=messages,
-                stream=True
+                timeout=timeout,
             )
-            for chunk in response:
-                yield chunk
+            yield response
         except Exception as e:
-            raise Exception(f"Ola Krutrim async completion error: {str(e)}")
+            raise Exception(f"Ola Krutrim async completion error: {str(e)}") from e
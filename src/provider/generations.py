@@ -0,0 +1,204 @@
+"""
+Streamed generations in progress and their cancellation.
+
+Each stream gets a generation id, sent to the client in its first event. A
+generation stops, closing its upstream stream, when the client disconnects
+or asks for it to be cancelled by id. It also stops when the provider goes
+quiet for too long or the stream runs past its deadline. If the cancel
+request reaches a different worker, it is passed on through the shared
+cache. The streaming worker checks the cache (with the async API, so the
+event loop does not wait on it) at most every `poll_interval` seconds
+while chunks arrive.
+
+Savings are estimates. A cancelled generation is assumed to have been
+heading for the recent average length of completed generations of its
+model, counted in chunks (about one token each).
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from provider.deadlines import DeadlineExceeded
+from provider.metrics import metrics
+from provider.routing import DecayedAverage
+
+CACHE_ALIAS = "completions"
+OWNER_TTL = 3600
+LENGTH_HALF_LIFE = 600
+COMPLETED, CANCELLED, DISCONNECTED, FAILED = (
+    "completed",
+    "cancelled",
+    "disconnected",
+    "failed",
+)
+
+
+class Generation:
+    def __init__(self, user_id, poll_interval: float = 0.5) -> None:
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.poll_interval = poll_interval
+        self.model_name = None
+        self.chunks = 0
+        self.cancelled = False
+        self.outcome = None
+        self.loop = asyncio.get_running_loop()
+        self._task = None
+        self._waiting = False
+        self._polled_at = time.monotonic()
+
+    @property
+    def cancel_key(self) -> str:
+        return f"generation_cancel_{self.id}"
+
+    def interrupt(self) -> None:
+        """
+        Cancel from the event loop. A task waiting for the next upstream
+        chunk is interrupted at once. Otherwise the cancellation is seen
+        before that chunk is awaited.
+        """
+        self.cancelled = True
+        if self._waiting and self._task is not None:
+            self._task.cancel()
+
+    async def _cancel_requested(self) -> bool:
+        if self.cancelled:
+            return True
+        now = time.monotonic()
+        if now - self._polled_at >= self.poll_interval:
+            self._polled_at = now
+            if await caches[CACHE_ALIAS].aget(self.cancel_key):
+                self.cancelled = True
+        return self.cancelled
+
+    async def watch(self, stream, idle_timeout: float = None, deadline: float = None):
+        """
+        Items of `stream` until it ends or the generation is cancelled.
+        Raises `TimeoutError` when no item comes for `idle_timeout` seconds
+        and `DeadlineExceeded` at `deadline` (a `time.monotonic()` time).
+        """
+        self._task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        try:
+            while not await self._cancel_requested():
+                limit = loop.time() + idle_timeout if idle_timeout else None
+                if deadline is not None and (limit is None or deadline < limit):
+                    limit = deadline
+                self._waiting = True
+                timeout = asyncio.timeout_at(limit)
+                try:
+                    async with timeout:
+                        item = await anext(stream)
+                except StopAsyncIteration:
+                    return
+                except TimeoutError:
+                    if not timeout.expired():
+                        raise
+                    if deadline is not None and loop.time() >= deadline:
+                        metrics.incr("deadline.stream_exceeded")
+                        raise DeadlineExceeded(
+                            "The stream did not finish before its deadline."
+                        ) from None
+                    metrics.incr("deadline.stream_idle")
+                    raise TimeoutError(
+                        f"The provider sent nothing for {idle_timeout:g}s."
+                    ) from None
+                finally:
+                    self._waiting = False
+                self.chunks += 1
+                yield item
+        except asyncio.CancelledError:
+            if not self.cancelled:
+                # The client went away
+                raise
+            self._task.uncancel()
+        finally:
+            # Closes the upstream stream when it was left before its end
+            await stream.aclose()
+
+
+class Generations:
+    """Generations streaming in this worker, by id"""
+
+    def __init__(self, poll_interval: float = 0.5) -> None:
+        self.poll_interval = poll_interval
+        self._active = {}
+        self._lengths = {}
+        self._lock = threading.Lock()
+
+    async def start(self, user_id) -> Generation:
+        generation = Generation(user_id, self.poll_interval)
+        with self._lock:
+            self._active[generation.id] = generation
+        # Lets the cancel endpoint check ownership from any worker
+        await caches[CACHE_ALIAS].aset(
+            f"generation_{generation.id}", user_id, timeout=OWNER_TTL
+        )
+        metrics.incr("generation.started")
+        return generation
+
+    def cancel(self, generation_id: str, user_id) -> bool:
+        """Cancel a generation of `user_id`; False when there is none"""
+        with self._lock:
+            generation = self._active.get(generation_id)
+        if generation is not None:
+            if generation.user_id != user_id:
+                return False
+            generation.loop.call_soon_threadsafe(generation.interrupt)
+            return True
+        cache = caches[CACHE_ALIAS]
+        if cache.get(f"generation_{generation_id}") != user_id:
+            return False
+        cache.set(f"generation_cancel_{generation_id}", 1, timeout=OWNER_TTL)
+        return True
+
+    async def finish(self, generation: Generation) -> None:
+        with self._lock:
+            self._active.pop(generation.id, None)
+        await caches[CACHE_ALIAS].adelete_many(
+            [f"generation_{generation.id}", generation.cancel_key]
+        )
+        outcome = generation.outcome or DISCONNECTED
+        metrics.incr(f"generation.{outcome}")
+        now = time.monotonic()
+        with self._lock:
+            length = self._lengths.get(generation.model_name)
+            if outcome == COMPLETED:
+                if length is None:
+                    length = self._lengths[generation.model_name] = DecayedAverage(
+                        LENGTH_HALF_LIFE
+                    )
+                length.add(generation.chunks, now)
+                return
+            expected = length.value(now) if length is not None else None
+        if outcome in (CANCELLED, DISCONNECTED) and expected is not None:
+            saved = max(0, round(expected - generation.chunks))
+            metrics.incr("generation.estimated_tokens_saved", saved)
+            metrics.observe("generation.estimated_tokens_saved_per_stop", saved)
+
+    def active_count(self) -> int:
+        return len(self._active)
+
+
+_generations = None
+_generations_lock = threading.Lock()
+
+
+def get_generations() -> Generations:
+    global _generations
+    if _generations is None:
+        with _generations_lock:
+            if _generations is None:
+                generations = Generations(
+                    poll_interval=getattr(
+                        settings, "GENERATION_CANCEL_POLL_INTERVAL", 0.5
+                    )
+                )
+                metrics.gauge("generation.active", generations.active_count)
+                _generations = generations
+    return _generations
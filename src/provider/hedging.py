@@ -0,0 +1,158 @@
+"""
+Hedged non-streaming completions.
+
+The primary attempt runs as usual. If it has not answered once the
+provider's recent latency percentile (per provider and model, from its
+circuit breaker window) has passed, a second attempt goes to the next
+candidate of the route, or to the same model through another key when
+there is no fallback. The first answer wins and the other attempt is
+cancelled.
+
+Hedges are paid from a budget: every hedgeable request earns `budget`
+tokens (e.g. 0.05) and a hedge spends one, which caps the extra upstream
+requests at that fraction of traffic.
+"""
+
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+
+from provider.breakers import get_breakers
+from provider.metrics import metrics
+from provider.retries import RequestBudget
+from provider.routing import Route
+
+
+class Hedger:
+    def __init__(
+        self,
+        budget: float = 0.05,
+        max_tokens: float = 10,
+        percentile: float = 0.95,
+        min_samples: int = 20,
+        default_delay: float = 2,
+        min_delay: float = 0.2,
+    ) -> None:
+        self.budget = RequestBudget(budget, max_tokens)
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def delay(self, provider: str, model_name: str) -> float:
+        """How long the primary attempt gets before a hedge is sent"""
+        quantile = (
+            get_breakers()
+            .get(provider, model_name)
+            .latency_quantile(self.percentile, self.min_samples)
+        )
+        if quantile is None:
+            return self.default_delay
+        return max(self.min_delay, quantile)
+
+    def _deposit(self) -> None:
+        self.budget.deposit()
+        with self._lock:
+            self.requests += 1
+
+    def _spend(self) -> bool:
+        if not self.budget.spend():
+            return False
+        with self._lock:
+            self.hedges += 1
+        return True
+
+    def rate(self) -> float:
+        """Hedges sent per hedgeable request"""
+        return self.hedges / self.requests if self.requests else 0.0
+
+    async def complete(self, route: Route, call) -> tuple:
+        """Like `route.acomplete(call)`, hedging a slow primary attempt"""
+        self._deposit()
+        metrics.incr("hedge.requests")
+        started = time.perf_counter()
+        candidates = route.ordered()
+        primary = asyncio.ensure_future(route.acomplete(call))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait(
+                {primary},
+                timeout=self.delay(candidates[0].provider, candidates[0].model_name),
+            )
+            if done:
+                return primary.result()
+            if not self._spend():
+                metrics.incr("hedge.budget_exhausted")
+                return await primary
+
+            metrics.incr("hedge.sent")
+            # The next candidate first; with a single model the lease picks
+            # another key, as the primary's key has a request in flight
+            hedge_route = Route(candidates[1:] + candidates[:1])
+            hedge = asyncio.ensure_future(hedge_route.acomplete(call))
+            pending, error = {primary, hedge}, None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        self._won(task is hedge, candidates[0], started)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is None:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # Mark the loser's error as retrieved
+                    task.exception()
+
+    def _won(self, hedged: bool, primary, started: float) -> None:
+        latency = time.perf_counter() - started
+        metrics.observe("hedge.latency_seconds", latency)
+        if not hedged:
+            metrics.incr("hedge.primary_won")
+            return
+        metrics.incr("hedge.hedge_won")
+        # The primary was cancelled, so its latency is estimated by the
+        # recent p99 of its provider and model
+        tail = (
+            get_breakers()
+            .get(primary.provider, primary.model_name)
+            .latency_quantile(0.99, self.min_samples)
+        )
+        if tail is not None:
+            metrics.observe("hedge.estimated_saved_seconds", max(0.0, tail - latency))
+
+
+_hedger = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger() -> Hedger:
+    global _hedger
+    if _hedger is None:
+        with _hedger_lock:
+            if _hedger is None:
+                hedger = Hedger(
+                    budget=getattr(settings, "HEDGE_BUDGET", 0.05),
+                    percentile=getattr(settings, "HEDGE_PERCENTILE", 0.95),
+                    min_samples=getattr(settings, "HEDGE_MIN_SAMPLES", 20),
+                    default_delay=getattr(settings, "HEDGE_DEFAULT_DELAY", 2),
+                    min_delay=getattr(settings, "HEDGE_MIN_DELAY", 0.2),
+                )
+                metrics.gauge("hedge.rate", hedger.rate)
+                metrics.gauge(
+                    "hedge.budget_tokens", lambda: round(hedger.budget.tokens, 2)
+                )
+                _hedger = hedger
+    return _hedger
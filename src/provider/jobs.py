@@ -0,0 +1,235 @@
+"""
+Asynchronous completion jobs.
+
+`JobPool.submit` queues a completion and returns its job at once. The job
+then runs on a bounded pool of threads in this worker. The job's state
+(queued, running, succeeded or failed) is kept in the shared cache for
+`result_ttl` seconds, so a poll can be answered by any worker. If the job
+has a callback URL, its final state is POSTed there. The POST is signed
+with `callback_secret` when one is set. Callback URLs must resolve to
+public addresses (unless their host is in `allowed_callback_hosts`). This
+is checked when the job is submitted and again before every delivery
+attempt, and redirects are not followed, so that a caller cannot make the
+gateway POST to internal services.
+
+Each worker lets at most `max_queued` jobs wait. Further submissions are
+rejected rather than queued.
+"""
+
+import hashlib
+import hmac
+import ipaddress
+import json
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+
+from provider.breakers import CircuitOpenError
+from provider.metrics import metrics
+from provider.retries import error_status
+
+CACHE_ALIAS = "completions"
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class CallbackRejected(ValueError):
+    """The callback URL points at an address the gateway must not call"""
+
+
+def check_callback_url(url: str, allowed_hosts=()) -> None:
+    """
+    Raise `ValueError` unless `url` is an http(s) URL whose host resolves
+    only to public addresses or is one of `allowed_hosts`
+    """
+    try:
+        URLValidator(schemes=["http", "https"])(url)
+    except ValidationError:
+        raise ValueError("'callback_url' must be an http(s) URL.") from None
+    parsed = urlsplit(url)
+    if parsed.hostname in allowed_hosts:
+        return
+    try:
+        addresses = socket.getaddrinfo(
+            parsed.hostname, parsed.port or 80, proto=socket.IPPROTO_TCP
+        )
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f"'callback_url' host {parsed.hostname} does not resolve.")
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise CallbackRejected(
+                f"'callback_url' must not point at a private or reserved address "
+                f"({address})."
+            )
+
+
+class JobPool:
+    def __init__(
+        self,
+        workers: int = 8,
+        max_queued: int = 100,
+        result_ttl: int = 3600,
+        callback_timeout: float = 10,
+        callback_attempts: int = 3,
+        callback_secret: str = "",
+        allowed_callback_hosts=(),
+    ) -> None:
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.callback_timeout = callback_timeout
+        self.callback_attempts = callback_attempts
+        self.callback_secret = callback_secret
+        self.allowed_callback_hosts = frozenset(allowed_callback_hosts)
+        self.queued = 0
+        self.running = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="completion-job"
+        )
+        # Slow callback URLs must not hold completion threads
+        self._callbacks = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="completion-job-callback"
+        )
+        self._lock = threading.Lock()
+
+    def submit(self, owner, run, callback_url: str = None) -> dict:
+        """
+        Queue `run()`, which returns the result fields of the job (e.g.
+        `response` and `served_by`). Raises `QueueFull` when too many jobs
+        are waiting.
+        """
+        with self._lock:
+            if self.queued >= self.max_queued:
+                metrics.incr("jobs.rejected")
+                raise QueueFull("Too many completion jobs are queued; retry later.")
+            self.queued += 1
+        job = {"job_id": str(uuid.uuid4()), "status": QUEUED, "created_at": time.time()}
+        self._save(owner, job)
+        metrics.incr("jobs.submitted")
+        self._executor.submit(
+            self._run, owner, dict(job), run, callback_url, time.perf_counter()
+        )
+        return job
+
+    def get(self, job_id: str, owner):
+        """The job's state, or None if it is unknown, expired or not `owner`'s"""
+        stored = caches[CACHE_ALIAS].get(f"job_{job_id}")
+        if stored is None or stored["owner"] != owner:
+            return None
+        return stored["job"]
+
+    def _save(self, owner, job: dict) -> None:
+        caches[CACHE_ALIAS].set(
+            f"job_{job['job_id']}",
+            {"owner": owner, "job": job},
+            timeout=self.result_ttl,
+        )
+
+    def _run(self, owner, job: dict, run, callback_url: str, queued_at: float):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        started = time.perf_counter()
+        metrics.observe("jobs.wait_seconds", started - queued_at)
+        job.update(status=RUNNING, started_at=time.time())
+        self._save(owner, job)
+        try:
+            job.update(run())
+            job["status"] = SUCCEEDED
+        except CircuitOpenError as e:
+            job.update(status=FAILED, status_code=503, error=str(e))
+        except Exception as e:
+            job.update(status=FAILED, status_code=error_status(e), error=str(e))
+        finally:
+            with self._lock:
+                self.running -= 1
+            metrics.observe("jobs.run_seconds", time.perf_counter() - started)
+        metrics.incr(f"jobs.{job['status']}")
+        job["finished_at"] = time.time()
+        if callback_url:
+            job["callback"] = "pending"
+        self._save(owner, job)
+        if callback_url:
+            self._callbacks.submit(self._deliver, owner, job, callback_url)
+
+    def _deliver(self, owner, job: dict, callback_url: str) -> None:
+        """POST the finished job to `callback_url`, retrying failures"""
+        body = json.dumps(
+            {key: value for key, value in job.items() if key != "callback"}
+        )
+        headers = {"Content-Type": "application/json", "X-Job-Id": job["job_id"]}
+        if self.callback_secret:
+            signature = hmac.new(
+                self.callback_secret.encode(), body.encode(), hashlib.sha256
+            ).hexdigest()
+            headers["X-Signature"] = f"sha256={signature}"
+        job["callback"] = "failed"
+        for attempt in range(self.callback_attempts):
+            if attempt:
+                time.sleep(min(30, 2**attempt))
+            try:
+                # Again now: the host may resolve elsewhere than at submission
+                check_callback_url(callback_url, self.allowed_callback_hosts)
+            except CallbackRejected:
+                job["callback"] = "rejected"
+                break
+            except ValueError:
+                continue
+            try:
+                response = requests.post(
+                    callback_url,
+                    data=body,
+                    headers=headers,
+                    timeout=self.callback_timeout,
+                    allow_redirects=False,
+                )
+            except requests.RequestException:
+                continue
+            if response.status_code < 300:
+                job["callback"] = "delivered"
+                break
+            if response.status_code < 500 and response.status_code not in (408, 429):
+                # Rejected by the receiver: retrying would not help
+                break
+        metrics.incr(f"jobs.callbacks_{job['callback']}")
+        self._save(owner, job)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_job_pool() -> JobPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = JobPool(
+                    workers=getattr(settings, "JOB_WORKERS", 8),
+                    max_queued=getattr(settings, "JOB_MAX_QUEUED", 100),
+                    result_ttl=getattr(settings, "JOB_RESULT_TTL", 3600),
+                    callback_timeout=getattr(settings, "JOB_CALLBACK_TIMEOUT", 10),
+                    callback_attempts=getattr(settings, "JOB_CALLBACK_ATTEMPTS", 3),
+                    callback_secret=getattr(settings, "JOB_CALLBACK_SECRET", ""),
+                    allowed_callback_hosts=getattr(
+                        settings, "JOB_CALLBACK_ALLOWED_HOSTS", ()
+                    ),
+                )
+                metrics.gauge("jobs.queue_depth", lambda: pool.queued)
+                metrics.gauge("jobs.running", lambda: pool.running)
+                _pool = pool
+    return _pool
@@ -0,0 +1,312 @@
+"""
+Rotation across a user's API keys for one provider.
+
+Each worker tracks, per stored key, the requests in flight, RPM/TPM token
+buckets (when limits are set) and a cool-down after the provider answered
+429. A `ProviderCredential` stands for the key sent in the request body or
+for the user's stored keys of a provider; `lease()` picks a key at call time
+and `KeyLease` reports the outcome back.
+"""
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+
+from provider import deadlines
+from provider.clients import credential_hash
+from provider.helpers import decrypt_value
+from provider.metrics import metrics
+from provider.models import ProviderAPIKey
+
+SELECTION_POLICIES = ("least_in_flight", "headroom")
+
+
+@dataclass(frozen=True)
+class StoredKey:
+    id: str
+    name: str
+    encrypted_key: str
+    rpm_limit: int
+    tpm_limit: int
+    weight: int
+
+
+def get_stored_keys(user_id, provider: str) -> tuple:
+    """The user's keys for `provider` (cached until keys change)"""
+    cache_key = f"provider_key_pool_{user_id}_{provider}"
+    keys = cache.get(cache_key)
+    if keys is None:
+        keys = tuple(
+            StoredKey(
+                id=str(key["id"]),
+                name=key["name"],
+                encrypted_key=key["api_key"],
+                rpm_limit=key["rpm_limit"],
+                tpm_limit=key["tpm_limit"],
+                weight=key["weight"],
+            )
+            for key in ProviderAPIKey.objects.filter(user_id=user_id, provider=provider)
+            .order_by("created_at")
+            .values("id", "name", "api_key", "rpm_limit", "tpm_limit", "weight")
+        )
+        cache.set(cache_key, keys, timeout=3600)
+    return keys
+
+
+def invalidate_stored_keys(user_id, provider: str) -> None:
+    cache.delete(f"provider_key_pool_{user_id}_{provider}")
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether `error`, or the error it was raised from, is a 429"""
+    while error is not None:
+        if getattr(error, "status_code", None) == 429:
+            return True
+        if "RateLimit" in type(error).__name__:
+            return True
+        error = error.__cause__
+    return False
+
+
+def estimate_tokens(messages) -> int:
+    """Rough prompt size (4 characters per token) used before usage is known"""
+    if not isinstance(messages, list):
+        return 0
+    characters = 0
+    for message in messages:
+        if isinstance(message, dict):
+            characters += len(str(message.get("content") or ""))
+    return characters // 4 + 1
+
+
+class TokenBucket:
+    """`capacity` per minute, refilled continuously; may go into debt"""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.level = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float) -> float:
+        self.level = min(
+            self.capacity,
+            self.level + (now - self.updated_at) * self.capacity / 60,
+        )
+        self.updated_at = now
+        return self.level
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+
+class KeyState:
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.rpm = None
+        self.tpm = None
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.tokens = 0
+
+    def configure(self, key: StoredKey) -> None:
+        if key.rpm_limit and (self.rpm is None or self.rpm.capacity != key.rpm_limit):
+            self.rpm = TokenBucket(key.rpm_limit)
+        elif not key.rpm_limit:
+            self.rpm = None
+        if key.tpm_limit and (self.tpm is None or self.tpm.capacity != key.tpm_limit):
+            self.tpm = TokenBucket(key.tpm_limit)
+        elif not key.tpm_limit:
+            self.tpm = None
+
+    def headroom(self, now: float, tokens: int) -> float:
+        """Fraction of the tightest limit left after this request (1 if unlimited)"""
+        fractions = [1.0]
+        if self.rpm is not None:
+            fractions.append((self.rpm.refill(now) - 1) / self.rpm.capacity)
+        if self.tpm is not None:
+            fractions.append((self.tpm.refill(now) - tokens) / self.tpm.capacity)
+        return min(fractions)
+
+
+class KeyRotator:
+    def __init__(self, policy: str = "least_in_flight", cooldown: float = 60) -> None:
+        self.policy = policy
+        self.cooldown = cooldown
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, keys: tuple, tokens: int = 0) -> StoredKey:
+        """
+        Pick a key for a request of about `tokens` tokens and count it in
+        flight. Ties go to the key that served fewest requests (by weight).
+        """
+        now = time.monotonic()
+        with self._lock:
+            scored = []
+            for key in keys:
+                state = self._states.setdefault(key.id, KeyState())
+                state.configure(key)
+                scored.append((key, state, state.headroom(now, tokens)))
+
+            available = [entry for entry in scored if entry[1].cooldown_until <= now]
+            if not available:
+                # Every key is cooling down: use the one that recovers first
+                metrics.incr("provider_keys.all_cooling")
+                key, state, _ = min(scored, key=lambda entry: entry[1].cooldown_until)
+            elif self.policy == "headroom":
+                key, state, _ = max(
+                    available,
+                    key=lambda entry: (
+                        entry[2] * entry[0].weight,
+                        -entry[1].in_flight,
+                        -entry[1].requests / entry[0].weight,
+                    ),
+                )
+            else:
+                key, state, _ = min(
+                    available,
+                    key=lambda entry: (
+                        entry[1].in_flight / entry[0].weight,
+                        -entry[2],
+                        entry[1].requests / entry[0].weight,
+                    ),
+                )
+
+            state.in_flight += 1
+            state.requests += 1
+            if state.rpm is not None:
+                state.rpm.take(1)
+            if state.tpm is not None:
+                state.tpm.take(tokens)
+        return key
+
+    def release(
+        self, key: StoredKey, estimated_tokens: int, tokens: int = None, error=None
+    ) -> None:
+        with self._lock:
+            state = self._states.setdefault(key.id, KeyState())
+            state.in_flight = max(0, state.in_flight - 1)
+            if tokens is not None:
+                state.tokens += tokens
+                if state.tpm is not None:
+                    # Settle the estimate against the reported usage
+                    state.tpm.take(tokens - estimated_tokens)
+            if error is not None:
+                state.errors += 1
+                if is_rate_limit_error(error):
+                    state.rate_limited += 1
+                    state.cooldown_until = time.monotonic() + self.cooldown
+                    metrics.incr("provider_keys.rate_limited")
+
+    def utilization(self, key: StoredKey) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            state = self._states.get(key.id) or KeyState()
+            state.configure(key)
+            return {
+                "in_flight": state.in_flight,
+                "requests": state.requests,
+                "errors": state.errors,
+                "rate_limited": state.rate_limited,
+                "tokens": state.tokens,
+                "rpm_available": (
+                    round(state.rpm.refill(now), 2) if state.rpm is not None else None
+                ),
+                "tpm_available": (
+                    round(state.tpm.refill(now), 2) if state.tpm is not None else None
+                ),
+                "cooldown_remaining": round(max(0.0, state.cooldown_until - now), 2),
+            }
+
+
+class KeyLease:
+    """A key picked for one upstream call; use as a context manager"""
+
+    def __init__(
+        self, api_key: str, rotator=None, key: StoredKey = None, tokens: int = 0
+    ) -> None:
+        self.api_key = api_key
+        self.key = key
+        self._rotator = rotator
+        self._estimated_tokens = tokens
+        self._usage_tokens = None
+
+    def record_usage(self, response) -> None:
+        usage = response.get("usage") if isinstance(response, dict) else None
+        if isinstance(usage, dict) and usage.get("total_tokens") is not None:
+            self._usage_tokens = usage["total_tokens"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        if self.key is not None:
+            # A cancelled call (e.g. a losing hedge) is not the key's fault
+            error = None if isinstance(exc, asyncio.CancelledError) else exc
+            self._rotator.release(
+                self.key, self._estimated_tokens, self._usage_tokens, error
+            )
+        return False
+
+
+class ProviderCredential:
+    """
+    The API key sent with a request, or the user's stored keys for a
+    provider. Stored keys are only decrypted when a lease picks them.
+    """
+
+    def __init__(self, user_id, provider: str, api_key: str = None) -> None:
+        self.user_id = user_id
+        self.provider = provider
+        self.api_key = api_key
+        self.keys = () if api_key else get_stored_keys(user_id, provider)
+        self._decrypted = {}
+
+    @property
+    def owner(self) -> str:
+        """Identity of the credential owner for request coalescing/dedup"""
+        if self.api_key:
+            return f"{self.user_id}:{credential_hash(self.api_key)}"
+        return f"{self.user_id}:stored"
+
+    def lease(self, messages=None) -> KeyLease:
+        deadlines.check()
+        if self.api_key:
+            return KeyLease(self.api_key)
+        if not self.keys:
+            raise Exception(f"No API key is registered for {self.provider}.")
+        tokens = estimate_tokens(messages)
+        rotator = get_key_rotator()
+        key = rotator.acquire(self.keys, tokens)
+        if key.id not in self._decrypted:
+            try:
+                self._decrypted[key.id] = decrypt_value(key.encrypted_key)
+            except Exception as e:
+                # The lease never starts, so it would never release the key
+                rotator.release(key, tokens, error=e)
+                raise
+        return KeyLease(self._decrypted[key.id], rotator, key, tokens)
+
+
+_rotator = None
+_rotator_lock = threading.Lock()
+
+
+def get_key_rotator() -> KeyRotator:
+    global _rotator
+    if _rotator is None:
+        with _rotator_lock:
+            if _rotator is None:
+                _rotator = KeyRotator(
+                    policy=getattr(
+                        settings, "PROVIDER_KEY_SELECTION", "least_in_flight"
+                    ),
+                    cooldown=getattr(settings, "PROVIDER_KEY_COOLDOWN", 60),
+                )
+    return _rotator
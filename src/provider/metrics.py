@@ -0,0 +1,80 @@
+import random
+import threading
+from collections import defaultdict
+
+RESERVOIR_SIZE = 1024
+
+
+class Timing:
+    """Count/sum/max plus a fixed-size reservoir sample for percentiles"""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(value)
+        else:
+            position = random.randrange(self.count)
+            if position < RESERVOIR_SIZE:
+                self.samples[position] = value
+
+    def summary(self) -> dict:
+        samples = sorted(self.samples)
+
+        def percentile(fraction):
+            if not samples:
+                return None
+            return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else None,
+            "p50": percentile(0.5),
+            "p99": percentile(0.99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """
+    In-process counters, timings and gauges.
+
+    Every worker keeps its own registry; `snapshot()` reports the worker it
+    runs in. Gauges are callables evaluated at snapshot time.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._timings = defaultdict(Timing)
+        self._gauges = {}
+
+    def incr(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            self._timings[name].add(value)
+
+    def gauge(self, name: str, callback) -> None:
+        self._gauges[name] = callback
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(sorted(self._counters.items()))
+            timings = {
+                name: timing.summary() for name, timing in sorted(self._timings.items())
+            }
+        gauges = {name: callback() for name, callback in sorted(self._gauges.items())}
+        return {"counters": counters, "timings": timings, "gauges": gauges}
+
+
+metrics = MetricsRegistry()
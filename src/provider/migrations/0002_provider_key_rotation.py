@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:00
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("provider", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="providerapikey",
+            name="name",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+        migrations.AddField(
+            model_name="providerapikey",
+            name="rpm_limit",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="providerapikey",
+            name="tpm_limit",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="providerapikey",
+            name="weight",
+            field=models.PositiveIntegerField(
+                default=1, validators=[django.core.validators.MinValueValidator(1)]
+            ),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0008_newsletter"),
+        ("provider", "0002_provider_key_rotation"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UsageRecord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("provider", models.CharField(max_length=100)),
+                ("model_name", models.CharField(max_length=255)),
+                ("prompt_tokens", models.PositiveIntegerField(default=0)),
+                ("completion_tokens", models.PositiveIntegerField(default=0)),
+                ("estimated", models.BooleanField(default=False)),
+                (
+                    "cost",
+                    models.DecimalField(
+                        blank=True, decimal_places=12, max_digits=20, null=True
+                    ),
+                ),
+                ("latency_ms", models.FloatField()),
+                ("time_to_first_token_ms", models.FloatField(blank=True, null=True)),
+                ("streamed", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "api_key",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="usage_records",
+                        to="authentication.apikey",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="usage_records",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "created_at"],
+                        name="provider_us_user_id_569118_idx",
+                    ),
+                    models.Index(
+                        fields=["api_key", "created_at"],
+                        name="provider_us_api_key_c6a4e1_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
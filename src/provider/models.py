@@ -1,10 +1,12 @@
+from django.core.validators import MinValueValidator
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
 import uuid
 
 from base.models import BaseModel
 from provider.generate.enum import ProviderEnum
-from authentication.models import AuthUser
+from authentication.models import APIKey, AuthUser
 from provider.helpers import encrypt_value, decrypt_value
 
 # Create your models here.
@@ -15,20 +17,69 @@ class ProviderAPIKey(BaseModel):
     provider = models.CharField(max_length=100, default=ProviderEnum.GROQ.name)
     api_key = models.CharField(max_length=255) 
     slug = models.SlugField(unique=True, blank=True, null=True)
+    name = models.CharField(max_length=100, blank=True, default="")
+    # Optional provider limits of this key, used when rotating between keys
+    rpm_limit = models.PositiveIntegerField(null=True, blank=True)
+    tpm_limit = models.PositiveIntegerField(null=True, blank=True)
+    weight = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
 
     def __str__(self):
         return f"{self.user.username} - {self.provider}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored (encrypted) key to avoid encrypting it twice
+        instance._stored_api_key = instance.__dict__.get("api_key")
+        return instance
+
     def save(self, *args, **kwargs):
-        # Generate slug if not provided
+        # Generate slug if not provided (a user may hold several keys per provider)
         if not self.slug:
-            self.slug = slugify(f"{self.user.username}-{self.provider}")
+            self.slug = slugify(
+                f"{self.user.username}-{self.provider}-{self.id.hex[:8]}"
+            )
 
-        # Encrypt the API key before saving
-        if self.api_key:
+        # Encrypt the API key before saving, unless it is unchanged
+        if self.api_key and self.api_key != getattr(self, "_stored_api_key", None):
             self.api_key = encrypt_value(self.api_key)
 
         super(ProviderAPIKey, self).save(*args, **kwargs)
+        self._stored_api_key = self.api_key
 
     def get_decrypted_api_key(self):
-        return decrypt_value(self.api_key)
\ No newline at end of file
+        return decrypt_value(self.api_key)
+
+class UsageRecord(models.Model):
+    """
+    One upstream completion call: what it consumed and how long it took.
+    Written in batches by `provider.usage.UsageLedger`, so `created_at` is
+    set when the call ended rather than when the row was inserted.
+    """
+
+    user = models.ForeignKey(AuthUser, related_name="usage_records", on_delete=models.CASCADE)
+    # The gateway API key of the request (None in the playground)
+    api_key = models.ForeignKey(
+        APIKey, related_name="usage_records", null=True, blank=True, on_delete=models.SET_NULL
+    )
+    provider = models.CharField(max_length=100)
+    model_name = models.CharField(max_length=255)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    # True when the provider reported no usage and the tokens were counted here
+    estimated = models.BooleanField(default=False)
+    # From the catalog's per-token prices; None for models without a price
+    cost = models.DecimalField(max_digits=20, decimal_places=12, null=True, blank=True)
+    latency_ms = models.FloatField()
+    time_to_first_token_ms = models.FloatField(null=True, blank=True)
+    streamed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "created_at"]),
+            models.Index(fields=["api_key", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.model_name} - {self.created_at}"
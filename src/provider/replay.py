@@ -0,0 +1,450 @@
+"""
+Resumable streams.
+
+A playground stream is produced by a task detached from the request that
+started it. Its framed events go to a replay buffer, which keeps the most
+recent `max_bytes` of them. The buffer lives in memory and is published to
+the shared cache in segments every `publish_interval` seconds, with the
+async cache API so that the event loop never waits on the cache. The cache
+copy stays available for `ttl` seconds after the stream ends.
+
+A client that lost its connection reconnects with the generation id and
+`Last-Event-ID`. It first gets the events it missed, then the live ones.
+In the worker producing the stream these come from memory; any other worker
+polls the cache. No second upstream call is made.
+
+The buffer never holds more than `max_bytes`, in memory or in the cache:
+the oldest events are dropped whether or not every reader has them. A
+resume after dropped events, or a reader that falls that far behind the
+stream, gets `ReplayGap`, which ends its response with an error event.
+A stream that cannot be resumed only keeps the events its reader has yet
+to get.
+
+Only streams started as resumable are published and outlive their
+reader: such a stream nobody reads is cancelled once `grace` seconds pass
+without a reconnect, the upstream call running (and consuming tokens)
+meanwhile. Any other stream is cancelled as soon as its reader is gone.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import caches
+
+from provider.metrics import metrics
+
+CACHE_ALIAS = "completions"
+
+
+class ReplayGap(Exception):
+    """The events after the requested one are no longer buffered"""
+
+
+def _locate(entries, start: int, last_event_id: int):
+    """
+    Index of the first entry after the chunk event `last_event_id`, among
+    `entries` (`(event_id, chunk, frame)`) numbered from `start`. Returns
+    None when that event is not buffered yet.
+    """
+    if last_event_id == 0:
+        if start > 0:
+            raise ReplayGap()
+        return 0
+    for index, (event_id, chunk, _) in enumerate(entries, start):
+        if chunk and event_id == last_event_id:
+            return index + 1
+    if start > 0 and (not entries or entries[0][0] >= last_event_id):
+        raise ReplayGap()
+    return None
+
+
+class ReplayStream:
+    def __init__(
+        self,
+        generation_id: str,
+        user_id,
+        max_bytes: int = 262144,
+        ttl: int = 300,
+        publish_interval: float = 0.5,
+        grace: float = 15,
+        resumable: bool = True,
+    ) -> None:
+        self.generation_id = generation_id
+        self.user_id = user_id
+        self.resumable = resumable
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.publish_interval = publish_interval
+        self.grace = grace
+        # `(event_id, chunk, frame)`: frames other than chunks carry the id
+        # of the chunk before them
+        self.entries = deque()
+        self.start = 0
+        self.size = 0
+        self.last_event_id = 0
+        self.done = False
+        self.listeners = 0
+        self.task = None
+        self.loop = None
+        self._waiters = set()
+        # Position of each connected reader
+        self._cursors = {}
+        self._grace_timer = None
+        self._unpublished = []
+        self._segments = deque()
+        self._shared_size = 0
+        self._published_at = time.monotonic()
+        self._publishing = None
+        self._publish_lock = asyncio.Lock()
+        self._lock = threading.Lock()
+
+    @property
+    def cache_key(self) -> str:
+        return f"replay_{self.generation_id}"
+
+    def _notify(self) -> None:
+        for loop, event in self._waiters:
+            loop.call_soon_threadsafe(event.set)
+        self._waiters.clear()
+
+    def append(self, frame: bytes, event_id: int = None) -> None:
+        """Buffer a frame; `event_id` is given for chunk events"""
+        with self._lock:
+            if event_id is not None:
+                self.last_event_id = event_id
+            entry = (self.last_event_id, event_id is not None, frame)
+            self.entries.append(entry)
+            self.size += len(frame)
+            self._trim()
+            self._unpublished.append(entry)
+            self._notify()
+        if (
+            self.resumable
+            and time.monotonic() - self._published_at >= self.publish_interval
+        ):
+            self._published_at = time.monotonic()
+            if self._publishing is None or self._publishing.done():
+                # Frames appended meanwhile go with the next one
+                self._publishing = self.loop.create_task(self.publish())
+
+    def _trim(self) -> None:
+        """
+        Drop the oldest entries beyond `max_bytes`, and those every reader
+        has already got unless the stream can be resumed.
+        """
+        read = min(self._cursors.values(), default=self.start)
+        while self.entries and (
+            (self.size > self.max_bytes and len(self.entries) > 1)
+            or (not self.resumable and self.start < read)
+        ):
+            self.size -= len(self.entries.popleft()[2])
+            self.start += 1
+
+    def finish(self) -> None:
+        """Mark the stream done; `publish` then writes its final state"""
+        with self._lock:
+            self.done = True
+            self._notify()
+            if self._grace_timer is not None:
+                self._grace_timer.cancel()
+
+    async def publish(self) -> None:
+        """Write the frames buffered since the last call to the cache"""
+        if not self.resumable:
+            return
+        cache = caches[CACHE_ALIAS]
+        async with self._publish_lock:
+            self._published_at = time.monotonic()
+            with self._lock:
+                entries, self._unpublished = self._unpublished, []
+                end = self.start + len(self.entries)
+                done = self.done
+            values, evicted = {}, []
+            if entries:
+                number = self._segments[-1][0] + 1 if self._segments else 0
+                size = sum(len(frame) for _, _, frame in entries)
+                values[f"{self.cache_key}_{number}"] = entries
+                self._segments.append((number, end - len(entries), len(entries), size))
+                self._shared_size += size
+                while self._shared_size > self.max_bytes and len(self._segments) > 1:
+                    number, _, _, size = self._segments.popleft()
+                    self._shared_size -= size
+                    evicted.append(f"{self.cache_key}_{number}")
+            # After its segments, so that readers find every segment it lists
+            values[self.cache_key] = {
+                "user_id": self.user_id,
+                "segments": [segment[:3] for segment in self._segments],
+                "done": done,
+            }
+            await cache.aset_many(values, timeout=self.ttl)
+            if evicted:
+                await cache.adelete_many(evicted)
+
+    def locate(self, last_event_id: int) -> int:
+        """Position to resume after `last_event_id` from"""
+        with self._lock:
+            position = _locate(self.entries, self.start, last_event_id)
+        if position is None:
+            raise ValueError(f"Unknown Last-Event-ID: {last_event_id}.")
+        return position
+
+    async def follow(self, position: int = 0):
+        """
+        Frames from `position` on, live until the stream ends. Raises
+        `ReplayGap` at once when `position` is no longer buffered, and
+        once the stream gets more than `max_bytes` ahead of the reader.
+        """
+        loop = asyncio.get_running_loop()
+        cursor = object()
+        with self._lock:
+            if position < self.start:
+                raise ReplayGap()
+            self._cursors[cursor] = position
+        self._attach()
+        try:
+            while True:
+                event = asyncio.Event()
+                with self._lock:
+                    if position < self.start:
+                        metrics.incr("replay.readers_behind")
+                        raise ReplayGap(
+                            "The client fell too far behind the stream; "
+                            "the events it missed are no longer buffered."
+                        )
+                    end = self.start + len(self.entries)
+                    batch = [
+                        self.entries[index - end][2] for index in range(position, end)
+                    ]
+                    if batch:
+                        position = self._cursors[cursor] = end
+                        self._trim()
+                    finished = self.done
+                    if not batch and not finished:
+                        self._waiters.add((loop, event))
+                if batch:
+                    for frame in batch:
+                        yield frame
+                elif finished:
+                    return
+                else:
+                    await event.wait()
+        finally:
+            with self._lock:
+                del self._cursors[cursor]
+                self._trim()
+            self._detach()
+
+    def _attach(self) -> None:
+        with self._lock:
+            self.listeners += 1
+            if self._grace_timer is not None:
+                self._grace_timer.cancel()
+                self._grace_timer = None
+
+    def _detach(self) -> None:
+        with self._lock:
+            self.listeners -= 1
+            if self.listeners == 0 and not self.done:
+                if self.resumable:
+                    self.loop.call_soon_threadsafe(self._start_grace)
+                else:
+                    self.loop.call_soon_threadsafe(self._abandon)
+
+    def _start_grace(self) -> None:
+        with self._lock:
+            if self.listeners or self.done:
+                return
+            if self._grace_timer is not None:
+                self._grace_timer.cancel()
+            self._grace_timer = self.loop.call_later(self.grace, self._expire)
+
+    def _expire(self) -> None:
+        with self._lock:
+            self._grace_timer = None
+            if self.listeners or self.done:
+                return
+        self.loop.create_task(self._expire_unless_followed())
+
+    async def _expire_unless_followed(self) -> None:
+        if await caches[CACHE_ALIAS].aget(f"{self.cache_key}_reader") is not None:
+            # Followed from another worker
+            self._start_grace()
+            return
+        self._abandon()
+
+    def _abandon(self) -> None:
+        with self._lock:
+            if self.listeners or self.done:
+                return
+        metrics.incr("replay.abandoned")
+        self.task.cancel()
+
+
+class ReplayStreams:
+    """Replay buffers of the streams produced in this worker"""
+
+    def __init__(
+        self,
+        max_bytes: int = 262144,
+        ttl: int = 300,
+        publish_interval: float = 0.5,
+        grace: float = 15,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.publish_interval = publish_interval
+        self.grace = grace
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    async def start(
+        self, generation_id: str, user_id, produce, resumable: bool = True
+    ) -> ReplayStream:
+        """
+        Run `produce(replay)` in a task of its own, which buffers its frames
+        with `replay.append`. Only a `resumable` stream can be resumed.
+        """
+        replay = ReplayStream(
+            generation_id,
+            user_id,
+            max_bytes=self.max_bytes,
+            ttl=self.ttl,
+            publish_interval=self.publish_interval,
+            grace=self.grace,
+            resumable=resumable,
+        )
+
+        async def run():
+            try:
+                await produce(replay)
+            finally:
+                replay.finish()
+                try:
+                    await replay.publish()
+                finally:
+                    with self._lock:
+                        self._streams.pop(generation_id, None)
+
+        with self._lock:
+            self._streams[generation_id] = replay
+        replay.loop = asyncio.get_running_loop()
+        # Makes the owner known to every worker right away
+        await replay.publish()
+        replay.task = replay.loop.create_task(run())
+        return replay
+
+    def owner(self, generation_id: str):
+        with self._lock:
+            replay = self._streams.get(generation_id)
+        if replay is not None:
+            return replay.user_id if replay.resumable else None
+        shared = caches[CACHE_ALIAS].get(f"replay_{generation_id}")
+        return shared["user_id"] if shared is not None else None
+
+    def resume(self, generation_id: str, last_event_id: int):
+        """
+        The frames after `last_event_id`, live until the stream ends.
+        Raises `ReplayGap` or `ValueError` (unknown event) before any frame.
+        """
+        with self._lock:
+            replay = self._streams.get(generation_id)
+        if replay is not None:
+            metrics.incr("replay.resumed_local")
+            return replay.follow(replay.locate(last_event_id))
+        head = caches[CACHE_ALIAS].get(f"replay_{generation_id}")
+        if head is None:
+            raise ReplayGap()
+        position = self._locate_shared(generation_id, head, last_event_id)
+        if position is None and head["done"]:
+            raise ValueError(f"Unknown Last-Event-ID: {last_event_id}.")
+        metrics.incr("replay.resumed_shared")
+        return self._follow_shared(generation_id, last_event_id, position)
+
+    @staticmethod
+    def _shared_segments(generation_id: str, head: dict, position: int) -> dict:
+        """Cache key of each segment of `head` holding entries from `position` on"""
+        return {
+            f"replay_{generation_id}_{number}": (start, count)
+            for number, start, count in head["segments"]
+            if start + count > position
+        }
+
+    @staticmethod
+    def _shared_entries(segments: dict, found: dict, position: int):
+        """Buffered `(index, entry)` from `position` on, of the `found` segments"""
+        for key, (start, _) in segments.items():
+            entries = found.get(key)
+            if entries is None:
+                # Expired or evicted
+                raise ReplayGap()
+            for index, entry in enumerate(entries, start):
+                if index >= position:
+                    yield index, entry
+
+    @staticmethod
+    def _locate_entries(shared: list, last_event_id: int):
+        start = shared[0][0] if shared else 0
+        return _locate([entry for _, entry in shared], start, last_event_id)
+
+    def _locate_shared(self, generation_id: str, head: dict, last_event_id: int):
+        segments = self._shared_segments(generation_id, head, 0)
+        found = caches[CACHE_ALIAS].get_many(list(segments))
+        shared = list(self._shared_entries(segments, found, 0))
+        return self._locate_entries(shared, last_event_id)
+
+    async def _follow_shared(self, generation_id: str, last_event_id: int, position):
+        cache = caches[CACHE_ALIAS]
+        while True:
+            head = await cache.aget(f"replay_{generation_id}")
+            if head is None:
+                raise ReplayGap()
+            segments = self._shared_segments(generation_id, head, position or 0)
+            found = await cache.aget_many(list(segments))
+            shared = list(self._shared_entries(segments, found, position or 0))
+            if position is None:
+                position = self._locate_entries(shared, last_event_id)
+            # Keeps the producer from expiring its grace period
+            await cache.aset(
+                f"replay_{generation_id}_reader",
+                position or 0,
+                timeout=max(1, int(self.grace)),
+            )
+            if position is not None:
+                if head["segments"] and position < head["segments"][0][1]:
+                    raise ReplayGap()
+                for index, (_, _, frame) in shared:
+                    if index >= position:
+                        position = index + 1
+                        yield frame
+            if head["done"]:
+                return
+            await asyncio.sleep(self.publish_interval)
+
+    def buffered_bytes(self) -> int:
+        with self._lock:
+            return sum(replay.size for replay in self._streams.values())
+
+
+_streams = None
+_streams_lock = threading.Lock()
+
+
+def get_replay_streams() -> ReplayStreams:
+    global _streams
+    if _streams is None:
+        with _streams_lock:
+            if _streams is None:
+                streams = ReplayStreams(
+                    max_bytes=getattr(settings, "STREAM_REPLAY_MAX_BYTES", 262144),
+                    ttl=getattr(settings, "STREAM_REPLAY_TTL", 300),
+                    publish_interval=getattr(
+                        settings, "STREAM_REPLAY_PUBLISH_INTERVAL", 0.5
+                    ),
+                    grace=getattr(settings, "STREAM_RESUME_GRACE", 15),
+                )
+                metrics.gauge("replay.buffered_bytes", streams.buffered_bytes)
+                _streams = streams
+    return _streams
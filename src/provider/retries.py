@@ -0,0 +1,264 @@
+"""
+Retries of provider calls.
+
+Errors are classified from the exception (or the exception it was raised
+from): 429s are rate limits, 408/5xx, connection errors and timeouts are
+transient, anything else is permanent and never retried. Retries wait with
+exponential backoff and full jitter, or for the provider's `Retry-After`
+when it sends one. A retry budget shared by the worker (every call earns a
+fraction of a retry) keeps retries from multiplying the load on a provider
+that is already failing. A retry is not made if its backoff would outlast
+the request's deadline.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+
+from provider import deadlines
+from provider.metrics import metrics
+
+RATE_LIMITED, TIMEOUT, TRANSIENT, PERMANENT = (
+    "rate_limited",
+    "timeout",
+    "transient",
+    "permanent",
+)
+RETRYABLE = (RATE_LIMITED, TIMEOUT, TRANSIENT)
+TRANSIENT_ERROR_NAMES = (
+    "APIConnectionError",
+    "ConnectError",
+    "ReadError",
+    "RemoteProtocolError",
+    "ServiceUnavailable",
+    "InternalServerError",
+)
+# Provider SDK errors that may come without a `status_code`
+PERMANENT_ERROR_STATUSES = {
+    "BadRequestError": 400,
+    "AuthenticationError": 401,
+    "PermissionDeniedError": 403,
+    "NotFoundError": 404,
+    "UnprocessableEntityError": 422,
+}
+
+
+def _error_chain(error: BaseException):
+    while error is not None:
+        yield error
+        error = error.__cause__
+
+
+def classify_error(error: BaseException) -> str:
+    for cause in _error_chain(error):
+        # Set on errors rebuilt from an outcome shared by another worker
+        error_kind = getattr(cause, "error_kind", None)
+        if error_kind is not None:
+            return error_kind
+        status_code = getattr(cause, "status_code", None)
+        if isinstance(status_code, int):
+            if status_code == 429:
+                return RATE_LIMITED
+            if status_code == 408:
+                return TIMEOUT
+            if status_code >= 500:
+                return TRANSIENT
+            if status_code >= 400:
+                return PERMANENT
+        name = type(cause).__name__
+        if isinstance(cause, (TimeoutError, asyncio.TimeoutError)) or "Timeout" in name:
+            return TIMEOUT
+        if "RateLimit" in name:
+            return RATE_LIMITED
+        if name in TRANSIENT_ERROR_NAMES:
+            return TRANSIENT
+    return PERMANENT
+
+
+def retry_after(error: BaseException):
+    """Seconds the provider asked to wait (`Retry-After`), if it did"""
+    for cause in _error_chain(error):
+        value = getattr(cause, "retry_after", None)
+        if isinstance(value, (int, float)):
+            return max(0.0, float(value))
+        for headers in (
+            getattr(getattr(cause, "response", None), "headers", None),
+            getattr(cause, "litellm_response_headers", None),
+        ):
+            if not headers:
+                continue
+            try:
+                if headers.get("retry-after-ms"):
+                    return max(0.0, float(headers["retry-after-ms"]) / 1000)
+                value = headers.get("retry-after")
+            except (AttributeError, TypeError, ValueError):
+                continue
+            if not value:
+                continue
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                pass
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+def upstream_status(error: BaseException):
+    """HTTP status of the provider response behind `error`, if there was one"""
+    for cause in _error_chain(error):
+        status_code = getattr(cause, "status_code", None)
+        if isinstance(status_code, int):
+            return status_code
+        status_code = PERMANENT_ERROR_STATUSES.get(type(cause).__name__)
+        if status_code is not None:
+            return status_code
+    return None
+
+
+def error_status(error: BaseException) -> int:
+    """
+    HTTP status to answer with for a provider error that was not retried
+    away. A provider's 4xx is passed on (the request or its key was at
+    fault), except that a rejected provider key is a 400: a 401 would read
+    as a failure to authenticate with the gateway itself.
+    """
+    kind = classify_error(error)
+    if kind != PERMANENT:
+        return {RATE_LIMITED: 429, TIMEOUT: 504, TRANSIENT: 502}[kind]
+    status_code = upstream_status(error)
+    if status_code is None or not 400 <= status_code < 500:
+        return 500
+    return 400 if status_code in (401, 403) else status_code
+
+
+class RequestBudget:
+    """
+    Token bucket of extra requests: each call earns `ratio` tokens (up to
+    `max_tokens`) and each extra request spends one
+    """
+
+    def __init__(
+        self, ratio: float, max_tokens: float = 10, initial: float = 0
+    ) -> None:
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = float(initial)
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.25,
+        max_delay: float = 8,
+        max_retry_after: float = 30,
+        budget: RequestBudget = None,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.budget = budget
+
+    def backoff(self, attempt: int, error: BaseException):
+        """
+        Seconds to wait before retry number `attempt` (1-based) after
+        `error`, or None when the call must not be retried
+        """
+        kind = classify_error(error)
+        if kind not in RETRYABLE or attempt >= self.max_attempts:
+            return None
+        wait = retry_after(error)
+        if wait is not None:
+            # Waiting longer than this is better left to the client
+            return wait if wait <= self.max_retry_after else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _retry(self, attempt: int, error: BaseException):
+        delay = self.backoff(attempt, error)
+        if delay is None:
+            return None
+        left = deadlines.remaining()
+        if left is not None and delay >= left:
+            # The retry could not finish in time
+            metrics.incr("deadline.retries_skipped")
+            return None
+        if self.budget is not None and not self.budget.spend():
+            metrics.incr("retry.budget_exhausted")
+            return None
+        metrics.incr(f"retry.retries.{classify_error(error)}")
+        metrics.observe("retry.backoff_seconds", delay)
+        return delay
+
+    def call(self, fn):
+        """`fn(attempt)`, retried (blocking) while its errors are retryable"""
+        if self.budget is not None:
+            self.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                return fn(attempt)
+            except Exception as e:
+                attempt += 1
+                delay = self._retry(attempt, e)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+
+    async def acall(self, fn):
+        """Like `call`, awaiting `fn(attempt)` and the backoff"""
+        if self.budget is not None:
+            self.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                return await fn(attempt)
+            except Exception as e:
+                attempt += 1
+                delay = self._retry(attempt, e)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_retry_policy() -> RetryPolicy:
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                # Starts full so that a fresh worker can retry at once
+                budget = RequestBudget(
+                    getattr(settings, "RETRY_BUDGET_RATIO", 0.1), initial=10
+                )
+                metrics.gauge("retry.budget_tokens", lambda: round(budget.tokens, 2))
+                _policy = RetryPolicy(
+                    max_attempts=getattr(settings, "RETRY_MAX_ATTEMPTS", 3),
+                    base_delay=getattr(settings, "RETRY_BASE_DELAY", 0.25),
+                    max_delay=getattr(settings, "RETRY_MAX_DELAY", 8),
+                    max_retry_after=getattr(settings, "RETRY_MAX_RETRY_AFTER", 30),
+                    budget=budget,
+                )
+    return _policy
@@ -0,0 +1,434 @@
+"""
+Routing of a completion across equivalent models.
+
+A `Route` holds the requested model followed by its fallbacks, each with
+the credential to call it with. With the "ordered" policy candidates are
+tried in the given order; with "fastest" they are ranked by an
+exponentially time-decayed average of their latency and error rate in this
+worker, with unhealthy candidates kept as a last resort. The next
+candidate is tried once a call has failed beyond the retry policy (for
+streams: before the first chunk) and candidates whose circuit breaker is
+open are skipped. Errors of the request itself (a bad request, a rejected
+key) are raised at once: they would fail on the fallbacks too, or be
+answered by a model the caller did not ask for. They do not count
+against the candidate's health either. No attempt starts past the
+request's deadline.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from provider import deadlines
+from provider.breakers import CircuitOpenError, get_breakers
+from provider.metrics import metrics
+from provider.retries import PERMANENT, RETRYABLE, classify_error, get_retry_policy
+
+ROUTING_POLICIES = ("ordered", "fastest")
+# Below this decayed sample weight a candidate counts as unmeasured
+MIN_WEIGHT = 0.05
+
+
+def should_fall_back(error: BaseException) -> bool:
+    """Whether the next candidate may succeed where `error` failed"""
+    return isinstance(error, CircuitOpenError) or classify_error(error) in RETRYABLE
+
+
+def parse_routing_options(body: dict) -> tuple:
+    """Read the `routing` policy and `fallback_models` list of a request"""
+    policy = body.get("routing") or "ordered"
+    if policy not in ROUTING_POLICIES:
+        raise ValueError(f"'routing' must be one of: {', '.join(ROUTING_POLICIES)}")
+
+    fallback_models = body.get("fallback_models") or []
+    if not isinstance(fallback_models, list) or not all(
+        isinstance(model_name, str) for model_name in fallback_models
+    ):
+        raise ValueError("'fallback_models' must be a list of model names")
+    max_fallbacks = getattr(settings, "ROUTING_MAX_FALLBACKS", 4)
+    if len(fallback_models) > max_fallbacks:
+        raise ValueError(f"At most {max_fallbacks} fallback models can be given")
+    return policy, fallback_models
+
+
+@dataclass(frozen=True)
+class Candidate:
+    model_name: str
+    provider: str
+    credential: object
+
+
+class DecayedAverage:
+    """Average whose samples lose half their weight every `half_life` seconds"""
+
+    def __init__(self, half_life: float) -> None:
+        self.half_life = half_life
+        self.total = 0.0
+        self.weight = 0.0
+        self.updated_at = time.monotonic()
+
+    def _decay(self, now: float) -> None:
+        factor = math.exp2(-(now - self.updated_at) / self.half_life)
+        self.total *= factor
+        self.weight *= factor
+        self.updated_at = now
+
+    def add(self, value: float, now: float) -> None:
+        self._decay(now)
+        self.total += value
+        self.weight += 1
+
+    def value(self, now: float):
+        self._decay(now)
+        if self.weight < MIN_WEIGHT:
+            return None
+        return self.total / self.weight
+
+
+class LatencyTracker:
+    """Per (provider, model) latency and error rate observed by this worker"""
+
+    def __init__(self, half_life: float = 60, max_error_rate: float = 0.5) -> None:
+        self.half_life = half_life
+        self.max_error_rate = max_error_rate
+        self._latency = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self, provider: str, model_name: str, latency: float = None, error=False
+    ) -> None:
+        key = (provider, model_name)
+        now = time.monotonic()
+        with self._lock:
+            if key not in self._errors:
+                self._errors[key] = DecayedAverage(self.half_life)
+                self._latency[key] = DecayedAverage(self.half_life)
+            self._errors[key].add(1.0 if error else 0.0, now)
+            if latency is not None:
+                self._latency[key].add(latency, now)
+
+    def stats(self, provider: str, model_name: str) -> tuple:
+        """`(latency, error_rate)`, each None while unmeasured"""
+        key = (provider, model_name)
+        now = time.monotonic()
+        with self._lock:
+            if key not in self._errors:
+                return None, None
+            return self._latency[key].value(now), self._errors[key].value(now)
+
+    def rank(self, candidates: list) -> list:
+        """
+        Healthy candidates fastest first, then unhealthy ones. Unmeasured
+        candidates come first so that they get measured.
+        """
+
+        def score(candidate):
+            latency, error_rate = self.stats(candidate.provider, candidate.model_name)
+            if latency is None and error_rate is None:
+                return (0, 0.0)
+            error_rate = error_rate or 0.0
+            if error_rate > self.max_error_rate:
+                return (2, error_rate)
+            # Expected time to a successful answer
+            return (1, (latency or 0.0) / (1 - error_rate))
+
+        return sorted(candidates, key=score)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            stats = {
+                f"{provider}/{model_name}": (
+                    self._latency[(provider, model_name)].value(now),
+                    self._errors[(provider, model_name)].value(now),
+                )
+                for provider, model_name in self._errors
+            }
+        return {
+            name: {
+                "latency": round(latency, 4) if latency is not None else None,
+                "error_rate": round(error_rate, 4) if error_rate is not None else None,
+            }
+            for name, (latency, error_rate) in sorted(stats.items())
+        }
+
+
+class Route:
+    def __init__(self, candidates: list, policy: str = "ordered") -> None:
+        self.candidates = candidates
+        self.policy = policy
+
+    @property
+    def primary(self) -> Candidate:
+        return self.candidates[0]
+
+    @property
+    def routed(self) -> bool:
+        """Whether anything other than the requested model may serve"""
+        return len(self.candidates) > 1 or self.policy != "ordered"
+
+    @property
+    def params(self) -> dict:
+        """Routing fields that change the outcome (for request keys)"""
+        if not self.routed:
+            return {}
+        return {
+            "routing": self.policy,
+            "fallback_models": [
+                candidate.model_name for candidate in self.candidates[1:]
+            ],
+        }
+
+    def ordered(self) -> list:
+        if self.policy == "fastest":
+            return get_latency_tracker().rank(self.candidates)
+        return list(self.candidates)
+
+    def expected_latency(self, fraction: float, min_samples: int):
+        """
+        Lowest recent latency at `fraction` among the candidates, or None
+        while any of them has fewer than `min_samples` calls
+        """
+        breakers = get_breakers()
+        latencies = [
+            breakers.get(candidate.provider, candidate.model_name).latency_quantile(
+                fraction, min_samples
+            )
+            for candidate in self.candidates
+        ]
+        if None in latencies:
+            return None
+        return min(latencies)
+
+    def _attempts(self):
+        """
+        Yield `(candidate, breaker)` for the candidates to try, skipping those
+        whose circuit is open. Raises `CircuitOpenError` when every circuit
+        is open.
+        """
+        breakers = get_breakers()
+        rejected = None
+        attempted = False
+        for candidate in self.ordered():
+            deadlines.check()
+            breaker = breakers.get(candidate.provider, candidate.model_name)
+            if not breaker.allow():
+                rejected = rejected or breaker
+                continue
+            if attempted:
+                metrics.incr("routing.fallbacks")
+            attempted = True
+            yield candidate, breaker
+        if not attempted:
+            raise CircuitOpenError(
+                rejected.provider, rejected.model_name, rejected.retry_after()
+            )
+
+    async def _aattempts(self):
+        """`_attempts()` for the event loop"""
+        breakers = get_breakers()
+        rejected = None
+        attempted = False
+        for candidate in self.ordered():
+            deadlines.check()
+            breaker = breakers.get(candidate.provider, candidate.model_name)
+            if not await breaker.aallow():
+                rejected = rejected or breaker
+                continue
+            if attempted:
+                metrics.incr("routing.fallbacks")
+            attempted = True
+            yield candidate, breaker
+        if not attempted:
+            raise CircuitOpenError(
+                rejected.provider, rejected.model_name, rejected.retry_after()
+            )
+
+    def _succeeded(self, candidate: Candidate, breaker, latency: float) -> None:
+        breaker.record(latency=latency)
+        self._track(candidate, latency=latency)
+
+    async def _asucceeded(self, candidate: Candidate, breaker, latency: float) -> None:
+        await breaker.arecord(latency=latency)
+        self._track(candidate, latency=latency)
+
+    def _failed(self, candidate: Candidate, breaker, error: Exception) -> None:
+        if self._counts_against(error):
+            breaker.record(error=error)
+            self._track(candidate, failed=True)
+
+    async def _afailed(self, candidate: Candidate, breaker, error: Exception) -> None:
+        if self._counts_against(error):
+            await breaker.arecord(error=error)
+            self._track(candidate, failed=True)
+
+    def _counts_against(self, error: Exception) -> bool:
+        """Whether `error` says something about the candidate's health"""
+        if deadlines.expired():
+            # Cut short by the request's deadline, which says nothing about
+            # the provider
+            metrics.incr("deadline.exceeded")
+            return False
+        # A permanent error means the request was at fault, not the provider
+        return classify_error(error) != PERMANENT
+
+    def _track(
+        self, candidate: Candidate, latency: float = None, failed: bool = False
+    ) -> None:
+        get_latency_tracker().record(
+            candidate.provider, candidate.model_name, latency=latency, error=failed
+        )
+        if not failed and candidate is not self.primary:
+            metrics.incr("routing.served_by_fallback")
+
+    def _check_retry(self, candidate: Candidate, breaker, attempt: int) -> None:
+        """Stop retrying a candidate whose circuit opened meanwhile"""
+        deadlines.check()
+        if attempt and not breaker.allow():
+            raise CircuitOpenError(
+                candidate.provider, candidate.model_name, breaker.retry_after()
+            )
+
+    async def _acheck_retry(self, candidate: Candidate, breaker, attempt: int) -> None:
+        deadlines.check()
+        if attempt and not await breaker.aallow():
+            raise CircuitOpenError(
+                candidate.provider, candidate.model_name, breaker.retry_after()
+            )
+
+    def complete(self, call) -> tuple:
+        """
+        `(candidate, call(candidate))` for the first candidate that succeeds,
+        retrying each as the retry policy allows; raises the last error if
+        none does
+        """
+        policy = get_retry_policy()
+
+        def attempt_call(candidate, breaker, attempt):
+            self._check_retry(candidate, breaker, attempt)
+            started = time.perf_counter()
+            try:
+                result = call(candidate)
+            except Exception as e:
+                self._failed(candidate, breaker, e)
+                raise
+            self._succeeded(candidate, breaker, time.perf_counter() - started)
+            return result
+
+        error = None
+        for candidate, breaker in self._attempts():
+            try:
+                result = policy.call(
+                    lambda attempt: attempt_call(candidate, breaker, attempt)
+                )
+            except Exception as e:
+                if not should_fall_back(e):
+                    raise
+                error = e
+                continue
+            return candidate, result
+        raise error
+
+    async def acomplete(self, call) -> tuple:
+        """Like `complete`, awaiting `call(candidate)`"""
+        policy = get_retry_policy()
+
+        async def attempt_call(candidate, breaker, attempt):
+            await self._acheck_retry(candidate, breaker, attempt)
+            started = time.perf_counter()
+            try:
+                result = await call(candidate)
+            except Exception as e:
+                await self._afailed(candidate, breaker, e)
+                raise
+            await self._asucceeded(candidate, breaker, time.perf_counter() - started)
+            return result
+
+        error = None
+        async for candidate, breaker in self._aattempts():
+            try:
+                result = await policy.acall(
+                    lambda attempt: attempt_call(candidate, breaker, attempt)
+                )
+            except Exception as e:
+                if not should_fall_back(e):
+                    raise
+                error = e
+                continue
+            return candidate, result
+        raise error
+
+    async def stream(self, open_stream):
+        """
+        Yield `(model_name, chunk)` from the first candidate whose stream
+        `open_stream(candidate)` produces a chunk. Latency is the time to
+        the first chunk; once a chunk is out there is neither retry nor
+        fallback.
+        """
+        policy = get_retry_policy()
+
+        async def open_first(candidate, breaker, attempt):
+            await self._acheck_retry(candidate, breaker, attempt)
+            started = time.perf_counter()
+            stream = open_stream(candidate)
+            try:
+                first_chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                first_chunk = None
+            except asyncio.CancelledError:
+                await stream.aclose()
+                raise
+            except Exception as e:
+                await stream.aclose()
+                await self._afailed(candidate, breaker, e)
+                raise
+            await self._asucceeded(candidate, breaker, time.perf_counter() - started)
+            return stream, first_chunk
+
+        error = None
+        async for candidate, breaker in self._aattempts():
+            try:
+                stream, first_chunk = await policy.acall(
+                    lambda attempt: open_first(candidate, breaker, attempt)
+                )
+            except Exception as e:
+                if not should_fall_back(e):
+                    raise
+                error = e
+                continue
+            if first_chunk is None:
+                return
+            yield candidate.model_name, first_chunk
+            try:
+                async for chunk in stream:
+                    yield candidate.model_name, chunk
+            except Exception as e:
+                await self._afailed(candidate, breaker, e)
+                raise
+            finally:
+                await stream.aclose()
+            return
+        raise error
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_latency_tracker() -> LatencyTracker:
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                tracker = LatencyTracker(
+                    half_life=getattr(settings, "ROUTING_EWMA_HALF_LIFE", 60),
+                    max_error_rate=getattr(settings, "ROUTING_MAX_ERROR_RATE", 0.5),
+                )
+                metrics.gauge("routing.candidates", tracker.snapshot)
+                _tracker = tracker
+    return _tracker
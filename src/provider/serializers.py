@@ -5,18 +5,35 @@ from .models import ProviderAPIKey
 class ProviderAPIKeySerializer(serializers.ModelSerializer):
     class Meta:
         model = ProviderAPIKey
-        fields = ["id", "provider", "created_at"]
+        fields = [
+            "id",
+            "provider",
+            "name",
+            "rpm_limit",
+            "tpm_limit",
+            "weight",
+            "created_at",
+        ]
         read_only_fields = ["id", "created_at"]
 
 
 class ProviderAPIKeyCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProviderAPIKey
-        fields = ["id", "provider", "api_key", "created_at"]
+        fields = [
+            "id",
+            "provider",
+            "api_key",
+            "name",
+            "rpm_limit",
+            "tpm_limit",
+            "weight",
+            "created_at",
+        ]
         read_only_fields = ["id", "created_at"]
 
 
 class ProviderAPIKeyUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProviderAPIKey
-        fields = ["api_key"]
+        fields = ["api_key", "name", "rpm_limit", "tpm_limit", "weight"]
@@ -0,0 +1,209 @@
+"""
+Near-duplicate completion cache.
+
+Messages are normalized (case, whitespace, and dates, times and UUIDs
+masked), split into word shingles and summarized by a MinHash signature. A
+banded LSH index over the signatures returns candidate prompts whose
+estimated Jaccard similarity is then checked against a per-model threshold.
+Everything runs in process; each worker holds its own bounded index.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from provider.metrics import metrics
+
+NUM_PERMUTATIONS = 128
+BANDS = 32
+ROWS = NUM_PERMUTATIONS // BANDS
+SHINGLE_SIZE = 3
+
+_rng = np.random.default_rng(0x11A7E5)
+# Multiply-add hash family over 64-bit shingle hashes (wraps modulo 2**64)
+_MULTIPLIERS = _rng.integers(1, 2**63, NUM_PERMUTATIONS, dtype=np.uint64) | 1
+_INCREMENTS = _rng.integers(0, 2**63, NUM_PERMUTATIONS, dtype=np.uint64)
+
+_MASKS = (
+    (
+        re.compile(
+            r"\b\d{4}-\d{2}-\d{2}(?:[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?"
+            r"(?:z|[+-]\d{2}:?\d{2})?)?\b"
+        ),
+        " <ts> ",
+    ),
+    (re.compile(r"\b\d{1,2}:\d{2}(?::\d{2})?(?:\s?[ap]m)?\b"), " <ts> "),
+    (
+        re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b"),
+        " <id> ",
+    ),
+)
+_TOKEN = re.compile(r"<\w+>|\w+|[^\w\s]")
+
+
+def normalize_messages(messages) -> str:
+    """Lowercased role/content text with volatile values masked"""
+    parts = []
+    for message in messages if isinstance(messages, list) else [messages]:
+        if not isinstance(message, dict):
+            parts.append(str(message))
+            continue
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(
+                part.get("text", "") if isinstance(part, dict) else str(part)
+                for part in content
+            )
+        parts.append(f"{message.get('role', '')}: {content or ''}")
+    text = "\n".join(parts).lower()
+    for pattern, replacement in _MASKS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def shingles(text: str) -> set:
+    tokens = _TOKEN.findall(text)
+    if len(tokens) <= SHINGLE_SIZE:
+        return {" ".join(tokens)}
+    return {
+        " ".join(tokens[position : position + SHINGLE_SIZE])
+        for position in range(len(tokens) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash(text: str) -> np.ndarray:
+    hashes = np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest())
+            for shingle in shingles(text)
+        ),
+        dtype=np.uint64,
+    )
+    return (hashes[:, None] * _MULTIPLIERS + _INCREMENTS).min(axis=0)
+
+
+class SimilarityCache:
+    """
+    LRU-bounded MinHash/LSH index of completions.
+
+    Entries are grouped by scope (owner, model, generation params): lookups
+    only ever match entries of the same scope.
+    """
+
+    def __init__(self, max_entries: int = 5000) -> None:
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _band_keys(self, scope: str, signature: np.ndarray) -> list:
+        return [
+            (scope, band, signature[band * ROWS : (band + 1) * ROWS].tobytes())
+            for band in range(BANDS)
+        ]
+
+    def get(self, scope: str, messages, threshold: float):
+        """Best cached response with similarity >= threshold, and its similarity"""
+        started = time.perf_counter()
+        signature = minhash(normalize_messages(messages))
+        best_id, best_similarity = None, 0.0
+        now = time.monotonic()
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(scope, signature):
+                candidates.update(self._buckets.get(band_key, ()))
+            for entry_id in candidates:
+                entry_signature, _, expires_at = self._entries[entry_id][1:]
+                if expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                similarity = float(np.mean(entry_signature == signature))
+                if similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            response = None
+            if best_id is not None and best_similarity >= threshold:
+                self._entries.move_to_end(best_id)
+                response = self._entries[best_id][2]
+
+        metrics.observe(
+            "similarity_cache.lookup_seconds", time.perf_counter() - started
+        )
+        if candidates:
+            metrics.observe("similarity_cache.best_similarity", best_similarity)
+        if response is None:
+            metrics.incr("similarity_cache.misses")
+            return None, best_similarity
+        metrics.incr("similarity_cache.hits")
+        return json.loads(response), best_similarity
+
+    def set(self, scope: str, messages, response: dict, ttl: int) -> None:
+        signature = minhash(normalize_messages(messages))
+        value = json.dumps(response, separators=(",", ":"))
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (
+                scope,
+                signature,
+                value,
+                time.monotonic() + ttl,
+            )
+            for band_key in self._band_keys(scope, signature):
+                self._buckets.setdefault(band_key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                metrics.incr("similarity_cache.evictions")
+
+    def _remove(self, entry_id: int) -> None:
+        scope, signature, _, _ = self._entries.pop(entry_id)
+        for band_key in self._band_keys(scope, signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def similarity_scope(owner, model_name: str, params: dict) -> str:
+    return hashlib.sha256(
+        json.dumps(
+            [str(owner), model_name, params], sort_keys=True, separators=(",", ":")
+        ).encode()
+    ).hexdigest()
+
+
+def similarity_threshold(model_name: str) -> float:
+    thresholds = getattr(settings, "SIMILARITY_CACHE_THRESHOLDS", {})
+    return thresholds.get(
+        model_name, getattr(settings, "SIMILARITY_CACHE_THRESHOLD", 0.9)
+    )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_similarity_cache():
+    """Process-wide similarity cache, or None when it is disabled"""
+    global _cache
+    if not getattr(settings, "SIMILARITY_CACHE_ENABLED", False):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache = SimilarityCache(
+                    getattr(settings, "SIMILARITY_CACHE_MAX_ENTRIES", 5000)
+                )
+                metrics.gauge("similarity_cache.size", cache.__len__)
+                _cache = cache
+    return _cache
@@ -0,0 +1,282 @@
+"""
+Coalescing of identical in-flight completion requests.
+
+`SingleFlight.do` runs one upstream call per key: concurrent callers in the
+same worker wait on the leader's result (or error). Across workers the
+leader holds a lock in the shared cache and publishes its outcome there;
+callers in other workers poll for it and fall back to their own call if
+the leader disappears. A shared error keeps its kind, upstream status and
+`Retry-After` (`SharedFlightError`), so it is retried, routed and answered
+like the original.
+
+`StreamFlights.subscribe` lets identical streaming requests attach to a
+stream already in progress: chunks are kept for the duration of the
+stream and replayed to late subscribers.
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from provider.metrics import metrics
+from provider.retries import classify_error, retry_after, upstream_status
+
+CACHE_ALIAS = "completions"
+POLL_INTERVAL = 0.05
+RESULT_TTL = 30
+
+
+class SharedFlightError(Exception):
+    """An error of a call made by the leader in another worker"""
+
+    def __init__(
+        self, message: str, kind: str, status_code=None, retry_after=None
+    ) -> None:
+        super().__init__(message)
+        self.error_kind = kind
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_outcome(cls, outcome: dict) -> "SharedFlightError":
+        return cls(
+            outcome["error"],
+            outcome["kind"],
+            outcome.get("status_code"),
+            outcome.get("retry_after"),
+        )
+
+
+class Flight:
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, timeout: float = 120) -> None:
+        self.timeout = timeout
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn) -> tuple:
+        """Return `(fn(), coalesced)`, sharing one call of `fn` per key"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+
+        if not leader:
+            metrics.incr("single_flight.coalesced")
+            if not flight.event.wait(self.timeout):
+                metrics.incr("single_flight.fallbacks")
+                return fn(), False
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result, coalesced = self._do_shared(key, fn)
+            return flight.result, coalesced
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def _do_shared(self, key: str, fn) -> tuple:
+        cache = caches[CACHE_ALIAS]
+        lock_key = f"flight_lock_{key}"
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            flight_id = uuid.uuid4().hex
+            if cache.add(lock_key, flight_id, timeout=self.timeout):
+                metrics.incr("single_flight.leaders")
+                # The outcome is published before the lock is released, so
+                # a waiter never finds neither of them and calls upstream
+                try:
+                    result = fn()
+                except Exception as e:
+                    cache.set(
+                        f"flight_result_{flight_id}",
+                        {
+                            "error": str(e),
+                            "kind": classify_error(e),
+                            "status_code": upstream_status(e),
+                            "retry_after": retry_after(e),
+                        },
+                        timeout=RESULT_TTL,
+                    )
+                    cache.delete(lock_key)
+                    raise
+                except BaseException:
+                    cache.delete(lock_key)
+                    raise
+                cache.set(
+                    f"flight_result_{flight_id}",
+                    {"result": result},
+                    timeout=RESULT_TTL,
+                )
+                cache.delete(lock_key)
+                return result, False
+
+            # Another worker holds the flight: wait for its outcome
+            flight_id = cache.get(lock_key)
+            if flight_id is None:
+                continue
+            metrics.incr("single_flight.coalesced_remote")
+            while time.monotonic() < deadline:
+                outcome = cache.get(f"flight_result_{flight_id}")
+                if outcome is not None:
+                    if "error" in outcome:
+                        raise SharedFlightError.from_outcome(outcome)
+                    return outcome["result"], True
+                if cache.get(lock_key) != flight_id:
+                    # The leader stopped without publishing; check once more
+                    outcome = cache.get(f"flight_result_{flight_id}")
+                    if outcome is not None:
+                        if "error" in outcome:
+                            raise SharedFlightError.from_outcome(outcome)
+                        return outcome["result"], True
+                    break
+                time.sleep(POLL_INTERVAL)
+
+        metrics.incr("single_flight.fallbacks")
+        return fn(), False
+
+
+class StreamBroadcast:
+    """One upstream stream fanned out to any number of subscribers"""
+
+    def __init__(self) -> None:
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self.loop = None
+        self._waiters = set()
+        self._lock = threading.Lock()
+
+    def _notify(self) -> None:
+        for loop, event in self._waiters:
+            loop.call_soon_threadsafe(event.set)
+        self._waiters.clear()
+
+    async def produce(self, stream) -> None:
+        try:
+            async for chunk in stream:
+                with self._lock:
+                    self.chunks.append(chunk)
+                    self._notify()
+        except asyncio.CancelledError:
+            with self._lock:
+                self.error = Exception("The upstream stream was cancelled")
+            raise
+        except Exception as e:
+            # Delivered to every subscriber by `consume`
+            with self._lock:
+                self.error = e
+        finally:
+            with self._lock:
+                self.done = True
+                self._notify()
+
+    async def consume(self):
+        loop = asyncio.get_running_loop()
+        position = 0
+        while True:
+            event = asyncio.Event()
+            with self._lock:
+                batch = self.chunks[position:]
+                finished = self.done
+                if not batch and not finished:
+                    self._waiters.add((loop, event))
+            if batch:
+                position += len(batch)
+                for chunk in batch:
+                    yield chunk
+            elif finished:
+                break
+            else:
+                await event.wait()
+        if self.error is not None:
+            raise self.error
+
+
+class StreamFlights:
+    def __init__(self) -> None:
+        self._broadcasts = {}
+        self._lock = threading.Lock()
+
+    async def subscribe(self, key: str, stream_factory):
+        """
+        Yield the chunks of the stream for `key`, starting it with
+        `stream_factory()` unless one is already in progress.
+        """
+        with self._lock:
+            broadcast = self._broadcasts.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = self._broadcasts[key] = StreamBroadcast()
+            broadcast.subscribers += 1
+
+        if leader:
+            try:
+                stream = stream_factory()
+            except Exception as e:
+                with broadcast._lock:
+                    broadcast.error = e
+                    broadcast.done = True
+                    broadcast._notify()
+                self._forget(key, broadcast)
+                raise
+            broadcast.loop = asyncio.get_running_loop()
+            broadcast.task = broadcast.loop.create_task(broadcast.produce(stream))
+            broadcast.task.add_done_callback(lambda _: self._forget(key, broadcast))
+        else:
+            metrics.incr("stream_flight.attached")
+
+        try:
+            async for chunk in broadcast.consume():
+                yield chunk
+        finally:
+            with self._lock:
+                broadcast.subscribers -= 1
+                abandoned = broadcast.subscribers == 0 and not broadcast.done
+            if abandoned and broadcast.task is not None:
+                # Nobody is listening any more
+                broadcast.loop.call_soon_threadsafe(broadcast.task.cancel)
+
+    def _forget(self, key: str, broadcast: StreamBroadcast) -> None:
+        with self._lock:
+            if self._broadcasts.get(key) is broadcast:
+                del self._broadcasts[key]
+
+
+_single_flight = None
+_stream_flights = StreamFlights()
+_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    global _single_flight
+    if _single_flight is None:
+        with _lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight(
+                    getattr(settings, "SINGLE_FLIGHT_TIMEOUT", 120)
+                )
+    return _single_flight
+
+
+def get_stream_flights() -> StreamFlights:
+    return _stream_flights
@@ -0,0 +1,94 @@
+"""
+Server-sent event framing of completion streams.
+
+Each chunk becomes one `data:` event holding the chunk as JSON (serialized
+once with orjson, however many requests share the stream) with an
+increasing `id:`; a successful stream ends with `data: [DONE]`.
+
+Frames can be coalesced into fewer, larger writes: a batch is flushed once
+it holds `max_bytes` or its oldest frame has waited `interval` seconds.
+The first frame of a stream is never held back.
+"""
+
+import asyncio
+
+import orjson
+
+DONE = b"data: [DONE]\n\n"
+
+
+def encode_chunk(chunk) -> bytes:
+    """A provider chunk (or any JSON-like data) serialized as JSON"""
+    if hasattr(chunk, "model_dump"):
+        chunk = chunk.model_dump()
+    return orjson.dumps(chunk, default=str)
+
+
+def sse_event(payload: bytes, event: str = None, event_id: int = None) -> bytes:
+    """One event carrying the already serialized `payload`"""
+    frame = b""
+    if event_id is not None:
+        frame += b"id: %d\n" % event_id
+    if event is not None:
+        frame += b"event: " + event.encode() + b"\n"
+    return frame + b"data: " + payload + b"\n\n"
+
+
+async def coalesce(frames, interval: float = 0, max_bytes: int = 0):
+    """
+    Join the `frames` (bytes) of an async iterator into larger writes.
+    With neither limit set every frame is written on its own.
+    """
+    if not interval and not max_bytes:
+        async for frame in frames:
+            yield frame
+        return
+
+    loop = asyncio.get_running_loop()
+    buffer = []
+    size = 0
+    flush = asyncio.Event()
+    finished = False
+    error = None
+
+    async def pump():
+        # Reads `frames` in its own task so that a flush timer can fire
+        # while the next frame is awaited
+        nonlocal size, finished, error
+        first, timer = True, None
+        try:
+            async for frame in frames:
+                buffer.append(frame)
+                size += len(frame)
+                if first or (max_bytes and size >= max_bytes):
+                    first = False
+                    flush.set()
+                elif interval and len(buffer) == 1:
+                    # A new batch: flush it `interval` from now
+                    if timer is not None:
+                        timer.cancel()
+                    timer = loop.call_later(interval, flush.set)
+        except Exception as e:
+            error = e
+        finally:
+            if timer is not None:
+                timer.cancel()
+            finished = True
+            flush.set()
+
+    task = asyncio.ensure_future(pump())
+    try:
+        while True:
+            await flush.wait()
+            flush.clear()
+            if buffer:
+                batch = b"".join(buffer)
+                buffer.clear()
+                size = 0
+                yield batch
+            if finished and not buffer:
+                break
+        if error is not None:
+            raise error
+    finally:
+        task.cancel()
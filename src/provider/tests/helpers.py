@@ -0,0 +1,157 @@
+"""Fixtures and fakes shared by the provider tests"""
+
+import contextlib
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from authentication.models import APIKey, AuthUser
+from provider.models import ProviderAPIKey
+
+MODELS = {
+    "gpt-4o": {
+        "max_input_tokens": 128000,
+        "max_output_tokens": 16384,
+        "input_cost_per_token": 2.5e-06,
+        "output_cost_per_token": 1e-05,
+        "mode": "chat",
+        "supports_function_calling": True,
+        "supports_vision": True,
+        "provider": "openai",
+    },
+    "gpt-4o-mini": {
+        "max_input_tokens": 128000,
+        "max_output_tokens": 16384,
+        "input_cost_per_token": 1.5e-07,
+        "output_cost_per_token": 6e-07,
+        "mode": "chat",
+        "supports_function_calling": True,
+        "supports_vision": True,
+        "provider": "openai",
+    },
+    "claude-2": {
+        "max_input_tokens": 100000,
+        "max_output_tokens": 8191,
+        "input_cost_per_token": 8e-06,
+        "output_cost_per_token": 2.4e-05,
+        "mode": "chat",
+        "provider": "anthropic",
+    },
+    "text-embedding-3-small": {
+        "max_input_tokens": 8191,
+        "input_cost_per_token": 2e-08,
+        "output_cost_per_token": 0.0,
+        "mode": "embedding",
+        "provider": "openai",
+    },
+    "mystery-model": {"mode": "chat", "provider": "krutrim"},
+}
+
+
+def make_user(username: str = "tester"):
+    """Create a user for tests that need one in the database"""
+    return AuthUser.objects.create(
+        username=username,
+        email=f"{username}@example.com",
+        firstname=username.title(),
+        lastname="Test",
+    )
+
+
+def write_catalog(directory: str, models: dict = None) -> str:
+    """Write `models` (default `MODELS`) as a catalog file; returns its path"""
+    path = os.path.join(directory, "models_list.json")
+    with open(path, "w") as f:
+        json.dump(MODELS if models is None else models, f)
+    return path
+
+
+def catalog_directory(test_case) -> str:
+    """A temporary directory removed when `test_case` ends"""
+    directory = tempfile.TemporaryDirectory()
+    test_case.addCleanup(directory.cleanup)
+    return directory.name
+
+
+class StatusError(Exception):
+    """An upstream error with an HTTP status and, optionally, its headers"""
+
+    def __init__(self, status_code: int, message: str = None, headers=None) -> None:
+        super().__init__(message or f"upstream {status_code}")
+        self.status_code = status_code
+        self.litellm_response_headers = headers
+
+
+class RateLimited(Exception):
+    """An upstream 429 asking to retry after 7 seconds"""
+
+    status_code = 429
+    retry_after = 7
+
+
+def completion_response(content: str, model_name: str = "gpt-4o-mini") -> dict:
+    return {
+        "id": "chatcmpl-test",
+        "model": model_name,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 2},
+    }
+
+
+class FakeLLM:
+    """Provider client answering every call with `reply`; records the calls"""
+
+    def __init__(self, reply: str = "Paris.") -> None:
+        self.reply = reply
+        self.calls = []
+
+    def completion(self, model_name: str, messages: list) -> dict:
+        self.calls.append(model_name)
+        return completion_response(self.reply, model_name)
+
+    async def acompletion(self, model_name: str, messages: list) -> dict:
+        return self.completion(model_name, messages)
+
+
+class GatewayTestCase(TestCase):
+    """
+    A user holding an OpenAI key, calling the gateway with their API key.
+    Provider clients are replaced by `self.llm` and usage is not recorded.
+    """
+
+    def setUp(self):
+        cache.clear()
+        caches["completions"].clear()
+        self.user = make_user()
+        ProviderAPIKey.objects.create(user=self.user, provider="openai", api_key="sk")
+        self.api_key = APIKey.objects.get(user=self.user).key
+        self.client = APIClient()
+        self.llm = FakeLLM()
+        for target, replacement in (
+            (
+                "provider.views.chat_completion",
+                lambda api_key, provider: contextlib.nullcontext(self.llm),
+            ),
+            ("provider.views.get_usage_ledger", mock.Mock),
+        ):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, url: str, body: dict, **headers):
+        return self.client.post(
+            url, body, format="json", HTTP_X_API_KEY=self.api_key, **headers
+        )
+
+    async def apost(self, url: str, body: dict, **headers):
+        return await self.async_client.post(
+            url,
+            body,
+            content_type="application/json",
+            headers={"X-API-KEY": self.api_key, **headers},
+        )
@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+from provider.tests.helpers import GatewayTestCase, completion_response
+
+URL = "/provider/generate/completion/batch/"
+
+
+def item(item_id: str, content: str, model_name: str = "gpt-4o-mini") -> dict:
+    return {
+        "id": item_id,
+        "model_name": model_name,
+        "messages": [{"role": "user", "content": content}],
+    }
+
+
+class SlowLLM:
+    """Answers with the prompt after a while, fails on 'fail'"""
+
+    def __init__(self) -> None:
+        self.calls = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def acompletion(self, model_name: str, messages: list) -> dict:
+        self.calls.append(messages[0]["content"])
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(0.05)
+        finally:
+            self.in_flight -= 1
+        if messages[0]["content"] == "fail":
+            raise Exception("upstream broke")
+        return completion_response(messages[0]["content"], model_name)
+
+
+class BatchViewTests(GatewayTestCase):
+    def setUp(self):
+        super().setUp()
+        self.llm = SlowLLM()
+
+    async def run_batch(self, body: dict) -> list:
+        response = await self.apost(URL, body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) async for line in response.streaming_content]
+
+    async def test_streams_one_line_per_item(self):
+        items = [item(f"q{number}", f"prompt {number % 3}") for number in range(6)]
+        items += [item("bad", "hello", model_name="no-such-model"), 5]
+        items.append(item("f", "fail"))
+        lines = await self.run_batch({"items": items, "concurrency": 2})
+
+        by_index = {line["index"]: line for line in lines}
+        self.assertEqual(sorted(by_index), list(range(len(items))))
+        # Invalid items are answered first, without a call
+        self.assertEqual({lines[0]["index"], lines[1]["index"]}, {6, 7})
+        self.assertEqual(by_index[6]["status_code"], 400)
+        self.assertIn("model does not exist", by_index[6]["error"])
+        self.assertEqual(by_index[7]["status_code"], 400)
+
+        for index in range(6):
+            line = by_index[index]
+            self.assertEqual(line["status"], "ok")
+            self.assertEqual(line["id"], f"q{index}")
+            self.assertEqual(
+                line["response"]["choices"][0]["message"]["content"],
+                f"prompt {index % 3}",
+            )
+        # Identical items share one call
+        self.assertEqual(
+            sorted(self.llm.calls), ["fail", "prompt 0", "prompt 1", "prompt 2"]
+        )
+        self.assertEqual(sum(by_index[index]["deduplicated"] for index in range(6)), 3)
+        self.assertEqual(by_index[8]["status"], "error")
+        self.assertIn("upstream broke", by_index[8]["error"])
+        self.assertLessEqual(self.llm.peak, 2)
+
+    async def test_rejects_invalid_batches(self):
+        for body in (
+            {"items": []},
+            {"items": "all"},
+            {"items": [item("a", "b")], "concurrency": 0},
+        ):
+            response = await self.apost(URL, body)
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(self.llm.calls, [])
@@ -0,0 +1,202 @@
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from provider.breakers import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    is_upstream_failure,
+)
+from provider.retries import RetryPolicy
+from provider.routing import Candidate, Route
+from provider.tests.helpers import StatusError
+
+
+class BreakerTestCase(SimpleTestCase):
+    def setUp(self):
+        caches["completions"].clear()
+
+    def breaker(self, **options):
+        options = {"min_requests": 4, "open_seconds": 30, **options}
+        return CircuitBreaker("openai", "gpt-4o", **options)
+
+
+class IsUpstreamFailureTests(SimpleTestCase):
+    def test_provider_health_errors(self):
+        for error in (StatusError(500), StatusError(503), StatusError(408)):
+            self.assertTrue(is_upstream_failure(error), error)
+        self.assertTrue(is_upstream_failure(StatusError(429)))
+        self.assertTrue(is_upstream_failure(TimeoutError()))
+
+    def test_request_errors_and_bugs(self):
+        for error in (StatusError(400), StatusError(404), ValueError(), Exception()):
+            self.assertFalse(is_upstream_failure(error), error)
+
+
+class CircuitBreakerTests(BreakerTestCase):
+    def test_opens_at_error_rate(self):
+        breaker = self.breaker()
+        for _ in range(4):
+            self.assertTrue(breaker.allow())
+            breaker.record(error=StatusError(503))
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertGreater(breaker.retry_after(), 1)
+
+    def test_needs_min_requests(self):
+        breaker = self.breaker()
+        for _ in range(3):
+            breaker.record(error=StatusError(503))
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_request_errors_are_not_outcomes(self):
+        breaker = self.breaker()
+        for _ in range(10):
+            breaker.record(error=StatusError(400))
+            breaker.record(error=ValueError("bug"))
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.status()["requests"], 0)
+
+    def test_opens_on_latency(self):
+        breaker = self.breaker(latency_threshold=1, latency_percentile=0.5)
+        for _ in range(4):
+            breaker.record(latency=2.0)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertTrue(breaker.reason.startswith("p50 latency"))
+
+    def test_probe_success_closes(self):
+        breaker = self.breaker(open_seconds=0.05, sync_interval=0)
+        for _ in range(4):
+            breaker.record(error=StatusError(503))
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        # One probe at a time
+        self.assertFalse(breaker.allow())
+        breaker.record(latency=0.1)
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_probe_failure_reopens(self):
+        breaker = self.breaker(open_seconds=0.05, sync_interval=0)
+        for _ in range(4):
+            breaker.record(error=StatusError(503))
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.open_seconds = 30
+        breaker.record(error=StatusError(502))
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_probe_ending_in_a_request_error_lets_another_probe(self):
+        breaker = self.breaker(open_seconds=0.05, sync_interval=0)
+        for _ in range(4):
+            breaker.record(error=StatusError(503))
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record(error=StatusError(400))
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow())
+
+    def test_opening_is_shared_with_other_workers(self):
+        breaker = self.breaker(sync_interval=0)
+        other = self.breaker(sync_interval=0)
+        for _ in range(4):
+            breaker.record(error=StatusError(503))
+        self.assertFalse(other.allow())
+        self.assertEqual(other.state, OPEN)
+
+    def test_latency_quantile(self):
+        breaker = self.breaker()
+        self.assertIsNone(breaker.latency_quantile(0.5))
+        for latency in (1.0, 2.0, 3.0, 4.0):
+            breaker.record(latency=latency)
+        self.assertEqual(breaker.latency_quantile(0.5), 3.0)
+        self.assertIsNone(breaker.latency_quantile(0.5, min_samples=5))
+
+
+class AsyncOnlyCache:
+    """A shared cache offering only the async API"""
+
+    def __init__(self) -> None:
+        self.data = {}
+
+    async def aget(self, key, default=None):
+        return self.data.get(key, default)
+
+    async def aadd(self, key, value, timeout=None) -> bool:
+        if key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    async def aset(self, key, value, timeout=None) -> None:
+        self.data[key] = value
+
+    async def adelete_many(self, keys) -> None:
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class AsyncCircuitBreakerTests(BreakerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = AsyncOnlyCache()
+        patcher = mock.patch("provider.breakers.caches", {"completions": self.cache})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_opens_probes_and_closes(self):
+        breaker = self.breaker(open_seconds=0.05, sync_interval=0)
+        for _ in range(4):
+            self.assertTrue(await breaker.aallow())
+            await breaker.arecord(error=StatusError(503))
+        self.assertEqual(breaker.state, OPEN)
+        self.assertIn(breaker.cache_key, self.cache.data)
+        self.assertFalse(await breaker.aallow())
+
+        time.sleep(0.06)
+        self.assertTrue(await breaker.aallow())
+        self.assertFalse(await breaker.aallow())
+        await breaker.arecord(latency=0.1)
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(self.cache.data, {})
+
+    async def test_opening_is_shared_with_other_workers(self):
+        breaker = self.breaker(sync_interval=0)
+        other = self.breaker(sync_interval=0)
+        for _ in range(4):
+            await breaker.arecord(error=StatusError(503))
+        self.assertFalse(await other.aallow())
+        self.assertEqual(other.state, OPEN)
+
+    async def test_routes_on_the_event_loop_use_the_async_api(self):
+        registry = mock.Mock(get=lambda provider, model_name: breakers[model_name])
+        breakers = {
+            "gpt-4o": CircuitBreaker("openai", "gpt-4o", min_requests=2),
+            "claude-2": CircuitBreaker("anthropic", "claude-2", min_requests=2),
+        }
+        route = Route(
+            [
+                Candidate("gpt-4o", "openai", None),
+                Candidate("claude-2", "anthropic", None),
+            ]
+        )
+
+        async def call(candidate):
+            if candidate.model_name == "gpt-4o":
+                raise StatusError(503)
+            return "answer"
+
+        with mock.patch("provider.routing.get_breakers", lambda: registry), mock.patch(
+            "provider.routing.get_retry_policy",
+            lambda: RetryPolicy(max_attempts=2, base_delay=0),
+        ):
+            candidate, result = await route.acomplete(call)
+        self.assertEqual((candidate.model_name, result), ("claude-2", "answer"))
+        self.assertEqual(breakers["gpt-4o"].state, OPEN)
+        self.assertIn(breakers["gpt-4o"].cache_key, self.cache.data)
@@ -0,0 +1,68 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from provider.catalog import CatalogColumns, CatalogIndex
+from provider.tests.helpers import MODELS
+
+
+class CatalogColumnsTests(SimpleTestCase):
+    def setUp(self):
+        self.columns = CatalogColumns.from_models(MODELS)
+        self.names = CatalogIndex.from_models(MODELS).names
+
+    def selected(self, row_ids):
+        return [self.names[row_id] for row_id in row_ids]
+
+    def test_missing_values_are_nan(self):
+        costs = self.columns.numeric["input_cost_per_token"]
+        self.assertEqual(costs[0], 2.5e-06)
+        self.assertTrue(np.isnan(costs[4]))
+        self.assertAlmostEqual(
+            self.columns.numeric["total_cost_per_token"][2], 8e-06 + 2.4e-05
+        )
+        with self.assertRaises(ValueError):
+            costs[0] = 0
+
+    def test_numeric_constraints(self):
+        mask = self.columns.mask(min_input_tokens=100000)
+        self.assertEqual(
+            self.selected(np.flatnonzero(mask)), ["gpt-4o", "gpt-4o-mini", "claude-2"]
+        )
+        mask = self.columns.mask(max_input_cost_per_token=1e-06, mode="chat")
+        self.assertEqual(self.selected(np.flatnonzero(mask)), ["gpt-4o-mini"])
+        self.assertFalse(self.columns.mask(mode="image_generation").any())
+
+    def test_capabilities(self):
+        mask = self.columns.mask(capabilities=["vision", "supports_function_calling"])
+        self.assertEqual(self.selected(np.flatnonzero(mask)), ["gpt-4o", "gpt-4o-mini"])
+        self.assertTrue(
+            np.array_equal(
+                self.columns.mask(capabilities=["Tools"]),
+                self.columns.mask(capabilities=["function_calling"]),
+            )
+        )
+        with self.assertRaises(ValueError):
+            self.columns.mask(capabilities=["telepathy"])
+
+    def test_provider_mask(self):
+        mask = self.columns.provider_mask({"anthropic", "krutrim"})
+        self.assertEqual(
+            self.selected(np.flatnonzero(mask)), ["claude-2", "mystery-model"]
+        )
+
+    def test_query_sorts_with_missing_values_last(self):
+        row_ids = self.columns.query(sort="input_cost_per_token")
+        self.assertEqual(
+            self.selected(row_ids),
+            [
+                "text-embedding-3-small",
+                "gpt-4o-mini",
+                "gpt-4o",
+                "claude-2",
+                "mystery-model",
+            ],
+        )
+        row_ids = self.columns.query(row_ids=[0, 1, 2], sort="-total_cost_per_token")
+        self.assertEqual(self.selected(row_ids), ["claude-2", "gpt-4o", "gpt-4o-mini"])
+        with self.assertRaises(ValueError):
+            self.columns.query(sort="name")
@@ -0,0 +1,56 @@
+from django.test import SimpleTestCase
+
+from provider.catalog import CatalogIndex
+from provider.tests.helpers import MODELS
+
+
+class CatalogIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = CatalogIndex.from_models(MODELS)
+
+    def names(self, row_ids):
+        return [self.index.names[row_id] for row_id in row_ids]
+
+    def test_rows_follow_catalog_order(self):
+        self.assertEqual(self.index.names, tuple(MODELS))
+        self.assertEqual(self.index.row_by_name["claude-2"], 2)
+        self.assertEqual(self.index.providers, ("anthropic", "krutrim", "openai"))
+
+    def test_prefix(self):
+        self.assertEqual(
+            self.names(self.index.prefix("GPT-4o")), ["gpt-4o", "gpt-4o-mini"]
+        )
+        self.assertEqual(self.names(self.index.prefix("claude")), ["claude-2"])
+        self.assertEqual(self.index.prefix("zzz"), [])
+
+    def test_search_matches_substrings(self):
+        self.assertEqual(self.names(self.index.search("MINI")), ["gpt-4o-mini"])
+        self.assertEqual(
+            self.names(self.index.search("o")),
+            ["gpt-4o", "gpt-4o-mini", "mystery-model"],
+        )
+        self.assertEqual(
+            self.names(self.index.search("embedding-3")), ["text-embedding-3-small"]
+        )
+        self.assertEqual(self.index.search("4o-maxi"), [])
+
+    def test_search_agrees_with_a_linear_scan(self):
+        for query in ("g", "-", "4o", "gpt", "o-m", "model", "t-4o-m", "el"):
+            expected = [
+                row_id
+                for row_id, name in enumerate(self.index.names)
+                if query in name.lower()
+            ]
+            self.assertEqual(self.index.search(query), expected, query)
+
+    def test_filter(self):
+        self.assertEqual(self.index.filter(), list(range(len(MODELS))))
+        self.assertEqual(
+            self.names(self.index.filter(provider="anthropic")), ["claude-2"]
+        )
+        self.assertEqual(
+            self.names(self.index.filter(name="gpt", provider="openai")),
+            ["gpt-4o", "gpt-4o-mini"],
+        )
+        self.assertEqual(self.index.filter(name="gpt", provider="anthropic"), [])
+        self.assertEqual(self.index.filter(provider="unknown"), [])
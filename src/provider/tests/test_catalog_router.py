@@ -0,0 +1,75 @@
+from django.test import SimpleTestCase
+
+from provider.catalog import Catalog, parse_auto_constraints, select_cheapest_model
+from provider.tests.helpers import MODELS
+
+
+class ParseAutoConstraintsTests(SimpleTestCase):
+    def test_defaults_to_chat(self):
+        self.assertEqual(parse_auto_constraints(None), {"mode": "chat"})
+
+    def test_parses_values(self):
+        parsed = parse_auto_constraints(
+            {
+                "min_context": "1000",
+                "max_price_per_1k_tokens": "0.01",
+                "capabilities": "Vision, tools",
+                "providers": ["OpenAI"],
+            }
+        )
+        self.assertEqual(parsed["min_context"], 1000)
+        self.assertEqual(parsed["max_price_per_1k_tokens"], 0.01)
+        self.assertEqual(parsed["capabilities"], ("vision", "tools"))
+        self.assertEqual(parsed["providers"], ("openai",))
+
+    def test_rejects_invalid_values(self):
+        for constraints in (
+            [],
+            {"min_context": "lots"},
+            {"max_price_per_1k_tokens": "free"},
+            {"capabilities": 3},
+        ):
+            with self.assertRaises(ValueError, msg=constraints):
+                parse_auto_constraints(constraints)
+
+
+class SelectCheapestModelTests(SimpleTestCase):
+    def setUp(self):
+        self.catalog = Catalog(dict(MODELS), version="test", source="test")
+        self.providers = {"openai", "anthropic", "krutrim"}
+
+    def test_picks_the_cheapest_chat_model(self):
+        self.assertEqual(
+            select_cheapest_model(self.catalog, self.providers), "gpt-4o-mini"
+        )
+
+    def test_respects_providers(self):
+        self.assertEqual(select_cheapest_model(self.catalog, {"anthropic"}), "claude-2")
+        self.assertIsNone(select_cheapest_model(self.catalog, set()))
+        # Models without a known price are never selected
+        self.assertIsNone(select_cheapest_model(self.catalog, {"krutrim"}))
+
+    def test_respects_constraints(self):
+        self.assertEqual(
+            select_cheapest_model(
+                self.catalog, {"anthropic"}, max_price_per_1k_tokens=0.03
+            ),
+            "claude-2",
+        )
+        self.assertIsNone(
+            select_cheapest_model(
+                self.catalog, {"anthropic"}, max_price_per_1k_tokens=0.001
+            )
+        )
+        self.assertIsNone(
+            select_cheapest_model(self.catalog, self.providers, min_context=200000)
+        )
+        self.assertEqual(
+            select_cheapest_model(self.catalog, self.providers, mode="embedding"),
+            "text-embedding-3-small",
+        )
+        self.assertIsNone(
+            select_cheapest_model(
+                self.catalog, {"anthropic"}, capabilities=("function_calling",)
+            )
+        )
@@ -0,0 +1,77 @@
+import hashlib
+import os
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from provider.catalog import (
+    CatalogColumns,
+    CatalogSnapshot,
+    ModelCatalogStore,
+    SnapshotError,
+    snapshot_path_for,
+    write_snapshot,
+)
+from provider.catalog.snapshot import read_snapshot_hash
+from provider.tests.helpers import MODELS, catalog_directory, write_catalog
+
+
+class CatalogSnapshotTests(SimpleTestCase):
+    def setUp(self):
+        self.json_path = write_catalog(catalog_directory(self))
+        self.path = snapshot_path_for(self.json_path)
+        with open(self.json_path, "rb") as f:
+            self.content_hash = hashlib.sha256(f.read()).hexdigest()
+
+    def test_round_trip(self):
+        write_snapshot(MODELS, self.content_hash, self.path)
+        self.assertEqual(read_snapshot_hash(self.path), self.content_hash)
+
+        snapshot = CatalogSnapshot(self.path)
+        self.assertEqual(snapshot.version, self.content_hash)
+        self.assertEqual(snapshot.names, tuple(MODELS))
+        self.assertEqual(dict(snapshot.models), MODELS)
+        self.assertIs(snapshot.models["gpt-4o"], snapshot.models["gpt-4o"])
+
+        expected = CatalogColumns.from_models(MODELS)
+        self.assertEqual(snapshot.columns.providers, expected.providers)
+        self.assertEqual(snapshot.columns.capabilities, expected.capabilities)
+        self.assertTrue(np.array_equal(snapshot.columns.flags, expected.flags))
+        for field, column in expected.numeric.items():
+            self.assertTrue(
+                np.array_equal(snapshot.columns.numeric[field], column, equal_nan=True),
+                field,
+            )
+
+    def test_rejects_other_files(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a snapshot" * 10)
+        with self.assertRaises(SnapshotError):
+            read_snapshot_hash(self.path)
+        with self.assertRaises(SnapshotError):
+            CatalogSnapshot(self.path)
+
+    def test_store_maps_a_matching_snapshot(self):
+        write_snapshot(MODELS, self.content_hash, self.path)
+        store = ModelCatalogStore(
+            self.json_path, check_interval=0, snapshot_path=self.path
+        )
+        catalog = store.get()
+        self.assertIsNotNone(catalog.snapshot)
+        self.assertEqual(catalog.version, self.content_hash)
+        self.assertEqual(catalog["claude-2"], MODELS["claude-2"])
+        self.assertEqual(catalog.index.names, tuple(MODELS))
+
+    def test_store_ignores_a_stale_snapshot(self):
+        stale = {"old-model": {"provider": "openai"}}
+        write_snapshot(stale, hashlib.sha256(b"old").hexdigest(), self.path)
+        store = ModelCatalogStore(
+            self.json_path, check_interval=0, snapshot_path=self.path
+        )
+        with self.assertLogs("provider.catalog.store", "INFO"):
+            catalog = store.get()
+        self.assertIsNone(catalog.snapshot)
+        self.assertEqual(catalog.version, self.content_hash)
+        self.assertIn("gpt-4o", catalog)
+        self.assertNotIn("old-model", catalog)
+        self.assertTrue(os.path.exists(self.path))
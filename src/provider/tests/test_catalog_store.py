@@ -0,0 +1,56 @@
+import hashlib
+import os
+
+from django.test import SimpleTestCase
+
+from provider.catalog import ModelCatalogStore
+from provider.tests.helpers import MODELS, catalog_directory, write_catalog
+
+
+class ModelCatalogStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.path = write_catalog(catalog_directory(self))
+        self.store = ModelCatalogStore(self.path, check_interval=0)
+
+    def rewrite(self, models: dict) -> None:
+        stat = os.stat(self.path)
+        write_catalog(os.path.dirname(self.path), models)
+        # Make the change visible to the mtime/size check however fast it is
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    def test_loads_the_catalog(self):
+        catalog = self.store.get()
+        self.assertEqual(len(catalog), len(MODELS))
+        self.assertIn("gpt-4o", catalog)
+        self.assertEqual(catalog["claude-2"]["provider"], "anthropic")
+        with open(self.path, "rb") as f:
+            self.assertEqual(catalog.version, hashlib.sha256(f.read()).hexdigest())
+
+    def test_reloads_a_changed_file(self):
+        first = self.store.get()
+        self.rewrite({**MODELS, "new-model": {"provider": "openai"}})
+        second = self.store.get()
+        self.assertIsNot(second, first)
+        self.assertIn("new-model", second)
+        self.assertNotEqual(second.version, first.version)
+        # The previous version is left untouched for requests still using it
+        self.assertNotIn("new-model", first)
+
+    def test_unchanged_file_keeps_the_catalog(self):
+        first = self.store.get()
+        self.assertIs(self.store.get(), first)
+        self.assertIs(self.store.reload(), first)
+        self.assertEqual(self.store.reload(force=True).version, first.version)
+
+    def test_invalid_file_keeps_the_previous_catalog(self):
+        first = self.store.get()
+        stat = os.stat(self.path)
+        with open(self.path, "w") as f:
+            f.write("{not json")
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        with self.assertLogs("provider.catalog.store", "ERROR"):
+            self.assertIs(self.store.get(), first)
+
+    def test_catalog_is_read_only(self):
+        with self.assertRaises(TypeError):
+            self.store.get().models["gpt-4o"] = {}
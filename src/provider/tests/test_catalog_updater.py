@@ -0,0 +1,145 @@
+import hashlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from provider.catalog import CatalogSnapshot
+from provider.catalog.snapshot import (
+    atomic_write,
+    read_snapshot_hash,
+    snapshot_path_for,
+    write_snapshot,
+)
+from provider.tests.helpers import MODELS, catalog_directory
+
+SCRIPT = os.path.join(
+    os.path.dirname(settings.BASE_DIR), "scripts", "ai_models_updater.py"
+)
+
+
+def load_updater():
+    spec = importlib.util.spec_from_file_location("ai_models_updater", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class DiffCatalogsTests(SimpleTestCase):
+    def test_reports_added_removed_and_changed_models(self):
+        updated = {name: dict(model) for name, model in MODELS.items()}
+        del updated["claude-2"]
+        updated["gpt-4o"]["input_cost_per_token"] = 2e-06
+        updated["gpt-4o"]["supports_audio_input"] = True
+        updated["new-model"] = {"provider": "openai"}
+
+        changes = load_updater().diff_catalogs(MODELS, updated)
+        self.assertEqual(changes["added"], ["new-model"])
+        self.assertEqual(changes["removed"], ["claude-2"])
+        self.assertEqual(
+            changes["changed"],
+            {
+                "gpt-4o": {
+                    "input_cost_per_token": {"old": 2.5e-06, "new": 2e-06},
+                    "supports_audio_input": {"old": None, "new": True},
+                }
+            },
+        )
+
+
+class UpdaterScriptTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = catalog_directory(self)
+        self.source = os.path.join(self.directory, "source.json")
+        litellm = {
+            name: {
+                "litellm_provider": model["provider"],
+                **{k: v for k, v in model.items() if k != "provider"},
+            }
+            for name, model in MODELS.items()
+        }
+        self.expected = {
+            name: {**model, "provider": model["litellm_provider"]}
+            for name, model in litellm.items()
+        }
+        litellm["sample_spec"] = {"litellm_provider": "example"}
+        with open(self.source, "w") as f:
+            json.dump(litellm, f)
+
+    def run_updater(self, *args):
+        return subprocess.run(
+            [sys.executable, SCRIPT, "--source", self.source]
+            + ["--data-dir", self.directory, *args],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+
+    def read_json(self, name):
+        with open(os.path.join(self.directory, name)) as f:
+            return json.load(f)
+
+    def test_writes_catalog_snapshot_and_version_once(self):
+        self.assertIn("5 added", self.run_updater("--diff"))
+        self.assertFalse(
+            os.path.exists(os.path.join(self.directory, "models_list.json"))
+        )
+
+        self.assertIn("version 1", self.run_updater())
+        models_path = os.path.join(self.directory, "models_list.json")
+        self.assertEqual(self.read_json("models_list.json"), self.expected)
+        with open(models_path, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        self.assertEqual(
+            read_snapshot_hash(snapshot_path_for(models_path)), content_hash
+        )
+        version = self.read_json("catalog_version.json")
+        self.assertEqual(version["version"], 1)
+        self.assertEqual(version["sha256"], content_hash)
+
+        # Unchanged content writes nothing and keeps the version
+        self.assertIn("up to date", self.run_updater())
+        self.assertEqual(self.read_json("catalog_version.json"), version)
+        with open(os.path.join(self.directory, "catalog_changelog.jsonl")) as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+
+class AtomicWriteTests(SimpleTestCase):
+    def test_replaces_the_file(self):
+        path = os.path.join(catalog_directory(self), "file.json")
+        atomic_write(path, b"old")
+        atomic_write(path, b"new")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"new")
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["file.json"])
+
+    def test_failed_write_keeps_the_old_file(self):
+        path = os.path.join(catalog_directory(self), "file.json")
+        atomic_write(path, b"old")
+        with mock.patch("os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                atomic_write(path, b"new")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"old")
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["file.json"])
+
+
+class SnapshotModelsTests(SimpleTestCase):
+    def test_decodes_each_entry_once(self):
+        path = os.path.join(catalog_directory(self), "models.snapshot")
+        write_snapshot(MODELS, hashlib.sha256(b"models").hexdigest(), path)
+        models = CatalogSnapshot(path).models
+        with mock.patch(
+            "provider.catalog.snapshot.json.loads", wraps=json.loads
+        ) as loads:
+            first = models["gpt-4o"]
+            self.assertIs(models["gpt-4o"], first)
+            self.assertEqual(models.get("claude-2"), MODELS["claude-2"])
+        self.assertEqual(loads.call_count, 2)
+        with self.assertRaises(KeyError):
+            models["missing"]
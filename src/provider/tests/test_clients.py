@@ -0,0 +1,121 @@
+import asyncio
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase
+
+from provider.clients import ClientPool
+from provider.generate.ola_krutrim import OlaKrutrim
+
+
+class FakeClient:
+    def __init__(self, provider):
+        self.provider = provider
+        self.api_key = None
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ClientPoolTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("provider.clients.LLM_Factory", FakeClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reuses_clients_per_key(self):
+        pool = ClientPool()
+        with pool.lease("openai", "sk-a") as first:
+            pass
+        with pool.lease("openai", "sk-a") as second:
+            self.assertIs(second, first)
+        with pool.lease("openai", "sk-b") as other:
+            self.assertIsNot(other, first)
+
+    def test_evicted_client_is_closed_after_its_last_lease(self):
+        pool = ClientPool(max_size=1)
+        with pool.lease("openai", "sk-a") as leased:
+            with pool.lease("openai", "sk-b"):
+                pass
+            self.assertFalse(leased.closed)
+        self.assertTrue(leased.closed)
+        self.assertEqual(len(pool), 1)
+
+    def test_leased_client_is_not_idle(self):
+        pool = ClientPool(idle_timeout=0.05)
+        with pool.lease("openai", "sk-a") as leased:
+            time.sleep(0.1)
+            with pool.lease("openai", "sk-b"):
+                pass
+            self.assertFalse(leased.closed)
+        # Idle from the end of the lease
+        with pool.lease("openai", "sk-b"):
+            pass
+        self.assertFalse(leased.closed)
+        time.sleep(0.1)
+        with pool.lease("openai", "sk-b"):
+            pass
+        self.assertTrue(leased.closed)
+
+    def test_shutdown_closes_every_client(self):
+        pool = ClientPool()
+        with pool.lease("openai", "sk-a") as first:
+            pass
+        pool.shutdown()
+        self.assertTrue(first.closed)
+        self.assertEqual(len(pool), 0)
+
+
+class FakeAsyncKrutrim:
+    instances = []
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.closed = False
+        self.chat = mock.Mock()
+        self.chat.completions.create = mock.AsyncMock(
+            return_value=mock.Mock(model_dump=lambda: {"choices": []})
+        )
+        self.instances.append(self)
+
+    async def close(self):
+        self.closed = True
+
+
+class OlaKrutrimAsyncClientTests(SimpleTestCase):
+    def setUp(self):
+        FakeAsyncKrutrim.instances = []
+        for name, fake in (
+            ("AsyncKrutrimCloud", FakeAsyncKrutrim),
+            ("KrutrimCloud", mock.Mock),
+        ):
+            patcher = mock.patch(f"provider.generate.ola_krutrim.{name}", fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.llm = OlaKrutrim()
+        self.llm.api_key = "krutrim-key"
+
+    def test_client_of_a_finished_loop_is_closed(self):
+        # Every async_to_sync call runs on a new loop that is then shut down
+        async_to_sync(self.llm.acompletion)("model", [])
+        async_to_sync(self.llm.acompletion)("model", [])
+        self.assertEqual(len(FakeAsyncKrutrim.instances), 2)
+        self.assertTrue(all(client.closed for client in FakeAsyncKrutrim.instances))
+        self.assertEqual(self.llm._async_clients, {})
+
+    async def test_reuses_the_client_within_a_loop(self):
+        await self.llm.acompletion("model", [])
+        await self.llm.acompletion("model", [])
+        self.assertEqual(len(FakeAsyncKrutrim.instances), 1)
+        client = FakeAsyncKrutrim.instances[0]
+        self.assertFalse(client.closed)
+
+        self.llm.close()
+        await asyncio.sleep(0.01)
+        self.assertTrue(client.closed)
+        await self.llm.acompletion("model", [])
+        self.assertEqual(len(FakeAsyncKrutrim.instances), 2)
+        self.llm.close()
+        await asyncio.sleep(0.01)
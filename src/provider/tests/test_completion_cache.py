@@ -0,0 +1,86 @@
+from django.test import SimpleTestCase, override_settings
+
+from provider.completion_cache import (
+    completion_cache_key,
+    generation_params,
+    get_cached_completion,
+    parse_cache_options,
+    set_cached_completion,
+)
+from provider.tests.helpers import GatewayTestCase, completion_response
+
+URL = "/provider/generate/completion/"
+MESSAGES = [{"role": "user", "content": "What is the capital of France?"}]
+
+
+class CacheOptionsTests(SimpleTestCase):
+    @override_settings(COMPLETION_CACHE_TTL=60, COMPLETION_CACHE_MAX_TTL=600)
+    def test_parses_mode_and_ttl(self):
+        self.assertEqual(parse_cache_options({}), ("bypass", 60))
+        self.assertEqual(parse_cache_options({"cache": "read"}), ("read", 60))
+        self.assertEqual(
+            parse_cache_options({"cache": "write", "cache_ttl": "5000"}),
+            ("write", 600),
+        )
+        for body in ({"cache": "always"}, {"cache_ttl": "soon"}, {"cache_ttl": 0}):
+            with self.assertRaises(ValueError, msg=body):
+                parse_cache_options(body)
+
+    def test_key_ignores_field_order_and_unset_fields(self):
+        key = completion_cache_key(1, "gpt-4o", MESSAGES, {})
+        reordered = [{"content": MESSAGES[0]["content"], "role": "user", "name": None}]
+        self.assertEqual(completion_cache_key(1, "gpt-4o", reordered, {}), key)
+        self.assertNotEqual(completion_cache_key(2, "gpt-4o", MESSAGES, {}), key)
+        self.assertNotEqual(completion_cache_key(1, "gpt-4o-mini", MESSAGES, {}), key)
+        params = generation_params({"temperature": 0.2, "stream": False, "seed": None})
+        self.assertEqual(params, {"temperature": 0.2})
+        self.assertNotEqual(completion_cache_key(1, "gpt-4o", MESSAGES, params), key)
+
+    def test_round_trip(self):
+        key = completion_cache_key(1, "gpt-4o", MESSAGES, {})
+        self.assertIsNone(get_cached_completion(key))
+        set_cached_completion(key, completion_response("Paris."), ttl=60)
+        self.assertEqual(get_cached_completion(key), completion_response("Paris."))
+
+
+class CompletionCacheViewTests(GatewayTestCase):
+    def complete(self, **body):
+        return self.post(
+            URL, {"model_name": "gpt-4o-mini", "messages": MESSAGES, **body}
+        )
+
+    def test_read_serves_a_stored_response(self):
+        response = self.complete(cache="read")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Cache"], "MISS")
+        response = self.complete(cache="read")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response["X-Cache-Match"], "exact")
+        self.assertEqual(
+            response.json()["response"]["choices"][0]["message"]["content"], "Paris."
+        )
+        self.assertEqual(len(self.llm.calls), 1)
+
+        # Other generation params are another entry
+        self.assertEqual(
+            self.complete(cache="read", temperature=0.5)["X-Cache"], "MISS"
+        )
+        self.assertEqual(len(self.llm.calls), 2)
+
+    def test_write_refreshes_and_bypass_skips_the_cache(self):
+        self.complete(cache="read")
+        self.llm.reply = "Paris, France."
+        self.assertEqual(self.complete()["X-Cache"], "BYPASS")
+        self.assertEqual(self.complete(cache="write")["X-Cache"], "MISS")
+        response = self.complete(cache="read")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(
+            response.json()["response"]["choices"][0]["message"]["content"],
+            "Paris, France.",
+        )
+        self.assertEqual(len(self.llm.calls), 3)
+
+    def test_rejects_invalid_options(self):
+        self.assertEqual(self.complete(cache="always").status_code, 400)
+        self.assertEqual(self.complete(cache="read", cache_ttl=-1).status_code, 400)
+        self.assertEqual(self.llm.calls, [])
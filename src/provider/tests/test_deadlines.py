@@ -0,0 +1,128 @@
+import asyncio
+import json
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from provider import deadlines
+from provider.deadlines import (
+    DeadlineExceeded,
+    call_timeout,
+    deadline_scope,
+    parse_timeout,
+    set_deadline,
+)
+from provider.generations import Generations
+from provider.tests.helpers import GatewayTestCase, completion_response
+
+
+class DeadlineTests(SimpleTestCase):
+    def test_timeout_from_the_header_else_the_default(self):
+        self.assertEqual(parse_timeout({"X-Request-Timeout": "2.5"}, 60), 2.5)
+        self.assertEqual(parse_timeout({}, 60), 60)
+
+    @override_settings(DEADLINE_MAX=10)
+    def test_timeout_is_capped(self):
+        self.assertEqual(parse_timeout({"X-Request-Timeout": "100"}, 60), 10)
+        self.assertEqual(parse_timeout({}, 60), 10)
+
+    def test_invalid_timeouts(self):
+        for value in ("0", "-1", "soon", "inf", "nan"):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_timeout({"X-Request-Timeout": value}, 60)
+
+    def test_calls_get_the_time_left(self):
+        self.assertIsNone(deadlines.remaining())
+        self.assertEqual(call_timeout(), deadlines.DEFAULT_CALL_TIMEOUT)
+        with deadline_scope():
+            set_deadline(time.monotonic() + 5)
+            self.assertAlmostEqual(call_timeout(), 5, delta=0.5)
+            deadlines.check()
+        # Confined to its scope
+        self.assertIsNone(deadlines.remaining())
+
+    def test_no_call_past_the_deadline(self):
+        with deadline_scope(time.monotonic() - 1):
+            self.assertTrue(deadlines.expired())
+            with self.assertRaises(DeadlineExceeded):
+                deadlines.check()
+            with self.assertRaises(DeadlineExceeded):
+                call_timeout()
+
+
+class StreamDeadlineTests(SimpleTestCase):
+    async def stream(self, delay: float):
+        while True:
+            await asyncio.sleep(delay)
+            yield b"chunk"
+
+    async def test_stream_ends_at_its_deadline(self):
+        generation = await Generations().start(user_id=1)
+        chunks = []
+        with self.assertRaises(DeadlineExceeded):
+            async for chunk in generation.watch(
+                self.stream(0.01), deadline=time.monotonic() + 0.1
+            ):
+                chunks.append(chunk)
+        self.assertGreater(len(chunks), 0)
+
+    async def test_idle_stream_times_out(self):
+        generation = await Generations().start(user_id=1)
+        with self.assertRaisesMessage(TimeoutError, "sent nothing for 0.05s"):
+            async for _ in generation.watch(self.stream(10), idle_timeout=0.05):
+                pass
+
+
+class SlowLLM:
+    """Answers after as many seconds as the prompt says"""
+
+    def __init__(self) -> None:
+        self.cancelled = []
+
+    async def acompletion(self, model_name: str, messages: list) -> dict:
+        content = messages[0]["content"]
+        try:
+            await asyncio.sleep(float(content))
+        except asyncio.CancelledError:
+            self.cancelled.append(content)
+            raise
+        return completion_response(content, model_name)
+
+
+class BatchDeadlineTests(GatewayTestCase):
+    url = "/provider/generate/completion/batch/"
+
+    def setUp(self):
+        super().setUp()
+        self.llm = SlowLLM()
+
+    async def test_pending_items_fail_at_the_deadline(self):
+        items = [
+            {
+                "id": delay,
+                "model_name": "gpt-4o-mini",
+                "messages": [{"role": "user", "content": delay}],
+            }
+            for delay in ("0", "10")
+        ]
+        started = time.monotonic()
+        response = await self.apost(
+            self.url, {"items": items}, **{"X-Request-Timeout": "0.2"}
+        )
+        lines = [json.loads(line) async for line in response.streaming_content]
+        self.assertLess(time.monotonic() - started, 5)
+
+        by_id = {line["id"]: line for line in lines}
+        self.assertEqual(by_id["0"]["status"], "ok")
+        self.assertEqual(by_id["10"]["status"], "error")
+        self.assertEqual(by_id["10"]["status_code"], 504)
+        await asyncio.sleep(0)
+        self.assertEqual(self.llm.cancelled, ["10"])
+
+    async def test_invalid_timeout(self):
+        response = await self.apost(
+            self.url,
+            {"items": [{"model_name": "gpt-4o-mini", "messages": []}]},
+            **{"X-Request-Timeout": "never"},
+        )
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,100 @@
+import asyncio
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from provider.generations import COMPLETED, Generations
+
+
+class Upstream:
+    """An upstream stream sending `count` chunks, `delay` apart"""
+
+    def __init__(self, count: int = 100, delay: float = 0.01) -> None:
+        self.count = count
+        self.delay = delay
+        self.closed = False
+
+    async def stream(self):
+        try:
+            for number in range(self.count):
+                await asyncio.sleep(self.delay)
+                yield number
+        finally:
+            self.closed = True
+
+
+class GenerationTests(SimpleTestCase):
+    def setUp(self):
+        caches["completions"].clear()
+
+    async def test_completes(self):
+        generations = Generations()
+        generation = await generations.start(user_id=1)
+        upstream = Upstream(count=3, delay=0)
+        items = [item async for item in generation.watch(upstream.stream())]
+        self.assertEqual(items, [0, 1, 2])
+        self.assertEqual(generation.chunks, 3)
+        generation.outcome = COMPLETED
+        await generations.finish(generation)
+        self.assertEqual(generations.active_count(), 0)
+
+    async def test_interrupt_stops_the_wait_for_a_chunk(self):
+        generation = await Generations().start(user_id=1)
+        upstream = Upstream(delay=10)
+        watch = asyncio.ensure_future(
+            asyncio.wait_for(self.drain(generation.watch(upstream.stream())), 1)
+        )
+        await asyncio.sleep(0.05)
+        generation.interrupt()
+        self.assertEqual(await watch, [])
+        self.assertTrue(generation.cancelled)
+        self.assertTrue(upstream.closed)
+
+    async def test_cancel_by_id_checks_the_owner(self):
+        generations = Generations()
+        generation = await generations.start(user_id=1)
+        upstream = Upstream()
+        watch = asyncio.ensure_future(self.drain(generation.watch(upstream.stream())))
+        await asyncio.sleep(0.03)
+
+        self.assertFalse(generations.cancel(generation.id, user_id=2))
+        self.assertFalse(generations.cancel("no-such-generation", user_id=1))
+        self.assertTrue(generations.cancel(generation.id, user_id=1))
+        items = await asyncio.wait_for(watch, 1)
+        self.assertLess(len(items), 100)
+        self.assertTrue(upstream.closed)
+
+    async def test_cancel_reaches_another_worker(self):
+        streaming, other = Generations(poll_interval=0), Generations()
+        generation = await streaming.start(user_id=1)
+        upstream = Upstream()
+        watch = asyncio.ensure_future(self.drain(generation.watch(upstream.stream())))
+        await asyncio.sleep(0.03)
+
+        self.assertFalse(other.cancel(generation.id, user_id=2))
+        self.assertTrue(other.cancel(generation.id, user_id=1))
+        items = await asyncio.wait_for(watch, 1)
+        self.assertLess(len(items), 100)
+        self.assertTrue(generation.cancelled)
+        self.assertTrue(upstream.closed)
+
+    async def test_client_disconnect_is_not_a_cancel(self):
+        generation = await Generations().start(user_id=1)
+        upstream = Upstream(delay=10)
+        watch = asyncio.ensure_future(self.drain(generation.watch(upstream.stream())))
+        await asyncio.sleep(0.05)
+        watch.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await watch
+        self.assertFalse(generation.cancelled)
+        self.assertTrue(upstream.closed)
+
+    async def test_idle_stream_times_out(self):
+        generation = await Generations().start(user_id=1)
+        upstream = Upstream(delay=10)
+        with self.assertRaises(TimeoutError):
+            await self.drain(generation.watch(upstream.stream(), idle_timeout=0.05))
+        self.assertTrue(upstream.closed)
+
+    async def drain(self, stream) -> list:
+        return [item async for item in stream]
@@ -0,0 +1,93 @@
+import asyncio
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from provider.breakers import BreakerRegistry
+from provider.hedging import Hedger
+from provider.retries import RetryPolicy
+from provider.routing import Candidate, Route
+
+
+class HedgerTests(SimpleTestCase):
+    def setUp(self):
+        caches["completions"].clear()
+        self.breakers = BreakerRegistry()
+        for target, value in (
+            ("provider.routing.get_breakers", lambda: self.breakers),
+            ("provider.hedging.get_breakers", lambda: self.breakers),
+            (
+                "provider.routing.get_retry_policy",
+                lambda: RetryPolicy(max_attempts=1),
+            ),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.route = Route(
+            [
+                Candidate("gpt-4o", "openai", None),
+                Candidate("claude-2", "anthropic", None),
+            ]
+        )
+        self.cancelled = []
+
+    def call_with_latency(self, latencies):
+        async def call(candidate):
+            try:
+                await asyncio.sleep(latencies[candidate.model_name])
+            except asyncio.CancelledError:
+                self.cancelled.append(candidate.model_name)
+                raise
+            return candidate.model_name
+
+        return call
+
+    async def test_slow_primary_is_hedged(self):
+        hedger = Hedger(budget=1, default_delay=0.05)
+        call = self.call_with_latency({"gpt-4o": 5, "claude-2": 0})
+        candidate, result = await hedger.complete(self.route, call)
+        self.assertEqual((candidate.model_name, result), ("claude-2", "claude-2"))
+        self.assertEqual(hedger.hedges, 1)
+        await asyncio.sleep(0)
+        # The losing attempt is cancelled
+        self.assertEqual(self.cancelled, ["gpt-4o"])
+
+    async def test_fast_primary_is_not_hedged(self):
+        hedger = Hedger(budget=1, default_delay=0.5)
+        call = self.call_with_latency({"gpt-4o": 0, "claude-2": 0})
+        candidate, _ = await hedger.complete(self.route, call)
+        self.assertEqual(candidate.model_name, "gpt-4o")
+        self.assertEqual(hedger.hedges, 0)
+
+    async def test_budget_caps_hedges(self):
+        hedger = Hedger(budget=0, default_delay=0.01)
+        call = self.call_with_latency({"gpt-4o": 0.05, "claude-2": 0})
+        candidate, _ = await hedger.complete(self.route, call)
+        self.assertEqual(candidate.model_name, "gpt-4o")
+        self.assertEqual(hedger.rate(), 0)
+
+    async def test_primary_error_is_answered_by_the_hedge(self):
+        hedger = Hedger(budget=1, default_delay=0.01)
+
+        async def call(candidate):
+            if candidate.model_name == "gpt-4o":
+                await asyncio.sleep(0.05)
+                raise ValueError("bad request")
+            await asyncio.sleep(0.1)
+            return "hedged"
+
+        candidate, result = await hedger.complete(self.route, call)
+        self.assertEqual(result, "hedged")
+
+    def test_delay_follows_recent_latency(self):
+        hedger = Hedger(percentile=0.5, min_samples=4, default_delay=2, min_delay=0.2)
+        breaker = self.breakers.get("openai", "gpt-4o")
+        self.assertEqual(hedger.delay("openai", "gpt-4o"), 2)
+        for latency in (0.4, 0.6, 0.8, 1.0):
+            breaker.record(latency=latency)
+        self.assertEqual(hedger.delay("openai", "gpt-4o"), 0.8)
+        for _ in range(20):
+            breaker.record(latency=0.01)
+        self.assertEqual(hedger.delay("openai", "gpt-4o"), 0.2)
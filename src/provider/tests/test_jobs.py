@@ -0,0 +1,180 @@
+import hashlib
+import hmac
+import json
+import socket
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from provider.jobs import CallbackRejected, JobPool, QueueFull, check_callback_url
+from provider.tests.helpers import GatewayTestCase, StatusError
+
+
+def resolving_to(address: str):
+    family = socket.AF_INET6 if ":" in address else socket.AF_INET
+    return mock.patch(
+        "provider.jobs.socket.getaddrinfo",
+        return_value=[(family, socket.SOCK_STREAM, 6, "", (address, 443))],
+    )
+
+
+class CheckCallbackUrlTests(SimpleTestCase):
+    def test_public_address(self):
+        with resolving_to("93.184.216.34"):
+            check_callback_url("https://example.com/hook")
+
+    def test_private_and_reserved_addresses(self):
+        for address in (
+            "127.0.0.1",
+            "10.0.0.5",
+            "192.168.1.1",
+            "169.254.169.254",
+            "100.64.0.1",
+            "0.0.0.0",
+            "::1",
+            "::ffff:10.0.0.1",
+        ):
+            with self.subTest(address=address), resolving_to(address):
+                with self.assertRaises(CallbackRejected):
+                    check_callback_url("https://example.com/hook")
+
+    def test_allowed_hosts_are_not_resolved(self):
+        with resolving_to("10.0.0.5") as getaddrinfo:
+            check_callback_url("http://hooks.internal/done", ("hooks.internal",))
+        getaddrinfo.assert_not_called()
+
+    def test_only_http_urls(self):
+        for url in ("ftp://example.com/hook", "file:///etc/passwd", "not a url"):
+            with self.subTest(url=url), self.assertRaises(ValueError):
+                check_callback_url(url)
+
+    def test_unresolvable_host(self):
+        with mock.patch(
+            "provider.jobs.socket.getaddrinfo", side_effect=socket.gaierror()
+        ):
+            with self.assertRaises(ValueError) as raised:
+                check_callback_url("https://nowhere.example/hook")
+        self.assertNotIsInstance(raised.exception, CallbackRejected)
+
+
+class JobPoolTests(SimpleTestCase):
+    def setUp(self):
+        caches["completions"].clear()
+        self.pool = JobPool(workers=1, max_queued=1)
+        self.addCleanup(self.pool._executor.shutdown)
+
+    def finished(self, job_id: str, owner=1) -> dict:
+        for _ in range(200):
+            job = self.pool.get(job_id, owner)
+            if job["status"] in ("succeeded", "failed"):
+                return job
+            time.sleep(0.01)
+        self.fail("The job did not finish")
+
+    def test_job_result_is_kept_for_its_owner(self):
+        job = self.pool.submit(1, lambda: {"response": "Paris."})
+        self.assertEqual(job["status"], "queued")
+        finished = self.finished(job["job_id"])
+        self.assertEqual(finished["status"], "succeeded")
+        self.assertEqual(finished["response"], "Paris.")
+        self.assertIsNone(self.pool.get(job["job_id"], 2))
+
+    def test_failed_job_keeps_the_upstream_status(self):
+        def run():
+            raise StatusError(429)
+
+        job = self.pool.submit(1, run)
+        finished = self.finished(job["job_id"])
+        self.assertEqual(finished["status"], "failed")
+        self.assertEqual(finished["status_code"], 429)
+
+    def test_full_queue_rejects_submissions(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.pool.submit(1, lambda: release.wait(5) and {})
+        # The running job has left the queue; this one waits behind it
+        for _ in range(100):
+            if self.pool.running:
+                break
+            time.sleep(0.01)
+        self.pool.submit(1, dict)
+        with self.assertRaises(QueueFull):
+            self.pool.submit(1, dict)
+
+
+class CallbackTests(SimpleTestCase):
+    def setUp(self):
+        caches["completions"].clear()
+        self.job = {"job_id": "job-1", "status": "succeeded", "callback": "pending"}
+
+    def deliver(self, pool: JobPool, address: str = "93.184.216.34", status=200):
+        with resolving_to(address), mock.patch(
+            "provider.jobs.requests.post",
+            return_value=mock.Mock(status_code=status),
+        ) as post:
+            pool._deliver(1, self.job, "https://example.com/hook")
+        return post
+
+    def test_signed_delivery(self):
+        post = self.deliver(JobPool(workers=1, callback_secret="secret"))
+        body = post.call_args.kwargs["data"]
+        signature = hmac.new(b"secret", body.encode(), hashlib.sha256).hexdigest()
+        self.assertEqual(
+            post.call_args.kwargs["headers"]["X-Signature"], f"sha256={signature}"
+        )
+        self.assertFalse(post.call_args.kwargs["allow_redirects"])
+        self.assertNotIn("callback", json.loads(body))
+        self.assertEqual(self.job["callback"], "delivered")
+
+    def test_host_resolving_to_a_private_address_is_not_called(self):
+        post = self.deliver(JobPool(workers=1), address="10.0.0.5")
+        post.assert_not_called()
+        self.assertEqual(self.job["callback"], "rejected")
+
+    def test_client_errors_are_not_retried(self):
+        post = self.deliver(JobPool(workers=1, callback_attempts=3), status=404)
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(self.job["callback"], "failed")
+
+
+class CompletionJobViewTests(GatewayTestCase):
+    url = "/provider/generate/completion/jobs/"
+
+    def setUp(self):
+        super().setUp()
+        self.pool = JobPool(workers=1)
+        self.addCleanup(self.pool._executor.shutdown)
+        patcher = mock.patch("provider.views.get_job_pool", return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_job_is_answered_at_once_and_polled(self):
+        response = self.post(
+            self.url,
+            {
+                "model_name": "gpt-4o-mini",
+                "messages": [{"role": "user", "content": "Hi"}],
+            },
+        )
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(response["Location"], job["status_url"])
+        self.pool._executor.shutdown(wait=True)
+        polled = self.client.get(job["status_url"], HTTP_X_API_KEY=self.api_key)
+        self.assertEqual(polled.status_code, 200)
+        self.assertEqual(polled.json()["status"], "succeeded")
+
+    def test_private_callback_url_is_refused(self):
+        with resolving_to("127.0.0.1"):
+            response = self.post(
+                self.url,
+                {
+                    "model_name": "gpt-4o-mini",
+                    "messages": [{"role": "user", "content": "Hi"}],
+                    "callback_url": "https://example.com/hook",
+                },
+            )
+        self.assertEqual(response.status_code, 400)
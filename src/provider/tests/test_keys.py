@@ -0,0 +1,121 @@
+import asyncio
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from provider.keys import KeyLease, KeyRotator, ProviderCredential, StoredKey
+from provider.tests.helpers import RateLimited
+
+
+def stored_key(key_id: str, rpm_limit=0, tpm_limit=0, weight=1) -> StoredKey:
+    return StoredKey(key_id, key_id, "", rpm_limit, tpm_limit, weight)
+
+
+class KeyRotatorTests(SimpleTestCase):
+    def test_spreads_requests_in_flight(self):
+        rotator = KeyRotator()
+        keys = (stored_key("a"), stored_key("b"), stored_key("c"))
+        picked = [rotator.acquire(keys).id for _ in range(6)]
+        self.assertEqual(sorted(picked), ["a", "a", "b", "b", "c", "c"])
+
+    def test_follows_weights(self):
+        rotator = KeyRotator()
+        keys = (stored_key("a", weight=3), stored_key("b"))
+        picked = []
+        for _ in range(8):
+            key = rotator.acquire(keys)
+            picked.append(key.id)
+            rotator.release(key, 0)
+        self.assertEqual(picked.count("a"), 6)
+
+    def test_rate_limited_key_cools_down(self):
+        rotator = KeyRotator(cooldown=60)
+        keys = (stored_key("a"), stored_key("b"))
+        key = rotator.acquire(keys)
+        rotator.release(key, 0, error=RateLimited())
+        for _ in range(3):
+            other = rotator.acquire(keys)
+            self.assertNotEqual(other.id, key.id)
+            rotator.release(other, 0)
+        self.assertEqual(rotator.utilization(key)["rate_limited"], 1)
+        self.assertGreater(rotator.utilization(key)["cooldown_remaining"], 0)
+
+    def test_all_cooling_uses_the_first_to_recover(self):
+        rotator = KeyRotator(cooldown=60)
+        keys = (stored_key("a"), stored_key("b"))
+        for key in keys:
+            rotator.acquire(keys)
+            rotator.release(key, 0, error=RateLimited())
+        self.assertEqual(rotator.acquire(keys).id, "a")
+
+    def test_headroom_prefers_the_key_with_capacity_left(self):
+        rotator = KeyRotator(policy="headroom")
+        keys = (stored_key("a", tpm_limit=1000), stored_key("b", tpm_limit=1000))
+        first = rotator.acquire(keys, tokens=800)
+        rotator.release(first, 800)
+        second = rotator.acquire(keys, tokens=100)
+        self.assertNotEqual(second.id, first.id)
+
+    def test_reported_usage_settles_the_estimate(self):
+        rotator = KeyRotator()
+        keys = (stored_key("a", tpm_limit=1000),)
+        key = rotator.acquire(keys, tokens=100)
+        rotator.release(key, 100, tokens=300)
+        utilization = rotator.utilization(key)
+        self.assertEqual(utilization["tokens"], 300)
+        self.assertLessEqual(utilization["tpm_available"], 701)
+
+
+class KeyLeaseTests(SimpleTestCase):
+    def test_reports_usage_and_errors(self):
+        rotator = KeyRotator()
+        key = rotator.acquire((stored_key("a"),), tokens=10)
+        with self.assertRaises(RateLimited):
+            with KeyLease("sk-a", rotator, key, 10) as lease:
+                lease.record_usage({"usage": {"total_tokens": 42}})
+                raise RateLimited()
+        utilization = rotator.utilization(key)
+        self.assertEqual(utilization["in_flight"], 0)
+        self.assertEqual(utilization["tokens"], 42)
+        self.assertEqual(utilization["errors"], 1)
+
+    def test_cancellation_is_not_the_keys_fault(self):
+        rotator = KeyRotator()
+        key = rotator.acquire((stored_key("a"),))
+        with self.assertRaises(asyncio.CancelledError):
+            with KeyLease("sk-a", rotator, key):
+                raise asyncio.CancelledError()
+        self.assertEqual(rotator.utilization(key)["errors"], 0)
+
+
+class ProviderCredentialTests(SimpleTestCase):
+    def setUp(self):
+        self.rotator = KeyRotator()
+        self.keys = (stored_key("a"),)
+        for target, value in (
+            ("provider.keys.get_stored_keys", lambda user_id, provider: self.keys),
+            ("provider.keys.get_key_rotator", lambda: self.rotator),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_decrypts_each_key_once(self):
+        credential = ProviderCredential(1, "openai")
+        with mock.patch("provider.keys.decrypt_value", return_value="sk-a") as decrypt:
+            for _ in range(2):
+                with credential.lease() as lease:
+                    self.assertEqual(lease.api_key, "sk-a")
+        self.assertEqual(decrypt.call_count, 1)
+        self.assertEqual(self.rotator.utilization(self.keys[0])["in_flight"], 0)
+
+    def test_failed_decryption_releases_the_key(self):
+        credential = ProviderCredential(1, "openai")
+        with mock.patch(
+            "provider.keys.decrypt_value", side_effect=ValueError("bad token")
+        ):
+            with self.assertRaises(ValueError):
+                credential.lease()
+        utilization = self.rotator.utilization(self.keys[0])
+        self.assertEqual(utilization["in_flight"], 0)
+        self.assertEqual(utilization["errors"], 1)
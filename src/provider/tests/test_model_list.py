@@ -0,0 +1,121 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from provider.catalog import Catalog
+from provider.models import ProviderAPIKey
+from provider.views import AIModelListView
+from provider.tests.helpers import MODELS, make_user
+
+URL = "/provider/ai/models/"
+
+
+class AIModelListETagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.catalog = Catalog(dict(MODELS), version="a" * 64, source="test")
+        patcher = mock.patch("provider.views.get_catalog", lambda: self.catalog)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(make_user())
+
+    def test_not_modified_for_a_matching_etag(self):
+        response = self.client.get(URL, {"provider": "openai"})
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertIn("must-revalidate", response["Cache-Control"])
+        self.assertIn("Authorization", response["Vary"])
+
+        response = self.client.get(URL, {"provider": "openai"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        response = self.client.get(
+            URL, {"provider": "openai"}, HTTP_IF_NONE_MATCH=f"W/{etag}"
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_query_and_catalog_version(self):
+        etag = self.client.get(URL)["ETag"]
+        self.assertNotEqual(self.client.get(URL, {"limit": 1})["ETag"], etag)
+
+        self.catalog = Catalog(dict(MODELS), version="b" * 64, source="test")
+        response = self.client.get(URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_column_filters(self):
+        response = self.client.get(
+            URL, {"capabilities": "vision", "sort": "-input_cost_per_token"}
+        )
+        self.assertEqual(
+            [model["model_name"] for model in response.json()["models"]],
+            ["gpt-4o", "gpt-4o-mini"],
+        )
+        response = self.client.get(URL, {"min_context": "lots"})
+        self.assertEqual(response.status_code, 400)
+
+
+class AIModelListPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.catalog = Catalog(dict(MODELS), version="a" * 64, source="test")
+        patcher = mock.patch("provider.views.get_catalog", lambda: self.catalog)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client_for(self, username: str, providers=()) -> APIClient:
+        user = make_user(username)
+        for provider in providers:
+            ProviderAPIKey.objects.create(user=user, provider=provider, api_key="sk")
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def active(self, response) -> dict:
+        return {
+            model["model_name"]: model["active"] for model in response.json()["models"]
+        }
+
+    def test_users_share_the_page_but_not_the_active_flag(self):
+        alice = self.client_for("alice", ["openai"])
+        bob = self.client_for("bob", ["anthropic"])
+
+        get_page = AIModelListView.get_page
+        with mock.patch.object(
+            AIModelListView, "get_page", autospec=True, side_effect=get_page
+        ) as spy:
+            first = alice.get(URL, {"mode": "chat"})
+            second = bob.get(URL, {"mode": "chat"})
+        # The second user's page comes from the shared cache
+        self.assertEqual(spy.call_count, 1)
+
+        self.assertEqual(
+            self.active(first),
+            {
+                "gpt-4o": True,
+                "gpt-4o-mini": True,
+                "claude-2": False,
+                "mystery-model": False,
+            },
+        )
+        self.assertEqual(
+            self.active(second),
+            {
+                "gpt-4o": False,
+                "gpt-4o-mini": False,
+                "claude-2": True,
+                "mystery-model": False,
+            },
+        )
+        self.assertNotEqual(first["ETag"], second["ETag"])
+
+    def test_page_is_rebuilt_for_a_new_catalog_version(self):
+        client = self.client_for("carol")
+        self.assertEqual(client.get(URL).json()["count"], len(MODELS))
+        self.catalog = Catalog(
+            {"gpt-4o": MODELS["gpt-4o"]}, version="b" * 64, source="test"
+        )
+        self.assertEqual(client.get(URL).json()["count"], 1)
@@ -0,0 +1,144 @@
+import asyncio
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from provider.replay import ReplayGap, ReplayStreams
+from provider.views import event_stream_response
+
+
+def frame(event_id: int) -> bytes:
+    return f"id: {event_id}\ndata: {'x' * 40}\n\n".encode()
+
+
+class ReplayTestCase(SimpleTestCase):
+    def setUp(self):
+        caches["completions"].clear()
+        self.streams = ReplayStreams(publish_interval=0.01, grace=0.05)
+
+    def producer(self, count: int, started=None, delay=0.0):
+        """`produce` appending `count` chunk frames, once `started` is set"""
+
+        async def produce(replay):
+            if started is not None:
+                await started.wait()
+            for event_id in range(1, count + 1):
+                replay.append(frame(event_id), event_id)
+                await asyncio.sleep(delay)
+
+        return produce
+
+    async def collect(self, frames, limit=None) -> list:
+        collected = []
+        async for value in frames:
+            collected.append(value)
+            if limit is not None and len(collected) == limit:
+                break
+        return collected
+
+
+class ReplayStreamTests(ReplayTestCase):
+    async def test_follow_gets_every_frame(self):
+        replay = await self.streams.start("g1", 1, self.producer(20))
+        frames = await self.collect(replay.follow())
+        self.assertEqual(frames, [frame(event_id) for event_id in range(1, 21)])
+
+    async def test_resume_in_the_same_worker(self):
+        started = asyncio.Event()
+        replay = await self.streams.start("g2", 1, self.producer(10, started))
+        first = replay.follow()
+        started.set()
+        self.assertEqual(
+            await self.collect(first, limit=3), [frame(1), frame(2), frame(3)]
+        )
+        await first.aclose()
+        frames = await self.collect(self.streams.resume("g2", 3))
+        self.assertEqual(frames, [frame(event_id) for event_id in range(4, 11)])
+
+    async def test_resume_in_another_worker(self):
+        replay = await self.streams.start("g3", 1, self.producer(10, delay=0.005))
+        await self.collect(replay.follow())
+        other = ReplayStreams(publish_interval=0.01)
+        self.assertEqual(other.owner("g3"), 1)
+        frames = await self.collect(other.resume("g3", 6))
+        self.assertEqual(frames, [frame(event_id) for event_id in range(7, 11)])
+
+    async def test_unknown_event(self):
+        replay = await self.streams.start("g4", 1, self.producer(3))
+        await self.collect(replay.follow())
+        with self.assertRaises(ValueError):
+            self.streams.resume("g4", 99)
+
+    async def test_gap_once_events_are_dropped(self):
+        streams = ReplayStreams(max_bytes=200, publish_interval=0.01, grace=1)
+        started = asyncio.Event()
+        replay = await streams.start("g5", 1, self.producer(30, started))
+        reader = replay.follow()
+        started.set()
+        await self.collect(reader)
+        with self.assertRaises(ReplayGap):
+            streams.resume("g5", 1)
+
+    async def test_slow_reader_is_cut_off_at_the_cap(self):
+        streams = ReplayStreams(max_bytes=200, publish_interval=0.01)
+        replay = await streams.start("g6", 1, self.producer(50))
+        frames = []
+        with self.assertRaises(ReplayGap):
+            async for value in replay.follow():
+                frames.append(value)
+                self.assertLessEqual(replay.size, 200)
+                await asyncio.sleep(0.001)
+        self.assertLess(len(frames), 50)
+        self.assertEqual(
+            frames, [frame(event_id) for event_id in range(1, 1 + len(frames))]
+        )
+
+    async def test_non_resumable_stream_keeps_only_unread_frames(self):
+        started = asyncio.Event()
+        replay = await self.streams.start(
+            "g9", 1, self.producer(10, started), resumable=False
+        )
+        reader = replay.follow()
+        started.set()
+        await self.collect(reader, limit=4)
+        self.assertEqual(replay.start, 4)
+        self.assertEqual(replay.size, sum(len(entry[2]) for entry in replay.entries))
+        await self.collect(reader)
+        self.assertEqual(len(replay.entries), 0)
+        self.assertEqual(replay.size, 0)
+
+    async def test_gap_ends_the_response_with_an_error_event(self):
+        async def events():
+            yield b"data: 1\n\n"
+            raise ReplayGap("behind")
+
+        response = event_stream_response(events())
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertTrue(body.startswith(b"data: 1\n\n"))
+        self.assertIn(b"event: error", body)
+        self.assertIn(b"behind", body)
+
+    async def test_abandoned_resumable_stream_is_cancelled_after_grace(self):
+        started = asyncio.Event()
+        replay = await self.streams.start("g7", 1, self.producer(10**6, started, 0.01))
+        reader = replay.follow()
+        started.set()
+        await self.collect(reader, limit=1)
+        await reader.aclose()
+        await asyncio.sleep(0.02)
+        self.assertFalse(replay.task.done())
+        await asyncio.sleep(0.1)
+        self.assertTrue(replay.task.cancelled())
+
+    async def test_non_resumable_stream_stops_with_its_reader(self):
+        started = asyncio.Event()
+        replay = await self.streams.start(
+            "g8", 1, self.producer(10**6, started, 0.01), resumable=False
+        )
+        self.assertIsNone(self.streams.owner("g8"))
+        reader = replay.follow()
+        started.set()
+        await self.collect(reader, limit=1)
+        await reader.aclose()
+        await asyncio.sleep(0.01)
+        self.assertTrue(replay.task.cancelled())
@@ -0,0 +1,135 @@
+from django.test import SimpleTestCase
+
+from provider.retries import (
+    PERMANENT,
+    RATE_LIMITED,
+    TIMEOUT,
+    TRANSIENT,
+    RequestBudget,
+    RetryPolicy,
+    classify_error,
+    error_status,
+    retry_after,
+)
+from provider.tests.helpers import StatusError
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+class AuthenticationError(Exception):
+    pass
+
+
+class ClassifyErrorTests(SimpleTestCase):
+    def test_statuses(self):
+        self.assertEqual(classify_error(StatusError(429)), RATE_LIMITED)
+        self.assertEqual(classify_error(StatusError(408)), TIMEOUT)
+        self.assertEqual(classify_error(StatusError(503)), TRANSIENT)
+        self.assertEqual(classify_error(StatusError(400)), PERMANENT)
+
+    def test_names_and_causes(self):
+        self.assertEqual(classify_error(TimeoutError()), TIMEOUT)
+        self.assertEqual(classify_error(APIConnectionError()), TRANSIENT)
+        self.assertEqual(classify_error(ValueError("bad")), PERMANENT)
+        try:
+            raise Exception("wrapped") from StatusError(502)
+        except Exception as e:
+            self.assertEqual(classify_error(e), TRANSIENT)
+
+    def test_retry_after(self):
+        self.assertEqual(retry_after(StatusError(429, headers={"retry-after": "3"})), 3)
+        self.assertEqual(
+            retry_after(StatusError(429, headers={"retry-after-ms": "1500"})), 1.5
+        )
+        self.assertIsNone(retry_after(StatusError(429)))
+
+
+class ErrorStatusTests(SimpleTestCase):
+    def test_provider_4xx_is_passed_on(self):
+        self.assertEqual(error_status(StatusError(404)), 404)
+        self.assertEqual(error_status(StatusError(422)), 422)
+
+    def test_rejected_provider_key_is_a_bad_request(self):
+        self.assertEqual(error_status(StatusError(401)), 400)
+        self.assertEqual(error_status(AuthenticationError()), 400)
+
+    def test_retryable_and_unknown_errors(self):
+        self.assertEqual(error_status(StatusError(429)), 429)
+        self.assertEqual(error_status(StatusError(503)), 502)
+        self.assertEqual(error_status(TimeoutError()), 504)
+        self.assertEqual(error_status(ValueError("bug")), 500)
+
+
+class RequestBudgetTests(SimpleTestCase):
+    def test_spends_what_was_earned(self):
+        budget = RequestBudget(0.5, max_tokens=2)
+        self.assertFalse(budget.spend())
+        budget.deposit()
+        budget.deposit()
+        self.assertTrue(budget.spend())
+        self.assertFalse(budget.spend())
+
+    def test_capped(self):
+        budget = RequestBudget(1, max_tokens=2)
+        for _ in range(10):
+            budget.deposit()
+        self.assertEqual(budget.tokens, 2)
+
+
+class RetryPolicyTests(SimpleTestCase):
+    def failing(self, errors):
+        attempts = []
+
+        def call(attempt):
+            attempts.append(attempt)
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+
+        return call, attempts
+
+    def test_retries_transient_errors(self):
+        call, attempts = self.failing([StatusError(503), TimeoutError()])
+        policy = RetryPolicy(max_attempts=3, base_delay=0)
+        self.assertEqual(policy.call(call), "ok")
+        self.assertEqual(attempts, [0, 1, 2])
+
+    def test_gives_up_after_max_attempts(self):
+        call, attempts = self.failing([StatusError(503)] * 5)
+        with self.assertRaises(StatusError):
+            RetryPolicy(max_attempts=3, base_delay=0).call(call)
+        self.assertEqual(len(attempts), 3)
+
+    def test_does_not_retry_permanent_errors(self):
+        call, attempts = self.failing([StatusError(400)])
+        with self.assertRaises(StatusError):
+            RetryPolicy(base_delay=0).call(call)
+        self.assertEqual(attempts, [0])
+
+    def test_budget_caps_retries(self):
+        budget = RequestBudget(0, initial=1)
+        policy = RetryPolicy(max_attempts=5, base_delay=0, budget=budget)
+        call, attempts = self.failing([StatusError(503)] * 5)
+        with self.assertRaises(StatusError):
+            policy.call(call)
+        self.assertEqual(len(attempts), 2)
+
+    def test_long_retry_after_is_left_to_the_client(self):
+        error = StatusError(429, headers={"retry-after": "120"})
+        policy = RetryPolicy(max_retry_after=30)
+        self.assertIsNone(policy.backoff(1, error))
+        self.assertEqual(
+            policy.backoff(1, StatusError(429, headers={"retry-after": "2"})), 2
+        )
+
+    async def test_acall(self):
+        errors = [StatusError(502)]
+
+        async def call(attempt):
+            if errors:
+                raise errors.pop(0)
+            return attempt
+
+        self.assertEqual(await RetryPolicy(base_delay=0).acall(call), 1)
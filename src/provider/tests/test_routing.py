@@ -0,0 +1,85 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from provider.breakers import BreakerRegistry, CircuitOpenError
+from provider.retries import RetryPolicy
+from provider.routing import Candidate, Route
+from provider.tests.helpers import StatusError
+
+
+class RouteTestCase(SimpleTestCase):
+    def setUp(self):
+        caches["completions"].clear()
+        self.breakers = BreakerRegistry(min_requests=2, open_seconds=30)
+        for target, value in (
+            ("provider.routing.get_breakers", lambda: self.breakers),
+            (
+                "provider.routing.get_retry_policy",
+                lambda: RetryPolicy(max_attempts=2, base_delay=0),
+            ),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.route = Route(
+            [
+                Candidate("gpt-4o", "openai", None),
+                Candidate("claude-2", "anthropic", None),
+            ]
+        )
+
+
+class RouteTests(RouteTestCase):
+    def test_falls_back_on_provider_errors(self):
+        calls = []
+
+        def call(candidate):
+            calls.append(candidate.model_name)
+            if candidate.model_name == "gpt-4o":
+                raise StatusError(503)
+            return "answer"
+
+        candidate, result = self.route.complete(call)
+        self.assertEqual((candidate.model_name, result), ("claude-2", "answer"))
+        # Retried once, then the fallback
+        self.assertEqual(calls, ["gpt-4o", "gpt-4o", "claude-2"])
+
+    def test_request_errors_do_not_fall_back(self):
+        calls = []
+
+        def call(candidate):
+            calls.append(candidate.model_name)
+            raise StatusError(400)
+
+        for _ in range(3):
+            with self.assertRaises(StatusError):
+                self.route.complete(call)
+        self.assertEqual(calls, ["gpt-4o"] * 3)
+        self.assertEqual(self.breakers.get("openai", "gpt-4o").status()["requests"], 0)
+
+    def test_skips_open_circuits(self):
+        breaker = self.breakers.get("openai", "gpt-4o")
+        for _ in range(2):
+            breaker.record(error=StatusError(503))
+        candidate, _ = self.route.complete(lambda candidate: "answer")
+        self.assertEqual(candidate.model_name, "claude-2")
+
+    def test_every_circuit_open(self):
+        for candidate in self.route.candidates:
+            breaker = self.breakers.get(candidate.provider, candidate.model_name)
+            for _ in range(2):
+                breaker.record(error=StatusError(503))
+        with self.assertRaises(CircuitOpenError):
+            self.route.complete(lambda candidate: "answer")
+
+    async def test_stream_falls_back_before_the_first_chunk(self):
+        async def open_stream(candidate):
+            if candidate.model_name == "gpt-4o":
+                raise StatusError(502)
+            for chunk in ("a", "b"):
+                yield chunk
+
+        chunks = [chunk async for chunk in self.route.stream(open_stream)]
+        self.assertEqual(chunks, [("claude-2", "a"), ("claude-2", "b")])
@@ -0,0 +1,122 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from provider.similarity_cache import (
+    SimilarityCache,
+    normalize_messages,
+    similarity_scope,
+    similarity_threshold,
+)
+from provider.tests.helpers import GatewayTestCase, completion_response
+
+URL = "/provider/generate/completion/"
+
+
+def ask(content: str) -> list:
+    return [{"role": "user", "content": content}]
+
+
+QUESTION = (
+    "Summarize the attached quarterly sales report for the board meeting and "
+    "list the three regions with the largest growth, in a short paragraph."
+)
+
+
+class NormalizeMessagesTests(SimpleTestCase):
+    def test_masks_volatile_values(self):
+        first = normalize_messages(
+            ask("Report of 2026-10-17 12:30 for 0f8fad5b-d9cb-469f-a165-70867728950e")
+        )
+        second = normalize_messages(
+            ask("REPORT of 2025-01-02 09:15 for 7c9e6679-7425-40de-944b-e07fc1f90ae7")
+        )
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith("user: report of"))
+
+
+class SimilarityCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = SimilarityCache(max_entries=10)
+        self.cache.set("scope", ask(QUESTION), completion_response("North"), ttl=60)
+
+    def test_matches_near_duplicates(self):
+        response, similarity = self.cache.get(
+            "scope", ask(QUESTION.replace("short", "brief")), threshold=0.5
+        )
+        self.assertEqual(response, completion_response("North"))
+        self.assertGreaterEqual(similarity, 0.5)
+        self.assertLess(similarity, 1)
+
+        response, similarity = self.cache.get("scope", ask(QUESTION), threshold=0.99)
+        self.assertEqual(similarity, 1)
+
+    def test_misses_other_prompts_and_scopes(self):
+        response, _ = self.cache.get(
+            "scope", ask("Write a haiku about the sea at night."), threshold=0.5
+        )
+        self.assertIsNone(response)
+        response, _ = self.cache.get("other", ask(QUESTION), threshold=0.5)
+        self.assertIsNone(response)
+
+    def test_expired_entries_are_dropped(self):
+        with mock.patch("provider.similarity_cache.time.monotonic", return_value=1e12):
+            response, _ = self.cache.get("scope", ask(QUESTION), threshold=0.5)
+        self.assertIsNone(response)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_evicts_least_recently_used(self):
+        cache = SimilarityCache(max_entries=2)
+        for number in range(3):
+            cache.set("scope", ask(f"{QUESTION} Variant {number}"), {"n": number}, 60)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(len(cache._entries), 2)
+        self.assertTrue(all(cache._buckets.values()))
+
+    def test_scope_is_per_user(self):
+        self.assertNotEqual(
+            similarity_scope(1, "gpt-4o", {}), similarity_scope(2, "gpt-4o", {})
+        )
+
+    @override_settings(
+        SIMILARITY_CACHE_THRESHOLD=0.9, SIMILARITY_CACHE_THRESHOLDS={"gpt-4o": 0.97}
+    )
+    def test_threshold_per_model(self):
+        self.assertEqual(similarity_threshold("gpt-4o"), 0.97)
+        self.assertEqual(similarity_threshold("gpt-4o-mini"), 0.9)
+
+
+class SimilarityCacheViewTests(GatewayTestCase):
+    def setUp(self):
+        super().setUp()
+        self.similarity_cache = SimilarityCache()
+        patcher = mock.patch(
+            "provider.views.get_similarity_cache", lambda: self.similarity_cache
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def complete(self, content: str, **body):
+        return self.post(
+            URL,
+            {
+                "model_name": "gpt-4o-mini",
+                "messages": ask(content),
+                "cache": "read",
+                **body,
+            },
+        )
+
+    @override_settings(SIMILARITY_CACHE_THRESHOLDS={"gpt-4o-mini": 0.5})
+    def test_serves_a_near_duplicate(self):
+        self.assertEqual(self.complete(QUESTION)["X-Cache"], "MISS")
+        response = self.complete(QUESTION.replace("short", "brief"))
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response["X-Cache-Match"], "similar")
+        self.assertGreaterEqual(float(response["X-Cache-Similarity"]), 0.5)
+        self.assertEqual(len(self.llm.calls), 1)
+
+        # Different generation params are a different scope
+        response = self.complete(QUESTION.replace("short", "brief"), temperature=1)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(self.llm.calls), 2)
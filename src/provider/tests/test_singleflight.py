@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase
+
+from provider.retries import RATE_LIMITED, classify_error, error_status, retry_after
+from provider.singleflight import SharedFlightError, SingleFlight, StreamFlights
+from provider.tests.helpers import RateLimited
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        caches["completions"].clear()
+        self.calls = 0
+
+    def slow(self, result=None, error=None):
+        def fn():
+            self.calls += 1
+            time.sleep(0.2)
+            if error is not None:
+                raise error
+            return result
+
+        return fn
+
+    def in_thread(self, fn) -> tuple:
+        """Start `fn()` in a thread; returns the thread and a list its outcome lands in"""
+        outcome = []
+
+        def run():
+            try:
+                outcome.append(fn())
+            except Exception as e:
+                outcome.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread, outcome
+
+    def test_concurrent_calls_share_one(self):
+        flight = SingleFlight(5)
+        fn = self.slow({"id": 1})
+        threads = [self.in_thread(lambda: flight.do("key", fn)) for _ in range(5)]
+        for thread, _ in threads:
+            thread.join()
+        results = [outcome[0] for _, outcome in threads]
+        self.assertEqual(self.calls, 1)
+        self.assertEqual({result[0]["id"] for result in results}, {1})
+        self.assertEqual(sorted(result[1] for result in results), [False] + [True] * 4)
+
+    def test_error_is_shared(self):
+        flight = SingleFlight(5)
+        fn = self.slow(error=ValueError("boom"))
+        threads = [self.in_thread(lambda: flight.do("key", fn)) for _ in range(3)]
+        for thread, _ in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        for _, outcome in threads:
+            self.assertIsInstance(outcome[0], ValueError)
+
+    def test_result_shared_across_workers(self):
+        leader, follower = SingleFlight(5), SingleFlight(5)
+        fn = self.slow({"id": 2})
+        thread, outcome = self.in_thread(lambda: leader.do("key", fn))
+        time.sleep(0.05)
+        self.assertEqual(follower.do("key", fn), ({"id": 2}, True))
+        thread.join()
+        self.assertEqual(outcome[0], ({"id": 2}, False))
+        self.assertEqual(self.calls, 1)
+
+    def test_error_shared_across_workers_keeps_its_kind(self):
+        leader, follower = SingleFlight(5), SingleFlight(5)
+        fn = self.slow(error=RateLimited("slow down"))
+        thread, _ = self.in_thread(lambda: leader.do("key", fn))
+        time.sleep(0.05)
+        with self.assertRaises(SharedFlightError) as raised:
+            follower.do("key", fn)
+        thread.join()
+        error = raised.exception
+        self.assertEqual(str(error), "slow down")
+        self.assertEqual(classify_error(error), RATE_LIMITED)
+        self.assertEqual(error_status(error), 429)
+        self.assertEqual(retry_after(error), 7)
+
+    def test_lock_is_held_until_the_outcome_is_published(self):
+        leader, follower = SingleFlight(5), SingleFlight(5)
+        publishing, published = threading.Event(), threading.Event()
+        cache_set = LocMemCache.set
+
+        def slow_publish(cache, key, *args, **kwargs):
+            if key.startswith("flight_result_"):
+                publishing.set()
+                published.wait(5)
+            return cache_set(cache, key, *args, **kwargs)
+
+        def fn():
+            self.calls += 1
+            return {"id": 3}
+
+        with mock.patch.object(LocMemCache, "set", slow_publish):
+            thread, outcome = self.in_thread(lambda: leader.do("key", fn))
+            # The leader has its result but has not published it yet
+            self.assertTrue(publishing.wait(5))
+            waiter, waited = self.in_thread(lambda: follower.do("key", fn))
+            time.sleep(0.2)
+            published.set()
+            thread.join()
+            waiter.join()
+        self.assertEqual(outcome[0], ({"id": 3}, False))
+        self.assertEqual(waited[0], ({"id": 3}, True))
+        self.assertEqual(self.calls, 1)
+
+
+class StreamFlightsTests(SimpleTestCase):
+    async def test_subscribers_share_one_stream(self):
+        flights = StreamFlights()
+        opened = []
+
+        async def stream():
+            opened.append(1)
+            for chunk in range(5):
+                await asyncio.sleep(0.01)
+                yield chunk
+
+        async def subscribe(delay):
+            await asyncio.sleep(delay)
+            return [chunk async for chunk in flights.subscribe("key", stream)]
+
+        results = await asyncio.gather(subscribe(0), subscribe(0.02), subscribe(0.03))
+        self.assertEqual(opened, [1])
+        # Late subscribers get the chunks sent before they attached
+        self.assertEqual(results, [[0, 1, 2, 3, 4]] * 3)
+
+    async def test_error_reaches_every_subscriber(self):
+        flights = StreamFlights()
+
+        async def stream():
+            yield 0
+            await asyncio.sleep(0.01)
+            raise ValueError("mid-stream")
+
+        async def subscribe():
+            return [chunk async for chunk in flights.subscribe("key", stream)]
+
+        results = await asyncio.gather(subscribe(), subscribe(), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
@@ -0,0 +1,60 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from provider.sse import DONE, coalesce, encode_chunk, sse_event
+
+
+async def frames(*items, delay: float = 0, error: Exception = None):
+    for item in items:
+        await asyncio.sleep(delay)
+        yield item
+    if error is not None:
+        raise error
+
+
+class SSEFramingTests(SimpleTestCase):
+    def test_event(self):
+        payload = encode_chunk({"choices": [{"delta": {"content": "hi"}}]})
+        self.assertEqual(payload, b'{"choices":[{"delta":{"content":"hi"}}]}')
+        self.assertEqual(sse_event(payload), b"data: " + payload + b"\n\n")
+        self.assertEqual(
+            sse_event(b"{}", event="error", event_id=3),
+            b"id: 3\nevent: error\ndata: {}\n\n",
+        )
+        self.assertTrue(DONE.endswith(b"\n\n"))
+
+
+class CoalesceTests(SimpleTestCase):
+    async def collect(self, stream) -> list:
+        return [batch async for batch in stream]
+
+    async def test_no_limits_passes_frames_through(self):
+        batches = await self.collect(coalesce(frames(b"a", b"b", b"c")))
+        self.assertEqual(batches, [b"a", b"b", b"c"])
+
+    async def test_batches_by_size_and_never_holds_the_first_frame(self):
+        batches = await self.collect(
+            coalesce(frames(b"1", b"22", b"33", b"44", b"5"), max_bytes=4)
+        )
+        self.assertEqual(batches[0], b"1")
+        self.assertEqual(b"".join(batches), b"12233445")
+        self.assertEqual(batches[1], b"2233")
+        self.assertEqual(len(batches), 3)
+
+    async def test_flushes_after_interval(self):
+        batches = await self.collect(
+            coalesce(frames(b"a", b"b", b"c", delay=0.03), interval=0.05)
+        )
+        self.assertEqual(b"".join(batches), b"abc")
+        self.assertEqual(batches[0], b"a")
+        # A slow stream is not held back until it ends
+        self.assertGreater(len(batches), 1)
+
+    async def test_error_after_the_buffered_frames(self):
+        stream = coalesce(frames(b"a", b"b", error=ValueError("boom")), interval=1)
+        received = []
+        with self.assertRaises(ValueError):
+            async for batch in stream:
+                received.append(batch)
+        self.assertEqual(b"".join(received), b"ab")
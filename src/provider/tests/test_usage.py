@@ -0,0 +1,117 @@
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import TestCase
+
+from provider.models import UsageRecord
+from provider.routing import Candidate
+from provider.tests.helpers import GatewayTestCase, make_user
+from provider.usage import UsageLedger, is_usage_chunk
+
+MESSAGES = [{"role": "user", "content": "What is the capital of France?"}]
+
+
+def chunk(content: str) -> dict:
+    return {"choices": [{"delta": {"content": content}}]}
+
+
+class UsageLedgerTests(TestCase):
+    def setUp(self):
+        self.user = make_user("ledger")
+        self.scope = {"user_id": self.user.id, "api_key_id": None}
+        self.candidate = Candidate("gpt-4o", "openai", None)
+        # Flushed by the tests, not by the thread
+        self.ledger = UsageLedger(batch_size=100, flush_interval=3600)
+        self.addCleanup(self.ledger.close)
+
+    def test_records_reported_usage_and_cost(self):
+        call = self.ledger.call(self.scope, self.candidate, MESSAGES)
+        call.finish(
+            {
+                "choices": [{"message": {"content": "Paris."}}],
+                "usage": {"prompt_tokens": 14, "completion_tokens": 2},
+            }
+        )
+        self.assertEqual(self.ledger.flush(), 1)
+        record = UsageRecord.objects.get()
+        self.assertEqual((record.prompt_tokens, record.completion_tokens), (14, 2))
+        self.assertFalse(record.estimated)
+        self.assertFalse(record.streamed)
+        self.assertIsNotNone(record.cost)
+        self.assertGreater(record.cost, 0)
+
+    def test_counts_tokens_without_reported_usage(self):
+        call = self.ledger.call(self.scope, self.candidate, MESSAGES)
+        call.finish({"choices": [{"message": {"content": "Paris is the capital."}}]})
+        self.ledger.flush()
+        record = UsageRecord.objects.get()
+        self.assertTrue(record.estimated)
+        self.assertGreater(record.prompt_tokens, 0)
+        self.assertGreater(record.completion_tokens, 0)
+
+    def test_streamed_usage_comes_with_the_last_chunk(self):
+        call = self.ledger.call(self.scope, self.candidate, MESSAGES, streamed=True)
+        usage_chunk = {
+            "choices": [],
+            "usage": {"prompt_tokens": 14, "completion_tokens": 3},
+        }
+        for value in (chunk("Par"), chunk("is"), chunk("."), usage_chunk):
+            call.add_chunk(value)
+        self.assertTrue(is_usage_chunk(usage_chunk))
+        self.assertFalse(is_usage_chunk(chunk("Paris")))
+        self.assertEqual(call.chunks, 3)
+        call.finish()
+        self.ledger.flush()
+        record = UsageRecord.objects.get()
+        self.assertEqual((record.prompt_tokens, record.completion_tokens), (14, 3))
+        self.assertTrue(record.streamed)
+        self.assertIsNotNone(record.time_to_first_token_ms)
+
+    def test_records_stay_buffered_while_the_database_fails(self):
+        for _ in range(2):
+            self.ledger.call(self.scope, self.candidate, MESSAGES).finish()
+        with mock.patch.object(
+            UsageRecord.objects, "bulk_create", side_effect=DatabaseError("down")
+        ), self.assertLogs("provider.usage", "ERROR"):
+            self.assertEqual(self.ledger.flush(), 0)
+        self.assertEqual(self.ledger.buffered(), 2)
+        self.assertEqual(self.ledger.flush(), 2)
+        self.assertEqual(UsageRecord.objects.count(), 2)
+
+    def test_drops_the_oldest_beyond_max_buffered(self):
+        ledger = UsageLedger(batch_size=100, flush_interval=3600, max_buffered=2)
+        self.addCleanup(ledger.close)
+        for model_name in ("gpt-4o", "gpt-4o-mini", "gpt-4"):
+            ledger.call(
+                self.scope, Candidate(model_name, "openai", None), MESSAGES
+            ).finish()
+        self.assertEqual(ledger.buffered(), 2)
+        ledger.flush()
+        self.assertEqual(
+            sorted(UsageRecord.objects.values_list("model_name", flat=True)),
+            ["gpt-4", "gpt-4o-mini"],
+        )
+
+
+class CompletionUsageTests(GatewayTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ledger = UsageLedger(batch_size=100, flush_interval=3600)
+        self.addCleanup(self.ledger.close)
+        patcher = mock.patch(
+            "provider.views.get_usage_ledger", return_value=self.ledger
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_completion_is_charged_to_its_user(self):
+        response = self.post(
+            "/provider/generate/completion/",
+            {"model_name": "gpt-4o-mini", "messages": MESSAGES},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ledger.flush(), 1)
+        record = UsageRecord.objects.get()
+        self.assertEqual(record.user_id, self.user.id)
+        self.assertEqual(record.model_name, "gpt-4o-mini")
+        self.assertEqual((record.prompt_tokens, record.completion_tokens), (10, 2))
@@ -1,10 +1,18 @@
 from django.urls import path
 from .views import (
     PlaygroundGenerateCompletionView,
+    GenerationResumeView,
+    GenerationCancelView,
     APIKeyAuthenticatedGenerateCompletionView,
+    BatchGenerateCompletionView,
+    CompletionJobListCreateView,
+    CompletionJobDetailView,
     ProviderAPIKeyListCreateView,
     ProviderAPIKeyDetailView,
+    ProviderKeyUtilizationView,
     AIModelListView,
+    MetricsView,
+    ProviderHealthView,
 )
 
 app_name = "provider"
@@ -16,14 +24,48 @@ urlpatterns = [
         PlaygroundGenerateCompletionView.as_view(),
         name="generate-completion",
     ),
+    path(
+        "playground/generate/completion/<uuid:generation_id>/",
+        GenerationResumeView.as_view(),
+        name="generate-completion-resume",
+    ),
+    path(
+        "playground/generate/completion/<uuid:generation_id>/cancel/",
+        GenerationCancelView.as_view(),
+        name="generate-completion-cancel",
+    ),
     path(
         "generate/completion/",
         APIKeyAuthenticatedGenerateCompletionView.as_view(),
         name="api-generate-completion",
     ),
+    path(
+        "generate/completion/batch/",
+        BatchGenerateCompletionView.as_view(),
+        name="api-generate-completion-batch",
+    ),
+    path(
+        "generate/completion/jobs/",
+        CompletionJobListCreateView.as_view(),
+        name="api-generate-completion-jobs",
+    ),
+    path(
+        "generate/completion/jobs/<uuid:job_id>/",
+        CompletionJobDetailView.as_view(),
+        name="api-generate-completion-job",
+    ),
     # Provider API Key CRUD endpoints
     path("", ProviderAPIKeyListCreateView.as_view(), name="provider-list"),
+    path(
+        "utilization/",
+        ProviderKeyUtilizationView.as_view(),
+        name="provider-key-utilization",
+    ),
     path("<uuid:pk>/", ProviderAPIKeyDetailView.as_view(), name="provider-detail"),
     # AI Models listing endpoint
     path("ai/models/", AIModelListView.as_view(), name="ai-model-list"),
+    # Provider health: circuit breakers and routing averages
+    path("health/", ProviderHealthView.as_view(), name="provider-health"),
+    # Per-worker gateway metrics (admin only)
+    path("metrics/", MetricsView.as_view(), name="metrics"),
 ]
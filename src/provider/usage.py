@@ -0,0 +1,316 @@
+"""
+Usage ledger.
+
+Every upstream completion call (sync, hedged, batched or streamed) is
+recorded with its tokens, cost, latency and time to the first token, for
+the user and gateway API key of the request. Calls answered from a cache
+or shared with a concurrent identical request made no upstream call of
+their own and are not recorded.
+
+Recording only appends to an in-memory buffer. A background thread writes
+the buffer with `bulk_create` once `batch_size` records are waiting or
+every `flush_interval` seconds. Costs are computed from the catalog's
+per-token prices at that point, off the request path. So are the tokens
+of calls whose provider reported no usage, counted with the model's
+tokenizer (such records are marked `estimated`); streams ask for usage
+with their last chunk. If the database is
+unavailable, records stay buffered (at most `max_buffered`, oldest dropped
+first) and are written by a later flush. What is left is flushed when the
+process exits normally, which includes a server's graceful shutdown.
+"""
+
+import atexit
+import logging
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections
+from litellm import token_counter
+
+from provider.catalog import get_catalog
+from provider.keys import estimate_tokens
+from provider.metrics import metrics
+from provider.models import UsageRecord
+
+logger = logging.getLogger(__name__)
+
+
+def _field(value, name: str):
+    return value.get(name) if isinstance(value, dict) else getattr(value, name, None)
+
+
+def response_usage(response):
+    """`(prompt_tokens, completion_tokens)` reported with a response or chunk"""
+    usage = _field(response, "usage")
+    if usage is not None and not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else vars(usage)
+    if not usage or usage.get("completion_tokens") is None:
+        return None
+    return usage.get("prompt_tokens") or 0, usage["completion_tokens"]
+
+
+def is_usage_chunk(chunk) -> bool:
+    """A streamed chunk that only reports usage (no choices)"""
+    return not _field(chunk, "choices") and response_usage(chunk) is not None
+
+
+def response_text(response) -> str:
+    """Generated text of a response (`message`) or streamed chunk (`delta`)"""
+    parts = []
+    for choice in _field(response, "choices") or ():
+        message = _field(choice, "delta") or _field(choice, "message")
+        content = _field(message, "content") if message is not None else None
+        if isinstance(content, str):
+            parts.append(content)
+    return "".join(parts)
+
+
+def count_tokens(model_name: str, messages: list, text: str) -> tuple:
+    """
+    `(prompt_tokens, completion_tokens)` counted with the model's tokenizer
+    (LiteLLM picks it, falling back to a generic BPE), for providers that
+    report no usage
+    """
+    try:
+        return (
+            token_counter(model=model_name, messages=messages),
+            token_counter(model=model_name, text=text) if text else 0,
+        )
+    except Exception:
+        logger.warning("Could not tokenize for %s", model_name, exc_info=True)
+        return estimate_tokens(messages), len(text) // 4
+
+
+def token_cost(catalog, model_name: str, prompt_tokens: int, completion_tokens: int):
+    """Cost of the tokens at the catalog's prices, or None without a price"""
+    row_id = catalog.index.row_by_name.get(model_name)
+    if row_id is None:
+        return None
+    input_cost = catalog.columns.numeric["input_cost_per_token"][row_id]
+    output_cost = catalog.columns.numeric["output_cost_per_token"][row_id]
+    if math.isnan(input_cost) or math.isnan(output_cost):
+        return None
+    cost = prompt_tokens * float(input_cost) + completion_tokens * float(output_cost)
+    return Decimal(f"{cost:.12f}")
+
+
+class UsageCall:
+    """
+    Measures one upstream call for the ledger. Streamed chunks are passed
+    to `add_chunk`, which notes the first one, the text and any usage
+    reported with them; `finish(response)` records the call.
+    """
+
+    def __init__(self, ledger, scope: dict, candidate, messages: list, streamed=False):
+        self.ledger = ledger
+        self.scope = scope
+        self.candidate = candidate
+        self.messages = messages
+        self.streamed = streamed
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.chunks = 0
+        self.usage = None
+        self._text = []
+
+    @property
+    def produced(self) -> bool:
+        """Whether the stream returned anything, and so consumed tokens"""
+        return self.chunks > 0 or self.usage is not None
+
+    def add_chunk(self, chunk) -> None:
+        usage = response_usage(chunk)
+        if usage is not None:
+            self.usage = usage
+        text = response_text(chunk)
+        if not text:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.chunks += 1
+        self._text.append(text)
+
+    def finish(self, response=None) -> None:
+        ended = time.perf_counter()
+        if response is not None:
+            usage = response_usage(response)
+            text = response_text(response)
+        else:
+            usage = self.usage
+            text = "".join(self._text)
+        self.ledger.record(
+            user_id=self.scope["user_id"],
+            api_key_id=self.scope.get("api_key_id"),
+            provider=self.candidate.provider,
+            model_name=self.candidate.model_name,
+            # Without reported usage the tokens are counted when written
+            prompt_tokens=usage[0] if usage else None,
+            completion_tokens=usage[1] if usage else None,
+            estimate=None if usage else (self.messages, text),
+            latency_ms=(ended - self.started) * 1000,
+            time_to_first_token_ms=(
+                (self.first_token_at - self.started) * 1000
+                if self.first_token_at is not None
+                else None
+            ),
+            streamed=self.streamed,
+            created_at=time.time(),
+        )
+
+
+class UsageLedger:
+    def __init__(
+        self,
+        batch_size: int = 500,
+        flush_interval: float = 5,
+        max_buffered: int = 50000,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        # Serializes flushes between the thread and `close`
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def call(self, scope: dict, candidate, messages: list, streamed=False):
+        return UsageCall(self, scope, candidate, messages, streamed)
+
+    def record(self, **fields) -> None:
+        """
+        Buffer one record: `UsageRecord` fields, with `created_at` as a
+        timestamp and `estimate` as `(messages, text)` to count the tokens
+        of when they were not reported
+        """
+        with self._lock:
+            self._buffer.append(fields)
+            if len(self._buffer) > self.max_buffered:
+                self._buffer.popleft()
+                metrics.incr("usage.dropped")
+            full = len(self._buffer) >= self.batch_size
+        metrics.incr("usage.recorded")
+        if self._thread is None:
+            self._start()
+        if full:
+            self._wake.set()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is not None or self._stopped:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="usage-ledger", daemon=True
+            )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopped:
+                return
+            # Drops connections past CONN_MAX_AGE or left broken
+            close_old_connections()
+            self.flush()
+
+    def flush(self) -> int:
+        """Write the buffered records; returns how many were written"""
+        with self._flush_lock:
+            written = 0
+            while True:
+                with self._lock:
+                    batch = [
+                        self._buffer.popleft()
+                        for _ in range(min(self.batch_size, len(self._buffer)))
+                    ]
+                if not batch:
+                    return written
+                try:
+                    written += self._write(batch)
+                except DatabaseError:
+                    logger.exception("Could not write %d usage records", len(batch))
+                    metrics.incr("usage.flush_failed")
+                    with self._lock:
+                        # Kept for the next flush, oldest first
+                        self._buffer.extendleft(reversed(batch))
+                        while len(self._buffer) > self.max_buffered:
+                            self._buffer.popleft()
+                            metrics.incr("usage.dropped")
+                    return written
+
+    def _write(self, batch: list) -> int:
+        started = time.perf_counter()
+        catalog = get_catalog()
+        records = []
+        for fields in batch:
+            fields = dict(fields)
+            estimate = fields.pop("estimate")
+            if estimate is not None:
+                fields["prompt_tokens"], fields["completion_tokens"] = count_tokens(
+                    fields["model_name"], *estimate
+                )
+            fields["estimated"] = estimate is not None
+            fields["created_at"] = datetime.fromtimestamp(
+                fields["created_at"], timezone.utc
+            )
+            fields["cost"] = token_cost(
+                catalog,
+                fields["model_name"],
+                fields["prompt_tokens"],
+                fields["completion_tokens"],
+            )
+            records.append(UsageRecord(**fields))
+        written = len(records)
+        try:
+            UsageRecord.objects.bulk_create(records)
+        except IntegrityError:
+            # E.g. a user deleted meanwhile: write the others one by one
+            written = 0
+            for record in records:
+                try:
+                    record.save(force_insert=True)
+                    written += 1
+                except IntegrityError:
+                    metrics.incr("usage.dropped")
+        metrics.incr("usage.flushed", written)
+        metrics.observe("usage.flush_seconds", time.perf_counter() - started)
+        return written
+
+    def close(self) -> None:
+        """Stop the flushing thread and write what is left"""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger() -> UsageLedger:
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                ledger = UsageLedger(
+                    batch_size=getattr(settings, "USAGE_FLUSH_SIZE", 500),
+                    flush_interval=getattr(settings, "USAGE_FLUSH_INTERVAL", 5),
+                    max_buffered=getattr(settings, "USAGE_MAX_BUFFERED", 50000),
+                )
+                metrics.gauge("usage.buffered", ledger.buffered)
+                atexit.register(ledger.close)
+                _ledger = ledger
+    return _ledger
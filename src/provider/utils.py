@@ -1,23 +1,39 @@
-import os
-import json
-from provider.generate import BaseLLM, LLM_Factory
-import requests
+from typing import ContextManager
 
+from django.core.cache import cache
 
-def chat_completion(api_key: str, provider: str) -> BaseLLM:
-    llm = LLM_Factory(provider)
-    llm.api_key = api_key
-    return llm
+from provider.generate import BaseLLM
+from provider.catalog import get_catalog
+from provider.clients import get_client_pool
+from provider.models import ProviderAPIKey
+
+
+def chat_completion(api_key: str, provider: str) -> ContextManager[BaseLLM]:
+    """
+    Pooled client for (provider, api_key), shared across requests and
+    leased for the `with` block using it
+    """
+    return get_client_pool().lease(provider, api_key)
 
 
 def get_model_list():
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
-    }
-    response = requests.get(
-        "https://raw.githubusercontent.com/LLM-Gateway-ORG/llm-gateway-backend/refs/heads/main/src/provider/generate/data/models_list.json",
-        headers=headers,
-        timeout=10,
-    )
-    response.raise_for_status()
-    return response.json()
+    """Return the in-process model catalog (no network I/O)"""
+    return get_catalog().models
+
+
+def get_active_providers(user_id) -> frozenset:
+    """Providers the user has registered an API key for (cached per user)"""
+    cache_key = f"active_providers_{user_id}"
+    active_providers = cache.get(cache_key)
+    if active_providers is None:
+        active_providers = frozenset(
+            ProviderAPIKey.objects.filter(user_id=user_id)
+            .values_list("provider", flat=True)
+            .distinct()
+        )
+        cache.set(cache_key, active_providers, timeout=3600)
+    return active_providers
+
+
+def invalidate_active_providers(user_id) -> None:
+    cache.delete(f"active_providers_{user_id}")
@@ -1,91 +1,526 @@
+import asyncio
+import hashlib
 import json
+import math
+import os
+import time
+from collections import defaultdict
 
+from asgiref.sync import async_to_sync
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django.http import StreamingHttpResponse, JsonResponse
+from django.conf import settings
 from django.core.cache import cache
+from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
 from django.db import transaction
 from rest_framework import status
 from rest_framework.response import Response
 
 from authentication.permissions import APIKeyPermission
 from provider.models import ProviderAPIKey
-from provider.utils import chat_completion, get_model_list
+from provider.utils import (
+    chat_completion,
+    get_active_providers,
+    invalidate_active_providers,
+)
+from provider.catalog import (
+    AUTO_MODEL,
+    get_catalog,
+    parse_auto_constraints,
+    select_cheapest_model,
+)
 from provider.serializers import (
     ProviderAPIKeySerializer,
     ProviderAPIKeyCreateSerializer,
     ProviderAPIKeyUpdateSerializer,
 )
-from provider.helpers import decrypt_value
+from provider.completion_cache import (
+    completion_cache_key,
+    generation_params,
+    get_cached_completion,
+    parse_cache_options,
+    set_cached_completion,
+)
+from provider.keys import (
+    ProviderCredential,
+    StoredKey,
+    get_key_rotator,
+    invalidate_stored_keys,
+)
+from provider.hedging import get_hedger
+from provider.retries import error_status, retry_after
+from provider.breakers import CircuitOpenError, get_breakers
+from provider.routing import (
+    Candidate,
+    Route,
+    get_latency_tracker,
+    parse_routing_options,
+)
+from provider.sse import DONE, coalesce, encode_chunk, sse_event
+from provider.generations import CANCELLED, COMPLETED, FAILED, get_generations
+from provider.replay import ReplayGap, get_replay_streams
+from provider.jobs import QueueFull, check_callback_url, get_job_pool
+from provider import deadlines
+from provider.deadlines import (
+    DeadlineExceeded,
+    deadline_scope,
+    model_timeout,
+    parse_timeout,
+    set_deadline,
+)
+from provider.singleflight import get_single_flight, get_stream_flights
+from provider.usage import get_usage_ledger, is_usage_chunk
+from provider.similarity_cache import (
+    get_similarity_cache,
+    similarity_scope,
+    similarity_threshold,
+)
+from provider.metrics import metrics
 
 # Create your views here.
 
 
+def event_stream_response(events) -> StreamingHttpResponse:
+    """SSE response of the framed `events`, coalesced per SSE_FLUSH_*"""
+
+    async def stream_events():
+        try:
+            async for frame in events:
+                yield frame
+        except ReplayGap as e:
+            metrics.incr("replay.gaps")
+            yield sse_event(
+                encode_chunk(
+                    {
+                        "error": str(e)
+                        or "The events after Last-Event-ID are no longer buffered."
+                    }
+                ),
+                event="error",
+            )
+
+    response = StreamingHttpResponse(
+        streaming_content=coalesce(
+            stream_events(),
+            interval=getattr(settings, "SSE_FLUSH_INTERVAL_MS", 0) / 1000,
+            max_bytes=getattr(settings, "SSE_FLUSH_BYTES", 0),
+        ),
+        content_type="text/event-stream",
+    )
+    # Let nginx pass chunks through as they arrive
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 class BaseGenerateCompletionView(APIView):
     def get_permission_classes(self):
         """Override this method in subclasses to set specific permissions."""
         raise NotImplementedError("Subclasses must define permission classes")
 
+    def dispatch(self, request, *args, **kwargs):
+        # Confines the deadline set by `start_deadline` to this request
+        with deadline_scope():
+            return super().dispatch(request, *args, **kwargs)
+
+    def usage_scope(self) -> dict:
+        """Who the usage ledger charges this request's upstream calls to"""
+        return {
+            "user_id": self.request.user.id,
+            "api_key_id": getattr(self.request, "api_key_id", None),
+        }
+
+    def start_deadline(self, request, model_name: str, default: float = None):
+        """
+        Start the request's deadline (see `provider.deadlines`); the
+        timeout defaults to the model's. Returns `(deadline, error_response)`.
+        """
+        try:
+            timeout = parse_timeout(
+                request.headers,
+                model_timeout(model_name) if default is None else default,
+            )
+        except ValueError as e:
+            return None, JsonResponse({"error": str(e)}, status=400)
+        deadline = time.monotonic() + timeout
+        set_deadline(deadline)
+        return deadline, None
+
+    def deadline_error(self, route: Route):
+        """
+        A 504 when the route's models have lately been too slow to answer
+        before the deadline, so that no upstream capacity is spent on it
+        """
+        left = deadlines.remaining()
+        if left is None:
+            return None
+        expected = route.expected_latency(
+            getattr(settings, "DEADLINE_REJECT_PERCENTILE", 0.1),
+            getattr(settings, "DEADLINE_MIN_SAMPLES", 20),
+        )
+        if expected is None or expected <= left:
+            return None
+        metrics.incr("deadline.rejected")
+        return JsonResponse(
+            {
+                "error": f"The request cannot complete within its deadline: "
+                f"{left:.1f}s are left and {route.primary.model_name} currently "
+                f"takes at least {expected:.1f}s."
+            },
+            status=504,
+        )
+
     def generate_stream_response(
-        self, messages: list, model_name: str, provider: str, api_key: str
+        self,
+        messages: list,
+        route: Route,
+        user_id,
+        flight_key: str = None,
+        deadline: float = None,
+        resumable: bool = False,
     ):
-        """Generate streaming response for async endpoints"""
+        """
+        Generate streaming response for async endpoints. Requests with the
+        same `flight_key` share one upstream stream. The first event holds
+        the generation id, which `user_id` can cancel the stream with (see
+        `provider.generations`) or, when `resumable`, resume it with after a
+        lost connection (see `provider.replay`); otherwise the stream stops
+        when the client disconnects. When the request was routed, a `served_by`
+        event names the model before its chunks. Events are framed and
+        coalesced as described in `provider.sse`. The stream fails when the
+        provider sends nothing for STREAM_IDLE_TIMEOUT seconds or at
+        `deadline`.
+        """
 
-        async def stream_chat():
+        usage = self.usage_scope()
+
+        async def open_candidate_stream(candidate: Candidate):
+            with candidate.credential.lease(messages) as lease, chat_completion(
+                api_key=lease.api_key, provider=candidate.provider
+            ) as llm:
+                measured = get_usage_ledger().call(
+                    usage, candidate, messages, streamed=True
+                )
+                try:
+                    async for chunk in llm.async_completion(
+                        candidate.model_name, messages
+                    ):
+                        measured.add_chunk(chunk)
+                        if is_usage_chunk(chunk):
+                            # Asked for by the provider client, for the ledger
+                            continue
+                        yield encode_chunk(chunk)
+                finally:
+                    # Also when cancelled: the chunks sent were consumed
+                    if measured.produced:
+                        measured.finish()
+
+        def open_stream():
+            return route.stream(open_candidate_stream)
+
+        async def produce(generation, replay):
+            with deadline_scope(deadline):
+                await produce_events(generation, replay)
+
+        async def produce_events(generation, replay):
+            event_id = 0
             try:
-                llm = chat_completion(
-                    api_key=api_key,
-                    provider=provider,
+                replay.append(
+                    sse_event(
+                        encode_chunk({"generation_id": generation.id}),
+                        event="generation",
+                    )
                 )
-                async for response in llm.async_completion(model_name, messages):
-                    yield f"data: {response}\n\n"
+                if flight_key:
+                    stream = get_stream_flights().subscribe(flight_key, open_stream)
+                else:
+                    stream = open_stream()
+                async for model_name, payload in generation.watch(
+                    stream,
+                    idle_timeout=getattr(settings, "STREAM_IDLE_TIMEOUT", 30),
+                    deadline=deadline,
+                ):
+                    if generation.model_name is None:
+                        generation.model_name = model_name
+                        if route.routed:
+                            replay.append(
+                                sse_event(
+                                    encode_chunk({"model_name": model_name}),
+                                    event="served_by",
+                                )
+                            )
+                    event_id += 1
+                    replay.append(sse_event(payload, event_id=event_id), event_id)
+                if generation.cancelled:
+                    generation.outcome = CANCELLED
+                    replay.append(
+                        sse_event(
+                            encode_chunk({"generation_id": generation.id}),
+                            event="cancelled",
+                        )
+                    )
+                else:
+                    generation.outcome = COMPLETED
+                replay.append(DONE)
             except Exception as e:
-                yield f"data: Error in chat completion: {str(e)}\n\n"
+                generation.outcome = FAILED
+                replay.append(
+                    sse_event(
+                        encode_chunk({"error": f"Error in chat completion: {str(e)}"}),
+                        event="error",
+                    )
+                )
+            finally:
+                # Without an outcome nobody reconnected in time
+                await get_generations().finish(generation)
 
-        return StreamingHttpResponse(
-            streaming_content=stream_chat(), content_type="text/event-stream"
-        )
+        async def stream_chat():
+            # The stream outlives this request until it ends or is abandoned
+            generation = await get_generations().start(user_id)
+            replay = await get_replay_streams().start(
+                generation.id,
+                user_id,
+                lambda replay: produce(generation, replay),
+                resumable=resumable,
+            )
+            async for frame in replay.follow():
+                yield frame
+
+        return event_stream_response(stream_chat())
+
+    def complete(self, messages: list, route: Route, hedge: bool = False) -> tuple:
+        """
+        Complete `messages` over `route`, blocking; returns the model that
+        served the completion and its response. With `hedge`, a slow call
+        is raced against a second attempt (see `provider.hedging`).
+        """
+
+        usage = self.usage_scope()
+
+        def call(candidate: Candidate):
+            with candidate.credential.lease(messages) as lease, chat_completion(
+                api_key=lease.api_key, provider=candidate.provider
+            ) as llm:
+                measured = get_usage_ledger().call(usage, candidate, messages)
+                full_response = llm.completion(candidate.model_name, messages)
+                lease.record_usage(full_response)
+                measured.finish(full_response)
+                return full_response
+
+        async def acall(candidate: Candidate):
+            with candidate.credential.lease(messages) as lease, chat_completion(
+                api_key=lease.api_key, provider=candidate.provider
+            ) as llm:
+                measured = get_usage_ledger().call(usage, candidate, messages)
+                full_response = await llm.acompletion(candidate.model_name, messages)
+                lease.record_usage(full_response)
+                measured.finish(full_response)
+                return full_response
+
+        if hedge:
+            candidate, full_response = async_to_sync(get_hedger().complete)(
+                route, acall
+            )
+        else:
+            candidate, full_response = route.complete(call)
+        return candidate.model_name, full_response
 
     def generate_sync_response(
-        self, messages: list, model_name: str, provider: str, api_key: str
+        self,
+        messages: list,
+        route: Route,
+        on_success=None,
+        flight_key: str = None,
+        hedge: bool = False,
+    ):
+        """
+        Generate complete response for non-streaming endpoints.
+        `on_success` is called with each successful response and the model
+        that served it (caching). Concurrent requests with the same
+        `flight_key` share one upstream call. See `complete` for `hedge`.
+        """
+
+        def complete():
+            return self.complete(messages, route, hedge)
+
+        error_response = self.deadline_error(route)
+        if error_response:
+            return error_response
+
+        try:
+            coalesced = False
+            if flight_key:
+                (served_by, full_response), coalesced = get_single_flight().do(
+                    flight_key, complete
+                )
+            else:
+                served_by, full_response = complete()
+            if on_success:
+                on_success(full_response, served_by)
+            response = JsonResponse({"response": full_response, "served_by": served_by})
+            if coalesced:
+                response["X-Coalesced"] = "true"
+            return response
+        except CircuitOpenError as e:
+            response = JsonResponse({"error": str(e)}, status=503)
+            response["Retry-After"] = f"{e.retry_after:.0f}"
+            return response
+        except Exception as e:
+            response = JsonResponse({"error": str(e)}, status=error_status(e))
+            wait = retry_after(e)
+            if wait is not None:
+                response["Retry-After"] = f"{math.ceil(wait)}"
+            return response
+
+    def get_credential(
+        self, request, provider: str, api_key: str = None
+    ) -> ProviderCredential:
+        """
+        The API key sent in the body, else the user's stored keys for
+        `provider`, rotated per call and decrypted only when used
+        """
+        return ProviderCredential(request.user.id, provider, api_key)
+
+    def get_route(
+        self,
+        request,
+        model_name: str,
+        provider: str,
+        api_key: str = None,
+        body: dict = None,
+        credentials: dict = None,
     ):
-        """Generate complete response for non-streaming endpoints"""
+        """
+        Route to `model_name` and the request's `fallback_models`. A body
+        API key is only used for models of its own provider; fallbacks to
+        providers the user holds no key for are skipped. `credentials`
+        shares stored-key credentials (by provider) across calls.
+        """
+        body = request.data if body is None else body
         try:
-            llm = chat_completion(
-                api_key=api_key,
-                provider=provider,
+            policy, fallback_models = parse_routing_options(body)
+        except ValueError as e:
+            return None, JsonResponse({"error": str(e)}, status=400)
+
+        catalog = get_catalog()
+        for fallback_model in fallback_models:
+            if fallback_model not in catalog or fallback_model == AUTO_MODEL:
+                return None, JsonResponse(
+                    {"error": f"The fallback model '{fallback_model}' does not exist."},
+                    status=400,
+                )
+
+        credentials = {} if credentials is None else credentials
+
+        def credential_for(candidate_provider):
+            if api_key and candidate_provider == provider:
+                return self.get_credential(request, provider, api_key)
+            if candidate_provider not in credentials:
+                credentials[candidate_provider] = self.get_credential(
+                    request, candidate_provider
+                )
+            return credentials[candidate_provider]
+
+        candidates = [Candidate(model_name, provider, credential_for(provider))]
+        active_providers = (
+            get_active_providers(request.user.id) if fallback_models else ()
+        )
+        for fallback_model in fallback_models:
+            fallback_provider = catalog[fallback_model]["provider"]
+            if any(c.model_name == fallback_model for c in candidates):
+                continue
+            if fallback_provider not in active_providers and not (
+                api_key and fallback_provider == provider
+            ):
+                metrics.incr("routing.fallbacks_skipped")
+                continue
+            candidates.append(
+                Candidate(
+                    fallback_model, fallback_provider, credential_for(fallback_provider)
+                )
             )
+        return Route(candidates, policy), None
 
-            full_response = llm.completion(model_name, messages)
-            return JsonResponse({"response": full_response})
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
+    def get_flight_key(self, request, messages, route: Route):
+        """
+        Key shared by identical in-flight requests of the same credential
+        owner, or None when coalescing is off for this request. Only
+        deterministic (temperature 0) requests are coalesced, unless the
+        request opts in with `"coalesce": true`: sampled completions of the
+        same prompt are expected to differ.
+        """
+        if not getattr(settings, "SINGLE_FLIGHT_ENABLED", True):
+            return None
+        coalesce = request.data.get("coalesce")
+        params = {**generation_params(request.data), **route.params}
+        if coalesce is False:
+            return None
+        if coalesce is not True and params.get("temperature") != 0:
+            return None
+        return "flight_" + completion_cache_key(
+            route.primary.credential.owner,
+            route.primary.model_name,
+            messages,
+            params,
+        )
 
-    def validate_request(self, request):
-        """Common validation logic"""
+    def validate_request(self, request, body: dict = None):
+        """
+        Common validation logic, for `request.data` or the given `body`.
+        The returned `api_key` is None when the user's stored keys are to be
+        used; see `get_credential`.
+        """
         try:
-            body = request.data
+            body = request.data if body is None else body
             messages = body.get("messages", [])
             model_name = body.get("model_name")
             api_key = body.get("api_key", None)
 
             # Check AI models list
-            ai_models_list = get_model_list()
-            if model_name not in ai_models_list:
+            catalog = get_catalog()
+            available_providers = None
+            if model_name == AUTO_MODEL:
+                if api_key:
+                    return None, JsonResponse(
+                        {
+                            "error": "An API key in the request body cannot be used with model_name 'auto'."
+                        },
+                        status=400,
+                    )
+                try:
+                    constraints = parse_auto_constraints(body.get("constraints"))
+                    allowed_providers = constraints.pop("providers", None)
+                    available_providers = get_active_providers(request.user.id)
+                    if allowed_providers is not None:
+                        available_providers &= set(allowed_providers)
+                    model_name = select_cheapest_model(
+                        catalog, available_providers, **constraints
+                    )
+                except ValueError as e:
+                    return None, JsonResponse({"error": str(e)}, status=400)
+                if model_name is None:
+                    return None, JsonResponse(
+                        {
+                            "error": "No model matches the given constraints for your registered providers."
+                        },
+                        status=400,
+                    )
+            elif model_name not in catalog:
                 return None, JsonResponse(
-                    {"error": "The specified model does not exist."}
+                    {"error": "The specified model does not exist."}, status=400
                 )
+            provider = catalog[model_name]["provider"]
 
             # Check API Key
             if not api_key:
-                available_providers = set(
-                    ProviderAPIKey.objects.filter(user=request.user)
-                    .values_list("provider", flat=True)
-                    .distinct()
-                )
-                if ai_models_list[model_name]["provider"] not in available_providers:
+                if available_providers is None:
+                    available_providers = get_active_providers(request.user.id)
+                if provider not in available_providers:
                     return None, JsonResponse(
                         {
                             "error": "Please provide an API key in the request body or register an API key for the specified provider."
@@ -93,15 +528,10 @@ class BaseGenerateCompletionView(APIView):
                         status=400,
                     )
 
-                api_key = ProviderAPIKey.objects.get(
-                    provider=ai_models_list[model_name]["provider"]
-                ).api_key
-                api_key = decrypt_value(api_key)
-
             return (
                 messages,
                 model_name,
-                ai_models_list[model_name]["provider"],
+                provider,
                 api_key,
             ), None
         except json.JSONDecodeError:
@@ -119,7 +549,81 @@ class PlaygroundGenerateCompletionView(BaseGenerateCompletionView):
             return error_response
 
         messages, model_name, provider, api_key = validation_result
-        return self.generate_stream_response(messages, model_name, provider, api_key)
+        resumable = request.data.get("resumable", False)
+        if not isinstance(resumable, bool):
+            return JsonResponse({"error": "'resumable' must be a boolean."}, status=400)
+        deadline, error_response = self.start_deadline(
+            request, model_name, getattr(settings, "STREAM_MAX_DURATION", 300)
+        )
+        if error_response:
+            return error_response
+        route, error_response = self.get_route(request, model_name, provider, api_key)
+        if error_response:
+            return error_response
+        error_response = self.deadline_error(route)
+        if error_response:
+            return error_response
+        return self.generate_stream_response(
+            messages,
+            route,
+            request.user.id,
+            flight_key=self.get_flight_key(request, messages, route),
+            deadline=deadline,
+            resumable=resumable,
+        )
+
+
+class GenerationResumeView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, generation_id) -> StreamingHttpResponse:
+        """
+        Reconnect to a playground stream started with `"resumable": true`:
+        the events after `Last-Event-ID`
+        (header, or `last_event_id` query parameter), then the live ones
+        """
+        generation_id = str(generation_id)
+        replays = get_replay_streams()
+        if replays.owner(generation_id) != request.user.id:
+            return JsonResponse({"error": "Generation not found."}, status=404)
+        last_event_id = request.headers.get(
+            "Last-Event-ID", request.query_params.get("last_event_id", 0)
+        )
+        try:
+            last_event_id = int(last_event_id)
+            if last_event_id < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return JsonResponse(
+                {"error": "'Last-Event-ID' must be a non-negative integer."},
+                status=400,
+            )
+        try:
+            events = replays.resume(generation_id, last_event_id)
+        except ReplayGap:
+            metrics.incr("replay.gaps")
+            return JsonResponse(
+                {
+                    "error": "The events after Last-Event-ID are no longer buffered; "
+                    "start a new completion."
+                },
+                status=410,
+            )
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        return event_stream_response(events)
+
+
+class GenerationCancelView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, generation_id):
+        """Stop a streamed generation of the user, in whichever worker it runs"""
+        if not get_generations().cancel(str(generation_id), request.user.id):
+            return JsonResponse({"error": "Generation not found."}, status=404)
+        return JsonResponse(
+            {"generation_id": str(generation_id), "status": "cancelling"}, status=202
+        )
 
 
 class APIKeyAuthenticatedGenerateCompletionView(BaseGenerateCompletionView):
@@ -131,7 +635,321 @@ class APIKeyAuthenticatedGenerateCompletionView(BaseGenerateCompletionView):
             return error_response
 
         messages, model_name, provider, api_key = validation_result
-        return self.generate_sync_response(messages, model_name, provider, api_key)
+        try:
+            cache_mode, cache_ttl = parse_cache_options(request.data)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        _, error_response = self.start_deadline(request, model_name)
+        if error_response:
+            return error_response
+        route, error_response = self.get_route(request, model_name, provider, api_key)
+        if error_response:
+            return error_response
+        hedge = request.data.get("hedge", False)
+        if not isinstance(hedge, bool):
+            return JsonResponse({"error": "'hedge' must be a boolean."}, status=400)
+        hedge = hedge and getattr(settings, "HEDGE_BUDGET", 0.05) > 0
+
+        if cache_mode == "bypass":
+            response = self.generate_sync_response(
+                messages,
+                route,
+                flight_key=self.get_flight_key(request, messages, route),
+                hedge=hedge,
+            )
+            response["X-Cache"] = "BYPASS"
+            return response
+
+        params = generation_params(request.data)
+        cache_key = completion_cache_key(request.user.id, model_name, messages, params)
+        similarity_cache = get_similarity_cache()
+        scope = similarity_scope(request.user.id, model_name, params)
+        if cache_mode == "read":
+            # Served without touching the credential or the provider
+            cached_response = get_cached_completion(cache_key)
+            if cached_response is not None:
+                response = JsonResponse(
+                    {"response": cached_response, "served_by": model_name}
+                )
+                response["X-Cache"] = "HIT"
+                response["X-Cache-Match"] = "exact"
+                return response
+            if similarity_cache is not None:
+                cached_response, similarity = similarity_cache.get(
+                    scope, messages, similarity_threshold(model_name)
+                )
+                if cached_response is not None:
+                    response = JsonResponse(
+                        {"response": cached_response, "served_by": model_name}
+                    )
+                    response["X-Cache"] = "HIT"
+                    response["X-Cache-Match"] = "similar"
+                    response["X-Cache-Similarity"] = f"{similarity:.3f}"
+                    return response
+
+        def store(full_response, served_by):
+            # Only the requested model's answers are cached under its key
+            if served_by != model_name:
+                return
+            set_cached_completion(cache_key, full_response, cache_ttl)
+            if similarity_cache is not None:
+                similarity_cache.set(scope, messages, full_response, cache_ttl)
+
+        response = self.generate_sync_response(
+            messages,
+            route,
+            on_success=store,
+            flight_key=self.get_flight_key(request, messages, route),
+            hedge=hedge,
+        )
+        response["X-Cache"] = "MISS"
+        return response
+
+
+class BatchGenerateCompletionView(BaseGenerateCompletionView):
+    permission_classes = [APIKeyPermission]
+
+    def post(self, request) -> StreamingHttpResponse:
+        """
+        Complete `items` (each with model_name and messages) concurrently.
+        Results stream back as NDJSON lines in completion order. Items still
+        pending at the batch's deadline fail with a 504.
+        """
+        items = request.data.get("items")
+        max_items = getattr(settings, "BATCH_MAX_ITEMS", 1000)
+        if not isinstance(items, list) or not items:
+            return JsonResponse(
+                {"error": "'items' must be a non-empty list."}, status=400
+            )
+        if len(items) > max_items:
+            return JsonResponse(
+                {"error": f"A batch can hold at most {max_items} items."}, status=400
+            )
+        concurrency = getattr(settings, "BATCH_PROVIDER_CONCURRENCY", 8)
+        try:
+            concurrency = min(
+                concurrency, int(request.data.get("concurrency", concurrency))
+            )
+        except (TypeError, ValueError):
+            return JsonResponse(
+                {"error": "'concurrency' must be an integer."}, status=400
+            )
+        if concurrency < 1:
+            return JsonResponse(
+                {"error": "'concurrency' must be positive."}, status=400
+            )
+        deadline, error_response = self.start_deadline(
+            request, None, getattr(settings, "BATCH_MAX_DURATION", 300)
+        )
+        if error_response:
+            return error_response
+
+        # Validate and route every item, loading each provider's keys once
+        errors, jobs, credentials = [], {}, {}
+        for index, item in enumerate(items):
+            item_id = item.get("id") if isinstance(item, dict) else None
+            if not isinstance(item, dict):
+                error_response = JsonResponse(
+                    {"error": "Each item must be an object."}, status=400
+                )
+            else:
+                validation_result, error_response = self.validate_request(request, item)
+            if not error_response:
+                messages, model_name, provider, api_key = validation_result
+                route, error_response = self.get_route(
+                    request, model_name, provider, api_key, item, credentials
+                )
+            if not error_response:
+                error_response = self.deadline_error(route)
+            if error_response:
+                errors.append(
+                    {
+                        "index": index,
+                        "id": item_id,
+                        "status": "error",
+                        "status_code": error_response.status_code,
+                        "error": json.loads(error_response.content)["error"],
+                    }
+                )
+                continue
+
+            job_key = completion_cache_key(
+                route.primary.credential.owner,
+                model_name,
+                messages,
+                {**generation_params(item), **route.params},
+            )
+            job = jobs.setdefault(
+                job_key,
+                {
+                    "model_name": model_name,
+                    "messages": messages,
+                    "route": route,
+                    "items": [],
+                },
+            )
+            job["items"].append((index, item_id))
+
+        metrics.incr("batch.items", len(items))
+        metrics.incr("batch.deduplicated", len(items) - len(errors) - len(jobs))
+        response = StreamingHttpResponse(
+            streaming_content=self.stream_batch(errors, jobs, concurrency, deadline),
+            content_type="application/x-ndjson",
+        )
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def stream_batch(
+        self, errors: list, jobs: dict, concurrency: int, deadline: float
+    ):
+        """
+        Run `jobs` with at most `concurrency` in flight per provider, and
+        stop those still pending at `deadline`
+        """
+        for error in errors:
+            yield json.dumps(error) + "\n"
+
+        semaphores = defaultdict(lambda: asyncio.Semaphore(concurrency))
+        usage = self.usage_scope()
+
+        async def call(candidate: Candidate, messages: list, elapsed: list):
+            async with semaphores[candidate.provider]:
+                started = time.perf_counter()
+                try:
+                    with candidate.credential.lease(messages) as lease, chat_completion(
+                        api_key=lease.api_key, provider=candidate.provider
+                    ) as llm:
+                        measured = get_usage_ledger().call(usage, candidate, messages)
+                        response = await llm.acompletion(candidate.model_name, messages)
+                        lease.record_usage(response)
+                        measured.finish(response)
+                        return response
+                finally:
+                    elapsed.append(time.perf_counter() - started)
+
+        async def run(job_key, job):
+            # Upstream time of every attempt, excluding the wait for a slot
+            elapsed = []
+            try:
+                candidate, response = await job["route"].acomplete(
+                    lambda candidate: call(candidate, job["messages"], elapsed)
+                )
+                outcome = {
+                    "status": "ok",
+                    "response": response,
+                    "served_by": candidate.model_name,
+                }
+            except CircuitOpenError as e:
+                outcome = {"status": "error", "status_code": 503, "error": str(e)}
+            except Exception as e:
+                outcome = {
+                    "status": "error",
+                    "status_code": error_status(e),
+                    "error": str(e),
+                }
+            return job_key, outcome, sum(elapsed)
+
+        def lines(job_key, outcome: dict, latency: float):
+            for position, (index, item_id) in enumerate(jobs[job_key]["items"]):
+                line = {
+                    "index": index,
+                    "id": item_id,
+                    "model_name": jobs[job_key]["model_name"],
+                    **outcome,
+                    "latency_ms": round(latency * 1000, 1),
+                    "deduplicated": position > 0,
+                }
+                yield json.dumps(line) + "\n"
+
+        started = time.perf_counter()
+        # The tasks copy the deadline along with the rest of the context
+        with deadline_scope(deadline):
+            tasks = [asyncio.ensure_future(run(*job)) for job in jobs.items()]
+        pending = dict.fromkeys(jobs)
+        try:
+            for next_done in asyncio.as_completed(
+                tasks, timeout=max(0, deadline - time.monotonic())
+            ):
+                try:
+                    job_key, outcome, latency = await next_done
+                except TimeoutError:
+                    break
+                del pending[job_key]
+                for line in lines(job_key, outcome, latency):
+                    yield line
+            if pending:
+                metrics.incr("batch.deadline_exceeded", len(pending))
+                for task in tasks:
+                    task.cancel()
+            outcome = {
+                "status": "error",
+                "status_code": 504,
+                "error": str(DeadlineExceeded()),
+            }
+            for job_key in pending:
+                for line in lines(job_key, outcome, time.perf_counter() - started):
+                    yield line
+        finally:
+            # The client went away: stop what is still running
+            for task in tasks:
+                task.cancel()
+
+
+class CompletionJobListCreateView(BaseGenerateCompletionView):
+    permission_classes = [APIKeyPermission]
+
+    def post(self, request):
+        """
+        Queue a completion and answer at once with its job; the result is
+        polled at `status_url` or POSTed to the optional `callback_url`
+        """
+        validation_result, error_response = self.validate_request(request)
+        if error_response:
+            return error_response
+
+        messages, model_name, provider, api_key = validation_result
+        try:
+            timeout = parse_timeout(request.headers, model_timeout(model_name))
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        route, error_response = self.get_route(request, model_name, provider, api_key)
+        if error_response:
+            return error_response
+        callback_url = request.data.get("callback_url")
+        if callback_url is not None:
+            try:
+                check_callback_url(callback_url, get_job_pool().allowed_callback_hosts)
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+
+        def run():
+            # The job's timeout counts from when it starts, not from submission
+            with deadline_scope(time.monotonic() + timeout):
+                served_by, full_response = self.complete(messages, route)
+            return {"response": full_response, "served_by": served_by}
+
+        try:
+            job = get_job_pool().submit(request.user.id, run, callback_url)
+        except QueueFull as e:
+            response = JsonResponse({"error": str(e)}, status=503)
+            response["Retry-After"] = "1"
+            return response
+        status_url = request.build_absolute_uri(
+            reverse("provider:api-generate-completion-job", args=[job["job_id"]])
+        )
+        response = JsonResponse({**job, "status_url": status_url}, status=202)
+        response["Location"] = status_url
+        return response
+
+
+class CompletionJobDetailView(APIView):
+    permission_classes = [APIKeyPermission]
+
+    def get(self, request, job_id):
+        job = get_job_pool().get(str(job_id), request.user.id)
+        if job is None:
+            return JsonResponse({"error": "Job not found."}, status=404)
+        return JsonResponse(job)
 
 
 class ProviderAPIKeyListCreateView(APIView):
@@ -160,17 +978,12 @@ class ProviderAPIKeyListCreateView(APIView):
         """Create a new provider API key"""
         serializer = ProviderAPIKeyCreateSerializer(data=request.data)
         if serializer.is_valid():
-            # Check if user already has a key for this provider
-            if ProviderAPIKey.objects.filter(
-                user=request.user, provider=serializer.validated_data["provider"]
-            ).exists():
-                return Response(
-                    {"error": "You already have an API key for this provider"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+            # Several keys per provider are allowed; requests rotate between them
             serializer.save(user=request.user)
             # Invalidate cache
             cache.delete(f"provider_keys_{request.user.id}")
+            invalidate_active_providers(request.user.id)
+            invalidate_stored_keys(request.user.id, serializer.instance.provider)
             return Response(
                 ProviderAPIKeySerializer(serializer.instance).data,
                 status=status.HTTP_201_CREATED,
@@ -212,6 +1025,14 @@ class ProviderAPIKeyDetailView(APIView):
     @transaction.atomic
     def put(self, request, pk):
         """Update a provider API key"""
+        return self.update(request, pk, partial=False)
+
+    @transaction.atomic
+    def patch(self, request, pk):
+        """Update some fields (e.g. limits or weight) of a provider API key"""
+        return self.update(request, pk, partial=True)
+
+    def update(self, request, pk, partial: bool):
         provider = self.get_object(pk, request.user)
         if not provider:
             return Response(
@@ -220,7 +1041,7 @@ class ProviderAPIKeyDetailView(APIView):
             )
 
         serializer = ProviderAPIKeyUpdateSerializer(
-            provider, data=request.data, partial=False
+            provider, data=request.data, partial=partial
         )
         if serializer.is_valid():
             serializer.save()
@@ -231,6 +1052,7 @@ class ProviderAPIKeyDetailView(APIView):
                     f"provider_key_{pk}_{request.user.id}",
                 ]
             )
+            invalidate_stored_keys(request.user.id, provider.provider)
             return Response(ProviderAPIKeySerializer(provider).data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -249,9 +1071,41 @@ class ProviderAPIKeyDetailView(APIView):
         cache.delete_many(
             [f"provider_keys_{request.user.id}", f"provider_key_{pk}_{request.user.id}"]
         )
+        invalidate_active_providers(request.user.id)
+        invalidate_stored_keys(request.user.id, provider.provider)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class ProviderKeyUtilizationView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Per-key rotation state in the worker serving this request: requests
+        in flight, remaining RPM/TPM budget and any 429 cool-down
+        """
+        rotator = get_key_rotator()
+        keys = []
+        for provider_key in ProviderAPIKey.objects.filter(user=request.user).order_by(
+            "provider", "created_at"
+        ):
+            stored_key = StoredKey(
+                id=str(provider_key.id),
+                name=provider_key.name,
+                encrypted_key=provider_key.api_key,
+                rpm_limit=provider_key.rpm_limit,
+                tpm_limit=provider_key.tpm_limit,
+                weight=provider_key.weight,
+            )
+            keys.append(
+                {
+                    **ProviderAPIKeySerializer(provider_key).data,
+                    **rotator.utilization(stored_key),
+                }
+            )
+        return Response({"pid": os.getpid(), "policy": rotator.policy, "keys": keys})
+
+
 class AIModelListView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -265,6 +1119,13 @@ class AIModelListView(APIView):
         Query Parameters:
         - name: Filter models by name (case-insensitive partial match)
         - provider: Filter models by provider (case-insensitive exact match)
+        - mode: Filter models by mode (e.g. chat, embedding)
+        - min_context: Minimum `max_input_tokens`
+        - min_output_tokens: Minimum `max_output_tokens`
+        - max_input_cost_per_token: Maximum `input_cost_per_token`
+        - max_output_cost_per_token: Maximum `output_cost_per_token`
+        - capabilities: Comma separated `supports_*` flags (e.g. function_calling,vision)
+        - sort: Numeric field to sort by, prefix with '-' for descending
         - limit: Number of results to return (default: all)
         - offset: Number of results to skip (default: 0)
         """
@@ -273,64 +1134,156 @@ class AIModelListView(APIView):
         provider_filter = request.query_params.get("provider", "").lower()
         limit = request.query_params.get("limit")
         offset = int(request.query_params.get("offset", 0))
+        try:
+            column_filters = self.get_column_filters(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Fetch Active Providers
+        active_providers = get_active_providers(request.user.id)
 
         # Generate cache key based on filters
-        cache_key = f"ai_models_list_{request.user.id}_{name_filter}_{provider_filter}_{limit}_{offset}"
-        cached_data = cache.get(cache_key)
+        catalog = get_catalog()
+        column_key = "_".join(
+            f"{key}={value}" for key, value in sorted(column_filters.items())
+        )
+        query_key = f"{name_filter}_{provider_filter}_{column_key}_{limit}_{offset}"
 
-        if cached_data:
-            return Response(cached_data)
+        # Conditional request: the response only depends on the catalog
+        # version, the active providers and the query
+        etag = self.get_etag(catalog.version, active_providers, query_key)
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            # Weak comparison: proxies that compress the body weaken the ETag
+            etags = [tag.removeprefix("W/") for tag in parse_etags(if_none_match)]
+            if "*" in etags or etag in etags:
+                return self.with_cache_headers(
+                    Response(status=status.HTTP_304_NOT_MODIFIED), etag
+                )
 
-        # Fetch Active Providers
-        active_providers_list = (
-            ProviderAPIKey.objects.filter(user=request.user)
-            .values_list("provider", flat=True)
-            .distinct()
-        )
+        # The catalog page is shared by every user; only the `active` flag
+        # is per user and gets applied below
+        query_hash = hashlib.sha256(query_key.encode()).hexdigest()[:32]
+        cache_key = f"ai_models_page_{catalog.version[:12]}_{query_hash}"
+        page = cache.get(cache_key)
 
-        # Filter models based on query parameters
-        ai_models_list = get_model_list()
-        filtered_models = []
-        for name, model in ai_models_list.items():
-            if name != "sample_spec":
-                filtered_models.append(
-                    {
-                        **model,
-                        "model_name": name,
-                        "active": model["provider"]
-                        in active_providers_list,  # check if api keys are added for the provider by the user
-                    }
+        if page is None:
+            try:
+                page = self.get_page(
+                    catalog, name_filter, provider_filter, column_filters, limit, offset
                 )
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            # Cache the filtered results
+            cache.set(cache_key, page, timeout=3600)
 
-        if name_filter:
-            filtered_models = [
-                model for model in filtered_models if name_filter in model["model_name"]
-            ]
+        response_data = {
+            **page,
+            "models": [
+                {
+                    **model,
+                    "active": model["provider"]
+                    in active_providers,  # check if api keys are added for the provider by the user
+                }
+                for model in page["models"]
+            ],
+        }
+        return self.with_cache_headers(Response(response_data), etag)
 
-        if provider_filter:
-            filtered_models = [
-                model
-                for model in filtered_models
-                if provider_filter == model["provider"]
-            ]
+    def get_page(
+        self, catalog, name_filter, provider_filter, column_filters, limit, offset
+    ) -> dict:
+        """Filtered, paginated catalog page without any per-user data"""
+        # Filter models using the precomputed catalog index and columns
+        catalog_index = catalog.index
+        row_ids = catalog_index.filter(name=name_filter, provider=provider_filter)
+        if column_filters:
+            row_ids = catalog.columns.query(row_ids, **column_filters).tolist()
 
         # Apply pagination
-        total_count = len(filtered_models)
+        total_count = len(row_ids)
         if limit:
             limit = int(limit)
-            filtered_models = filtered_models[offset : offset + limit]
+            row_ids = row_ids[offset : offset + limit]
 
-        response_data = {
+        # Only the rows on the requested page are materialized
+        filtered_models = []
+        for row_id in row_ids:
+            name = catalog_index.names[row_id]
+            filtered_models.append({**catalog[name], "model_name": name})
+
+        return {
             "count": total_count,
             "models": filtered_models,
-            "available_providers": sorted(
-                list({model["provider"] for model in list(ai_models_list.values())[1:]})
-            ),
+            "available_providers": list(catalog_index.providers),
             "offset": offset,
             "limit": limit if limit else None,
         }
 
-        # Cache the filtered results
-        cache.set(cache_key, response_data, timeout=3600)
+    def get_etag(self, catalog_version: str, active_providers: set, query_key: str):
+        """Strong ETag for a model list response"""
+        digest = hashlib.sha256(
+            f"{catalog_version}|{','.join(sorted(active_providers))}|{query_key}".encode()
+        ).hexdigest()
+        return f'"{digest[:32]}"'
+
+    def with_cache_headers(self, response: Response, etag: str) -> Response:
+        response["ETag"] = etag
+        response["Cache-Control"] = (
+            f"private, max-age={settings.MODEL_LIST_CACHE_MAX_AGE}, must-revalidate"
+        )
+        patch_vary_headers(response, ("Authorization",))
+        return response
+
+    def get_column_filters(self, query_params) -> dict:
+        """Parse numeric/capability filters for `CatalogColumns.query`"""
+        column_filters = {}
+        for param, key, cast in (
+            ("min_context", "min_input_tokens", int),
+            ("min_output_tokens", "min_output_tokens", int),
+            ("max_input_cost_per_token", "max_input_cost_per_token", float),
+            ("max_output_cost_per_token", "max_output_cost_per_token", float),
+        ):
+            value = query_params.get(param)
+            if value:
+                try:
+                    column_filters[key] = cast(value)
+                except ValueError:
+                    raise ValueError(f"'{param}' must be a number")
+
+        capabilities = query_params.get("capabilities")
+        if capabilities:
+            column_filters["capabilities"] = tuple(
+                sorted(filter(None, capabilities.lower().split(",")))
+            )
+        if query_params.get("mode"):
+            column_filters["mode"] = query_params["mode"].lower()
+        if query_params.get("sort"):
+            column_filters["sort"] = query_params["sort"]
+        return column_filters
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Gateway metrics of the worker serving this request"""
+        return Response({"pid": os.getpid(), **metrics.snapshot()})
 
-        return Response(response_data)
+
+class ProviderHealthView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Circuit breaker state per (provider, model) known to the worker
+        serving this request (openings are shared across workers), and its
+        routing latency/error averages
+        """
+        return Response(
+            {
+                "pid": os.getpid(),
+                "breakers": get_breakers().statuses(),
+                "routing": get_latency_tracker().snapshot(),
+            }
+        )